@@ -1,3 +1,9 @@
-from .oxidation_process import tiO2_nanotubes_anodic_oxidation
-
 __all__ = ['tiO2_nanotubes_anodic_oxidation']
+
+
+def __getattr__(name):
+    # Imported on first use, so importing anodic_oxidation.recipe does not pull in numpy
+    if name == 'tiO2_nanotubes_anodic_oxidation':
+        from .oxidation_process import tiO2_nanotubes_anodic_oxidation
+        return tiO2_nanotubes_anodic_oxidation
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
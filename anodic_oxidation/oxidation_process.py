@@ -1,20 +1,52 @@
+import os
 import time
 import logging
-from tqdm import tqdm
-from ..util.power_operations import run_power_supply_operation
-from ..util.power_supply_tool import PowerSupply
+from util.power_operations import AcquisitionSession, create_sample_writer
+from util.power_supply_tool import PowerSupply
 
-def tiO2_nanotubes_anodic_oxidation(power: PowerSupply, file_path: str, time_per_iteration: int):
+
+def prompt_stages():
+    """
+    Ask for the stages on the console, one at a time.
+
+    Yields:
+        tuple: (duration in seconds, final voltage in volts or None to hold the voltage)
+    """
+    num_stages = int(input("Enter the number of stages: "))
+    for stage in range(1, num_stages + 1):
+        set_time_input = input("Enter the duration of Stage %d (seconds): " % stage)
+        final_v_input = input("Enter the final voltage of Stage %d (V): " % stage)
+        set_time = int(set_time_input) if set_time_input.strip() != "" else 500
+        # If final_v is not provided, default to constant voltage
+        final_v = float(final_v_input) if final_v_input.strip() != "" else None
+        yield set_time, final_v
+
+
+def tiO2_nanotubes_anodic_oxidation(power: PowerSupply, file_path: str, time_per_iteration: int,
+                                    sample_rate: float = None, full_rate: str = AcquisitionSession.FULL_RATE_ALL,
+                                    stages=None, file_format: str = None, progress: bool = True, metrics=None):
     """
     Perform anodic oxidation process for TiO2 nanotubes.
 
     Args:
         power (PowerSupply): Power supply object.
-        file_path (str): Local file path for storing data.
-        time_per_iteration (int): Duration of each iteration.
+        file_path (str): Local file path for storing data, a .bin file is written in the binary telemetry format.
+        time_per_iteration (int): Interval in seconds between progress bar refreshes.
+        sample_rate (float, optional): Target sampling rate in Hz. If None, sample as fast as the bus
+            allows. Defaults to None.
+        full_rate (str, optional): 'all' to record every sample, 'events' to record samples only around
+            current transients. 1 s / 10 s / 1 min rollups are always written to <file>_rollup.csv.
+            Defaults to 'all'.
+        stages (iterable, optional): (duration in seconds, final voltage or None) per stage. If None, the
+            stages are asked for on the console. Defaults to None.
+        file_format (str, optional): 'csv' or 'binary', by default chosen from the file extension.
+            Defaults to None.
+        progress (bool, optional): Show a progress bar per stage. Defaults to True.
+        metrics (BusMetrics, optional): Metrics reporting the rate and overruns of the sampling loop.
+            Defaults to None.
 
     Returns:
-        None
+        bool: True if every stage completed.
     """
     # Set initial voltage of the power supply to zero
     power.set_voltage(0)
@@ -22,36 +54,70 @@ def tiO2_nanotubes_anodic_oxidation(power: PowerSupply, file_path: str, time_per
     # Logger
     logger = logging.getLogger(__name__)
 
+    # One writer thread and one acquisition session for the whole run
+    writer = create_sample_writer(file_path, file_format)
+    rollup_path = os.path.splitext(file_path)[0] + "_rollup.csv"
+    session = AcquisitionSession(power, writer=writer, sample_rate=sample_rate, rollup_path=rollup_path,
+                                 full_rate=full_rate, metrics=metrics)
+    if progress:
+        # Imported only when a progress bar is shown, unattended runs start faster without it
+        from tqdm import tqdm
+
+    completed = False
     try:
-        # Get user input settings
-        num_stages = int(input("Enter the number of stages: "))
-        # Loop through each stage
-        for stage in range(1, num_stages + 1):
+        # Loop through each stage, asking for it on the console if no stages were given
+        for stage, (set_time, final_v) in enumerate(prompt_stages() if stages is None else stages, 1):
             logger.info("Starting Stage %d...", stage)
-            # Get user input settings
-            set_time_input = input("Enter the duration of Stage %d (seconds): " % stage)
-            final_v_input = input("Enter the final voltage of Stage %d (V): " % stage)
-            set_time = int(set_time_input) if set_time_input.strip() != "" else 500
-            # If final_v is not provided, default to constant voltage
-            final_v = float(final_v_input) if final_v_input.strip() != "" else None
             # Start timer
             start_time = time.perf_counter()
-            # Run current stage with progress bar
-            total_iterations = int(set_time / time_per_iteration)
-            for _ in tqdm(range(total_iterations), desc="Stage %d" % stage):
-                run_power_supply_operation(set_time=time_per_iteration, final_v=final_v, file_path=file_path, power=power)
+            if progress:
+                # Run current stage with progress bar driven by the sample stream
+                with tqdm(total=set_time, desc="Stage %d" % stage, unit="s", mininterval=time_per_iteration) as bar:
+                    def update(elapsed):
+                        bar.update(int(elapsed) - bar.n)
+
+                    last_sample = session.run_stage(set_time, final_v, stage=stage, progress=update)
+            else:
+                last_sample = session.run_stage(set_time, final_v, stage=stage)
             logger.info("Stage %d completed...", stage)
-            # Log end time and current voltage, current, and power
+            # Log end time and the last voltage, current, and power seen by the loop
             end_time = time.perf_counter()
             logger.info("Total program runtime: %s seconds", end_time - start_time)
-            logger.info("Current displayed voltage: %s", power.get_voltage())
-            logger.info("Current displayed current: %s", power.get_current())
-            logger.info("Current displayed power: %s", power.get_power())
+            if last_sample is not None:
+                logger.info("Current displayed voltage: %s", last_sample.voltage)
+                logger.info("Current displayed current: %s", last_sample.current)
+                logger.info("Current displayed power: %s", last_sample.power)
+            # Log the integrated quantities of the stage
+            totals = session.stage_totals[stage]
+            if totals.samples:
+                logger.info("Stage %d voltage: min %s V, mean %.4g V, max %s V", stage,
+                            totals.voltage.min, totals.voltage.mean, totals.voltage.max)
+                logger.info("Stage %d current: min %s A, mean %.4g A, max %s A", stage,
+                            totals.current.min, totals.current.mean, totals.current.max)
+                logger.info("Stage %d charge: %.4g C (%.4g mAh), energy: %.4g J (%.4g Wh)", stage,
+                            totals.charge, totals.charge / 3.6, totals.energy, totals.energy / 3600)
+            logger.info("Current transients so far: %d", session.aggregator.detector.count)
+        completed = True
     except Exception as e:
         logger.error("An error occurred during execution:", exc_info=True)
-
-    # Disconnect serial communication
-    logger.info("Disconnecting serial communication...")
-    power.set_operative_mode(0)
-    # Reset voltage to zero
-    power.set_voltage(0)
+    finally:
+        try:
+            # Switch the output off first, so neither a slow disk nor a failing writer can keep it on
+            logger.info("Disconnecting serial communication...")
+            try:
+                power.set_operative_mode(0)
+            finally:
+                # Reset voltage to zero
+                power.set_voltage(0)
+        finally:
+            # Also on Ctrl-C: the writer threads are daemons, so buffered samples are lost unless drained here
+            logger.info("Register cache: %s", power.get_cache_stats())
+            logger.info("Write verification: %s", power.get_verify_stats())
+            try:
+                session.close()
+            finally:
+                writer.close()
+            stats = writer.stats()
+            logger.info("Telemetry written: %d samples, dropped: %d, peak queue depth: %d",
+                        stats["written"], stats["dropped"], stats["max_depth"])
+    return completed
@@ -0,0 +1,164 @@
+import json
+import logging
+from util.ports import PORT_CACHE, resolve_port
+
+# Recipe keys and their defaults, None for optional keys without a default
+RECIPE_DEFAULTS = {
+    "port": None,               # Port keyword, device path or URL, or {"vid", "pid", "serial_number"}
+    "baud_rate": 9600,
+    "addr": 1,
+    "verify": "always",         # Write verification policy: always, never, sampled or deferred
+    "retries": 0,               # Extra attempts after a timeout or CRC error
+    "output": None,             # Data file path, a .bin file is written in the binary telemetry format
+    "format": None,             # 'csv' or 'binary', by default chosen from the output extension
+    "full_rate": "all",         # 'all' or 'events'
+    "sample_rate": None,        # Hz, None for as fast as the bus allows
+    "stages": None,             # [{"duration": seconds, "final_v": volts or omitted to hold}]
+    "output_on": True,          # Switch the output on before the first stage
+    "progress": False,          # Show progress bars
+    "progress_interval": 1,     # Seconds between progress bar refreshes
+    "metrics_interval": None,   # Seconds between metrics log lines, None for no metrics
+    "metrics_port": None,       # Local port of the Prometheus endpoint, None for no endpoint
+    "port_cache": PORT_CACHE,   # Port cache file for USB ports, None to always enumerate
+}
+
+# Keys of a stage entry
+STAGE_KEYS = {"duration", "final_v"}
+
+# Allowed values of the recipe keys with a fixed set of choices
+RECIPE_CHOICES = {
+    "verify": ("always", "never", "sampled", "deferred"),
+    "format": (None, "csv", "binary"),
+    "full_rate": ("all", "events"),
+    "baud_rate": (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200),
+}
+
+
+def load_recipe(path: str):
+    """
+    Load and check a recipe file.
+
+    Args:
+        path (str): JSON recipe file path.
+
+    Returns:
+        dict: Recipe with defaults filled in; stages as a list of (duration, final voltage or None).
+    """
+    with open(path) as f:
+        recipe = json.load(f)
+    if not isinstance(recipe, dict):
+        raise ValueError(f"{path}: a recipe must be a JSON object")
+    unknown = set(recipe) - set(RECIPE_DEFAULTS)
+    if unknown:
+        raise ValueError(f"{path}: unknown recipe keys {sorted(unknown)}")
+    recipe = {**RECIPE_DEFAULTS, **recipe}
+
+    if not recipe["port"]:
+        raise ValueError(f"{path}: 'port' is required")
+    if isinstance(recipe["port"], dict) and not {"vid", "pid"} <= set(recipe["port"]):
+        raise ValueError(f"{path}: a USB port needs 'vid' and 'pid'")
+    if not recipe["output"]:
+        raise ValueError(f"{path}: 'output' is required")
+    if not recipe["stages"]:
+        raise ValueError(f"{path}: at least one stage is required")
+    for key, choices in RECIPE_CHOICES.items():
+        if isinstance(recipe[key], bool) or recipe[key] not in choices:
+            raise ValueError(f"{path}: '{key}' must be one of {list(choices)}, got {recipe[key]!r}")
+    sample_rate = recipe["sample_rate"]
+    if sample_rate is not None and (isinstance(sample_rate, bool) or not isinstance(sample_rate, (int, float))
+                                    or sample_rate <= 0):
+        raise ValueError(f"{path}: 'sample_rate' must be a positive number in Hz or null")
+    addr = recipe["addr"]
+    if isinstance(addr, bool) or not isinstance(addr, int) or not 1 <= addr <= 247:
+        raise ValueError(f"{path}: 'addr' must be a slave address from 1 to 247")
+    retries = recipe["retries"]
+    if isinstance(retries, bool) or not isinstance(retries, int) or retries < 0:
+        raise ValueError(f"{path}: 'retries' must be a non-negative integer")
+
+    if not isinstance(recipe["stages"], list):
+        raise ValueError(f"{path}: 'stages' must be a list")
+    stages = []
+    for number, stage in enumerate(recipe["stages"], 1):
+        if not isinstance(stage, dict):
+            raise ValueError(f"{path}: stage {number} must be an object with 'duration' and 'final_v'")
+        unknown = set(stage) - STAGE_KEYS
+        if unknown:
+            raise ValueError(f"{path}: stage {number} has unknown keys {sorted(unknown)}")
+        duration, final_v = stage.get("duration"), stage.get("final_v")
+        if not isinstance(duration, (int, float)) or duration <= 0:
+            raise ValueError(f"{path}: stage {number} needs a positive 'duration' in seconds")
+        if final_v is not None and not isinstance(final_v, (int, float)):
+            raise ValueError(f"{path}: stage {number} 'final_v' must be a number")
+        stages.append((duration, final_v))
+    recipe["stages"] = stages
+    return recipe
+
+
+def open_port(recipe: dict):
+    """
+    Open the USB serial port of a recipe, using the port cache so the ports are only enumerated when the
+    adapter was not seen before or its cached path no longer opens.
+
+    Args:
+        recipe (dict): Recipe from load_recipe with a {"vid", "pid", "serial_number"} port.
+
+    Returns:
+        serial.Serial: Open serial port.
+    """
+    import serial
+    port = recipe["port"]
+    args = (port["vid"], port["pid"], port.get("serial_number"), recipe["port_cache"])
+    device = resolve_port(*args)
+    try:
+        return serial.Serial(device, recipe["baud_rate"], timeout=1)
+    except serial.SerialException:
+        logging.info(f"Cached port {device} did not open, searching the serial ports again")
+        return serial.Serial(resolve_port(*args, refresh=True), recipe["baud_rate"], timeout=1)
+
+
+def run_recipe(recipe: dict):
+    """
+    Connect to the power supply of a recipe and run its stages unattended.
+
+    Args:
+        recipe (dict): Recipe from load_recipe.
+
+    Returns:
+        bool: True if every stage completed.
+    """
+    # Imported here so that loading and checking recipes does not pull in serial, modbus_tk and numpy
+    from util.power_supply_tool import PowerSupplyTool
+    from .oxidation_process import tiO2_nanotubes_anodic_oxidation
+
+    metrics = reporter = server = None
+    if recipe["metrics_interval"] or recipe["metrics_port"] is not None:
+        from util.metrics import BusMetrics, MetricsReporter, MetricsServer
+        metrics = BusMetrics()
+        if recipe["metrics_interval"]:
+            reporter = MetricsReporter(metrics, recipe["metrics_interval"]).start()
+        if recipe["metrics_port"] is not None:
+            server = MetricsServer(metrics, recipe["metrics_port"]).start()
+
+    port = recipe["port"]
+    serial_obj = power = None
+    try:
+        serial_obj = open_port(recipe) if isinstance(port, dict) else None
+        power = PowerSupplyTool(keyword="" if serial_obj else port, baud_rate=recipe["baud_rate"],
+                                addr=recipe["addr"], verify=recipe["verify"], metrics=metrics,
+                                serial_obj=serial_obj, interactive=False, retries=recipe["retries"])
+        if recipe["output_on"]:
+            power.set_operative_mode(1)
+        return tiO2_nanotubes_anodic_oxidation(power, recipe["output"], recipe["progress_interval"],
+                                               sample_rate=recipe["sample_rate"], full_rate=recipe["full_rate"],
+                                               stages=recipe["stages"], file_format=recipe["format"],
+                                               progress=recipe["progress"], metrics=metrics)
+    finally:
+        # Release the port for the next recipe of a batch
+        if power is not None:
+            power.serial_obj.close()
+        elif serial_obj is not None:
+            serial_obj.close()
+        if reporter is not None:
+            reporter.stop()
+        if server is not None:
+            server.stop()
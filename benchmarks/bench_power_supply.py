@@ -0,0 +1,270 @@
+"""
+Benchmarks for the Modbus hot paths, run against util.simulator.
+
+    python -m benchmarks.bench_power_supply -o results.json
+    python -m benchmarks.bench_power_supply --compare baseline.json results.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import datetime
+import tempfile
+import statistics
+
+from util.power_supply_tool import PowerSupply
+from util.power_operations import AcquisitionSession, create_sample_writer
+from util.simulator import SimulatedPowerSupply, SimulatedBus, LoopbackSerial
+from util.metrics import BusMetrics
+
+STANDARD_BAUD_RATES = [1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200]
+
+
+def metric(value, unit: str, better: str):
+    """
+    Build a result entry
+    :param value: Measured value
+    :param unit: Unit of the value
+    :param better: 'higher' or 'lower', used by the comparison mode
+    :return: Result dict
+    """
+    return {"value": value, "unit": unit, "better": better}
+
+
+def make_power_supply(baud_rate: int, latency: float, verify: str = PowerSupply.VERIFY_ALWAYS, metrics=None,
+                      **device_args):
+    """
+    Connect a PowerSupply to a fresh simulated device
+    :param baud_rate: Baud rate used for line timing
+    :param latency: Device latency per frame, unit: second
+    :param verify: Write verification policy
+    :param metrics: BusMetrics instrumenting the PowerSupply
+    :return: (PowerSupply, SimulatedPowerSupply)
+    """
+    device = SimulatedPowerSupply(**device_args)
+    bus = SimulatedBus(device, baud_rate=baud_rate, latency=latency)
+    return PowerSupply(LoopbackSerial(bus), device.addr, verify, metrics=metrics), device
+
+
+def rate(func, duration: float):
+    """
+    Call func repeatedly for a duration
+    :return: Calls per second
+    """
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def bench_transactions(baud_rates, latency: float, duration: float):
+    """
+    Transactions per second of PowerSupply.read (one live register) and PowerSupply.write (with and
+    without verification) at each baud rate
+    """
+    results = {}
+    for baud_rate in baud_rates:
+        power, _ = make_power_supply(baud_rate, latency)
+        results[f"read_tps@{baud_rate}"] = metric(rate(lambda: power.read(0x0010), duration), "tx/s", "higher")
+        results[f"snapshot_tps@{baud_rate}"] = metric(rate(power.snapshot, duration), "tx/s", "higher")
+        results[f"write_verified_tps@{baud_rate}"] = metric(
+            rate(lambda: power.write(0x0030, 100), duration), "writes/s", "higher")
+        power.verify = PowerSupply.VERIFY_NEVER
+        results[f"write_unverified_tps@{baud_rate}"] = metric(
+            rate(lambda: power.write(0x0030, 100), duration), "writes/s", "higher")
+    return results
+
+
+def bench_instrumentation(count: int):
+    """
+    Per-transaction overhead of BusMetrics instrumentation, measured without line timing or device latency
+    so the wrapper cost is not hidden by the bus
+    """
+    results = {}
+    for name, metrics in (("plain", None), ("instrumented", BusMetrics())):
+        power, _ = make_power_supply(None, 0.0, metrics=metrics)
+        start = time.perf_counter()
+        for _ in range(count):
+            power.read(0x0010)
+        results[f"read_{name}_us"] = metric((time.perf_counter() - start) / count * 1e6, "us", "lower")
+    return results
+
+
+def bench_acquisition(baud_rate: int, latency: float, duration: float, sample_rate: float = None):
+    """
+    Achieved sample rate of the acquisition loop, and ramp tracking error against the ideal linear profile
+    """
+    power, _ = make_power_supply(baud_rate, latency, slew_rate=50.0)
+    samples = []
+
+    class Recorder:
+        # Records the samples seen by the loop without changing its bus traffic
+        V_dot = power.V_dot
+        set_target_voltage = staticmethod(power.set_target_voltage)
+        flush_verify = staticmethod(power.flush_verify)
+
+        @staticmethod
+        def snapshot(protection=False):
+            sample = power.snapshot(protection)
+            samples.append(sample)
+            return sample
+
+    final_v = 5.0
+    with tempfile.TemporaryDirectory() as tmp:
+        with AcquisitionSession(Recorder, os.path.join(tmp, "data.csv"), sample_rate=sample_rate) as session:
+            session.run_stage(duration, final_v)
+            stats = session.stage_stats[session.stage]
+
+    # The first snapshot reads the initial voltage, the rest are loop samples
+    start_ns, init_v = samples[0].timestamp_ns, samples[0].voltage
+    speed = (final_v - init_v) / duration
+    errors = [abs(s.voltage - (init_v + (s.timestamp_ns - start_ns) / 1e9 * speed)) for s in samples[1:]]
+    suffix = f"@{baud_rate}" + (f"/{sample_rate:g}Hz" if sample_rate else "")
+    results = {
+        f"loop_samples_per_s{suffix}": metric(stats["achieved_rate"], "samples/s", "higher"),
+        f"loop_missed_deadlines{suffix}": metric(stats["missed"], "count", "lower"),
+        f"ramp_error_mean{suffix}": metric(statistics.fmean(errors), "V", "lower"),
+        f"ramp_error_max{suffix}": metric(max(errors), "V", "lower"),
+        f"ramp_setpoint_writes{suffix}": metric(power.write_count, "writes", "lower"),
+    }
+    if stats["jitter_p95_ms"] is not None:
+        results[f"loop_jitter_p95{suffix}"] = metric(stats["jitter_p95_ms"], "ms", "lower")
+    return results
+
+
+def bench_settle(baud_rate: int, latency: float, repeats: int):
+    """
+    Setpoint-to-readback latency of PowerSupply.settle for 1 V steps, and the bus reads spent waiting
+    """
+    power, _ = make_power_supply(baud_rate, latency, slew_rate=100.0)
+    results = [power.settle(1.0 + i % 2, error_range=0.05, timeout=5) for i in range(repeats)]
+    times = [result.settle_time for result in results if result.settled]
+    return {
+        f"set_volt_latency_mean@{baud_rate}": metric(statistics.fmean(times) if times else None, "s", "lower"),
+        f"set_volt_latency_max@{baud_rate}": metric(max(times) if times else None, "s", "lower"),
+        f"set_volt_timeouts@{baud_rate}": metric(repeats - len(times), "count", "lower"),
+        f"set_volt_reads_mean@{baud_rate}": metric(statistics.fmean(r.reads for r in results), "reads", "lower"),
+    }
+
+
+def bench_logging(count: int):
+    """
+    Per-sample cost on the sampling thread of the telemetry writer, and of the former open/append per sample
+    """
+    record = (time.monotonic_ns(), 12.34, 0.567, 6.99, 0, 1)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_format in ("csv", "binary"):
+            path = os.path.join(tmp, "writer." + file_format)
+            writer = create_sample_writer(path, file_format, max_queue=count + 1)
+            start = time.perf_counter()
+            for _ in range(count):
+                writer.write(record)
+            results[f"log_{file_format}_writer_us_per_sample"] = metric(
+                (time.perf_counter() - start) / count * 1e6, "us", "lower")
+            # Total cost including the writer thread's encoding and file I/O
+            writer.close()
+            results[f"log_{file_format}_total_us_per_sample"] = metric(
+                (time.perf_counter() - start) / count * 1e6, "us", "lower")
+            results[f"log_{file_format}_bytes_per_sample"] = metric(os.path.getsize(path) / count, "bytes", "lower")
+
+        path = os.path.join(tmp, "append.csv")
+        start = time.perf_counter()
+        for _ in range(count):
+            with open(path, 'a') as f:
+                f.write(",".join(map(str, record)) + "\n")
+        results["log_open_append_us_per_sample"] = metric((time.perf_counter() - start) / count * 1e6, "us", "lower")
+    return results
+
+
+def run(args):
+    """
+    Run all benchmarks
+    :return: Result document
+    """
+    results = {}
+    results.update(bench_transactions(args.baud_rates, args.latency, args.duration))
+    for baud_rate in args.baud_rates:
+        if baud_rate >= 9600:
+            results.update(bench_acquisition(baud_rate, args.latency, args.loop_duration))
+            results.update(bench_acquisition(baud_rate, args.latency, args.loop_duration, args.sample_rate))
+    results.update(bench_settle(args.settle_baud, args.latency, args.settle_repeats))
+    results.update(bench_logging(args.log_samples))
+    results.update(bench_instrumentation(args.log_samples))
+    return {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float):
+    """
+    Compare two result documents
+    :param baseline: Earlier results
+    :param current: New results
+    :param threshold: Relative change counted as a regression, e.g. 0.1 for 10 %
+    :return: List of (name, baseline value, current value, relative change, regressed)
+    """
+    rows = []
+    for name, entry in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None or old["value"] is None or entry["value"] is None:
+            continue
+        if old["value"] == 0:
+            change = 0.0 if entry["value"] == 0 else float("inf")
+        else:
+            change = (entry["value"] - old["value"]) / abs(old["value"])
+        worse = -change if entry["better"] == "higher" else change
+        rows.append((name, old["value"], entry["value"], change, worse > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Power supply Modbus benchmarks against the simulator")
+    parser.add_argument("-o", "--output", help="write results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative regression threshold")
+    parser.add_argument("--baud-rates", type=int, nargs="+", default=STANDARD_BAUD_RATES)
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated device latency per frame, s")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per transaction benchmark")
+    parser.add_argument("--loop-duration", type=float, default=3, help="seconds per acquisition loop benchmark")
+    parser.add_argument("--sample-rate", type=float, default=10.0, help="scheduled rate of the loop benchmark, Hz")
+    parser.add_argument("--settle-baud", type=int, default=9600)
+    parser.add_argument("--settle-repeats", type=int, default=10)
+    parser.add_argument("--log-samples", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        for name, old, new, change, regressed in rows:
+            print(f"{'REGRESSION' if regressed else 'ok':<10} {name:<45} {old:>12.4g} -> {new:>12.4g} ({change:+.1%})")
+        return 1 if any(row[4] for row in rows) else 0
+
+    logging.getLogger().setLevel(logging.WARNING)
+    document = run(args)
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,13 @@
-from util.power_supply_tool import PowerSupplyTool
-from anodic_oxidation.oxidation_process import tiO2_nanotubes_anodic_oxidation
+import sys
+import logging
+import argparse
+from anodic_oxidation.recipe import load_recipe, run_recipe
+
+
+def interactive():
+    from util.power_supply_tool import PowerSupplyTool
+    from anodic_oxidation.oxidation_process import tiO2_nanotubes_anodic_oxidation
 
-def main():
     # Get user input for serial keyword, baud rate, and device address
     keyword = input("Enter the serial keyword: ")
     baud_rate = int(input("Enter the baud rate: "))
@@ -13,10 +19,40 @@ def main():
     # Get user input for file path and time per iteration
     file_path = input("Enter the local file path for storing data: ")
     time_per_iteration = int(input("Enter the time per iteration (in seconds): "))
+    sample_rate_input = input("Enter the sample rate (in Hz, empty for as fast as possible): ")
+    sample_rate = float(sample_rate_input) if sample_rate_input.strip() != "" else None
 
     # Call the tiO2_nanotubes_anodic_oxidation function
-    tiO2_nanotubes_anodic_oxidation(power=power_supply, file_path=file_path, time_per_iteration=time_per_iteration)
+    tiO2_nanotubes_anodic_oxidation(power=power_supply, file_path=file_path, time_per_iteration=time_per_iteration,
+                                    sample_rate=sample_rate)
 
-if __name__ == "__main__":
-    main()
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TiO2 nanotube anodic oxidation with a Modbus power supply")
+    parser.add_argument("recipes", nargs="*", metavar="RECIPE",
+                        help="JSON recipe files run one after another; without recipes the run is set up "
+                             "interactively")
+    args = parser.parse_args(argv)
+
+    if not args.recipes:
+        interactive()
+        return 0
+
+    # Check every recipe before the first run starts, so a queued batch does not stop halfway on a typo
+    recipes = [load_recipe(path) for path in args.recipes]
+    failed = 0
+    for path, recipe in zip(args.recipes, recipes):
+        logging.info(f"Running recipe {path}")
+        try:
+            completed = run_recipe(recipe)
+        except Exception:
+            logging.error(f"Recipe {path} could not be run", exc_info=True)
+            completed = False
+        if not completed:
+            logging.error(f"Recipe {path} did not complete")
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import pytest
+from util.simulator import SimulatedPowerSupply, SimulatedBus, LoopbackSerial
+from util.power_supply_tool import PowerSupply
+
+
+@pytest.fixture
+def simulated():
+    """
+    Factory connecting a PowerSupply to a fresh simulated device without line delays
+    :return: Callable (verify='always', **PowerSupply arguments) -> (PowerSupply, SimulatedPowerSupply, SimulatedBus)
+    """
+    def connect(verify=PowerSupply.VERIFY_ALWAYS, device_args=None, **power_args):
+        device = SimulatedPowerSupply(**{"slew_rate": 1e6, **(device_args or {})})
+        bus = SimulatedBus(device, baud_rate=None, latency=0.0)
+        power = PowerSupply(LoopbackSerial(bus), device.addr, verify, **power_args)
+        return power, device, bus
+
+    return connect
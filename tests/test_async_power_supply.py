@@ -0,0 +1,71 @@
+import time
+import asyncio
+import pytest
+from modbus_tk.exceptions import ModbusInvalidResponseError
+from util.simulator import SimulatedPowerSupply, SimulatedBus, LoopbackSerial
+from util.async_power_supply import AsyncSerialTransport, AsyncRtuMaster, AsyncPowerSupply
+
+
+def connect(*devices, verify=AsyncPowerSupply.VERIFY_ALWAYS, **bus_args):
+    # One AsyncRtuMaster over an in-process simulated line
+    bus = SimulatedBus(*devices, **{"baud_rate": None, "latency": 0.0, **bus_args})
+    return AsyncRtuMaster(AsyncSerialTransport(LoopbackSerial(bus)), 9600), bus
+
+
+def test_register_getters_and_setters():
+    async def main():
+        device = SimulatedPowerSupply(slew_rate=1e6, load_ohms=10.0)
+        master, bus = connect(device)
+        power = await AsyncPowerSupply.create(master, device.addr)
+        await power.V(5.0)
+        await power.A(1.0)
+        await power.OVP(20.0)
+        await power.OCP(2.0)
+        await power.OPP(30.0)
+        assert await power.V() == 5.0
+        assert await power.V(timeout=0.5) == 5.0
+        assert await power.A() == 0.5
+        assert await power.W() == 2.5
+        assert (await power.OVP(), await power.OCP(), await power.OPP()) == (20.0, 2.0, 30.0)
+        assert await power.operative_mode() == 1
+        assert await power.read_protection_state() == 0
+        assert power.verify_stats()["mismatches"] == 0
+
+    asyncio.run(main())
+
+
+def test_settle_reaches_the_target():
+    async def main():
+        device = SimulatedPowerSupply(slew_rate=100.0)
+        master, bus = connect(device)
+        power = await AsyncPowerSupply.create(master, device.addr)
+        result = await power.settle(2.0, error_range=0.05, timeout=2.0)
+        assert result.settled
+        assert await power.set_volt(1.0, timeout=2.0) is not None
+
+    asyncio.run(main())
+
+
+def test_devices_share_one_line():
+    async def main():
+        devices = [SimulatedPowerSupply(addr=addr, slew_rate=1e6) for addr in (1, 2)]
+        master, bus = connect(*devices)
+        powers = [await AsyncPowerSupply.create(master, device.addr) for device in devices]
+        await asyncio.gather(powers[0].V(1.0), powers[1].V(2.0))
+        samples = await asyncio.gather(*[power.snapshot() for power in powers])
+        assert [sample.voltage for sample in samples] == [1.0, 2.0]
+
+    asyncio.run(main())
+
+
+def test_per_request_timeout():
+    async def main():
+        master, bus = connect(SimulatedPowerSupply())
+        # No device answers at address 9
+        power = AsyncPowerSupply(master, 9)
+        start = time.monotonic()
+        with pytest.raises(ModbusInvalidResponseError):
+            await power.V(timeout=0.1)
+        assert time.monotonic() - start < 0.5
+
+    asyncio.run(main())
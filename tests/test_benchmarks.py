@@ -0,0 +1,14 @@
+import json
+from benchmarks.bench_power_supply import main
+
+
+def test_benchmarks_run_with_tiny_durations(tmp_path):
+    output = tmp_path / "results.json"
+    assert main(["-o", str(output), "--baud-rates", "115200", "--latency", "0", "--duration", "0.05",
+                 "--loop-duration", "0.2", "--sample-rate", "20", "--settle-baud", "115200",
+                 "--settle-repeats", "1", "--log-samples", "100"]) == 0
+    results = json.loads(output.read_text())["results"]
+    assert results["loop_samples_per_s@115200/20Hz"]["value"] > 0
+    assert results["set_volt_timeouts@115200"]["value"] == 0
+
+    assert main(["--compare", str(output), str(output)]) == 0
@@ -0,0 +1,53 @@
+import os
+import pytest
+from util.binary_log import BinaryTelemetryWriter, BinaryTelemetryReader
+
+# 60 records 0.1 s apart: stage 1 for 2.5 s, stage 2 for 2.5 s, stage 3 for 1 s
+STAGES = [1] * 25 + [2] * 25 + [3] * 10
+
+
+@pytest.fixture(params=[True, False], ids=["indexed", "unindexed"])
+def reader(request, tmp_path):
+    path = str(tmp_path / "run.bin")
+    writer = BinaryTelemetryWriter(path, index_interval=10)
+    for number, stage in enumerate(STAGES):
+        writer.write((writer.start_ns + number * 100_000_000, 1.0 + number, 0.5, 0.5 + number / 2, 0, stage))
+    writer.close()
+    if not request.param:
+        os.remove(path + ".idx")
+    return BinaryTelemetryReader(path)
+
+
+def test_records_round_trip(reader):
+    assert len(reader) == len(STAGES)
+    assert reader.records['voltage'][3] == 4.0
+    assert reader.records['stage'].tolist() == STAGES
+    assert reader.elapsed(reader.records[:2]).tolist() == [0.0, 0.1]
+
+
+def test_time_window(reader):
+    assert reader.elapsed(reader.time_window(1.0, 2.0)).tolist() == pytest.approx([1.0 + i / 10 for i in range(10)])
+    assert len(reader.time_window(None, 0.55)) == 6
+    assert len(reader.time_window(5.85)) == 1
+    assert len(reader.time_window(7.0)) == 0
+    assert len(reader.time_window()) == len(STAGES)
+
+
+def test_stage(reader):
+    stage = reader.stage(2)
+    assert len(stage) == 25
+    assert set(stage['stage'].tolist()) == {2}
+    assert reader.elapsed(stage[:1]).tolist() == pytest.approx([2.5])
+    assert len(reader.stage(3)) == 10
+    assert len(reader.stage(4)) == 0
+
+
+def test_index_marks_intervals_and_stage_changes(tmp_path):
+    path = str(tmp_path / "run.bin")
+    writer = BinaryTelemetryWriter(path, index_interval=10)
+    for number, stage in enumerate(STAGES):
+        writer.write((writer.start_ns + number * 100_000_000, 0.0, 0.0, 0.0, None, stage))
+    writer.close()
+    index = BinaryTelemetryReader(path).index
+    assert index['record'].tolist() == [0, 10, 20, 25, 30, 40, 50]
+    assert index['stage'].tolist() == [1, 1, 1, 2, 2, 2, 3]
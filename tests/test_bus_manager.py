@@ -0,0 +1,115 @@
+import time
+import threading
+import pytest
+from util.bus_manager import BusManager
+from util.power_supply_tool import PowerSupply
+from util.simulator import SimulatedPowerSupply, SimulatedBus, LoopbackSerial
+
+
+@pytest.fixture
+def line():
+    devices = {addr: SimulatedPowerSupply(addr=addr, slew_rate=1e6) for addr in (1, 2)}
+    bus = SimulatedBus(*devices.values(), baud_rate=None, latency=0.0)
+    manager = BusManager(LoopbackSerial(bus), timeout=0.05)
+    yield manager, bus, devices
+    manager.stop()
+
+
+def test_queued_setpoint_is_written_before_the_measurement(line):
+    manager, bus, devices = line
+    device = manager.device(1)
+    device.set_target_voltage(2.0)
+    device.set_target_voltage(3.0)
+    frames = bus.frames
+    assert manager.poll_once() == 0.0
+    # One write for the latest setpoint only, then the snapshot
+    assert bus.frames == frames + 3
+    assert devices[1].set_v == 3.0
+    assert device.last_sample.voltage == 3.0
+
+
+def test_most_overdue_device_is_measured_first(line):
+    manager, bus, devices = line
+    slow, fast = manager.device(1, rate=1.0), manager.device(2, rate=100.0, priority=1)
+    manager.poll_once()
+    manager.poll_once()
+    assert (slow.samples, fast.samples) == (1, 1)
+    # The slow device is not due for another second, the fast one within a period
+    for _ in range(3):
+        wait = manager.poll_once()
+        assert wait <= 0.01
+        if wait:
+            time.sleep(wait)
+    assert slow.samples == 1
+    assert fast.samples >= 2
+
+
+def test_failed_setpoint_write_is_queued_again(line):
+    manager, bus, devices = line
+    device = manager.device(1)
+    device.set_target_voltage(2.0)
+    bus.timeout_rate = 1.0
+    with pytest.raises(Exception):
+        manager.poll_once()
+    assert device.pending_setpoint == 2.0
+
+    bus.timeout_rate = 0.0
+    manager.poll_once()
+    assert device.pending_setpoint is None
+    assert devices[1].set_v == 2.0
+
+
+def test_failed_setpoint_write_keeps_a_newer_setpoint(line, monkeypatch):
+    manager, bus, devices = line
+    device = manager.device(1)
+
+    def fail(voltage):
+        device.set_target_voltage(4.0)
+        raise OSError("line down")
+
+    monkeypatch.setattr(device.power, "set_target_voltage", fail)
+    device.set_target_voltage(2.0)
+    with pytest.raises(OSError):
+        manager.poll_once()
+    assert device.pending_setpoint == 4.0
+
+
+def test_poller_backs_off_after_errors(line, monkeypatch):
+    manager, bus, devices = line
+    calls = []
+
+    def fail():
+        calls.append(time.monotonic())
+        raise OSError("line down")
+
+    monkeypatch.setattr(manager, "poll_once", fail)
+    manager.start()
+    time.sleep(0.3)
+    manager.stop()
+    assert len(calls) == 1
+
+
+def test_direct_calls_under_the_bus_lock_while_polling(line):
+    manager, bus, devices = line
+    device = manager.device(1, verify=PowerSupply.VERIFY_DEFERRED)
+    manager.device(2)
+    errors = []
+
+    def direct():
+        try:
+            for step in range(50):
+                with manager.lock:
+                    device.power.A(0.5 + step / 100)
+        except Exception as e:
+            errors.append(e)
+
+    manager.start()
+    thread = threading.Thread(target=direct)
+    thread.start()
+    thread.join()
+    manager.stop()
+    assert not errors
+    with manager.lock:
+        assert device.power.flush_verify()
+    assert device.stats()["samples"] > 0
+    assert devices[1].set_i == 0.99
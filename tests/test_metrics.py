@@ -0,0 +1,128 @@
+import json
+import time
+import urllib.request
+import pytest
+from modbus_tk import defines
+from modbus_tk.exceptions import ModbusInvalidResponseError, ModbusError
+from util.metrics import BusMetrics, InstrumentedMaster, LatencyHistogram, MetricsServer, classify_error
+from util.power_supply_tool import PowerSupply
+
+
+class FlakyMaster:
+    """
+    Master failing with the queued errors before answering
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def execute(self, slave, function_code, starting_address, *args, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return (0,)
+
+
+def test_classify_error():
+    assert classify_error(ModbusInvalidResponseError("Response length is invalid 0")) == 'timeout'
+    assert classify_error(ModbusInvalidResponseError("Invalid CRC in response")) == 'crc'
+    assert classify_error(ModbusInvalidResponseError("Response address 2 is different from request address 1")) \
+        == 'invalid_response'
+    assert classify_error(ModbusError(2)) == 'exception_response'
+    assert classify_error(OSError("port closed")) == 'io'
+    assert classify_error(ValueError()) == 'other'
+
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = LatencyHistogram((0.001, 0.01, 0.1))
+    for seconds in [0.0005] * 50 + [0.005] * 45 + [0.05] * 4 + [0.3]:
+        histogram.observe(seconds)
+    assert histogram.counts == [50, 45, 4, 1]
+    assert histogram.quantile(0.5) == 0.001
+    assert histogram.quantile(0.95) == 0.01
+    assert histogram.quantile(0.99) == 0.1
+    assert histogram.quantile(1.0) == 0.3
+    assert LatencyHistogram().quantile(0.5) is None
+
+
+def test_retryable_errors_are_retried_and_counted():
+    metrics = BusMetrics()
+    master = FlakyMaster(ModbusInvalidResponseError("Response length is invalid 0"),
+                         ModbusInvalidResponseError("Invalid CRC in response"))
+    instrumented = metrics.instrument(master, retries=2)
+    assert instrumented.execute(1, defines.READ_HOLDING_REGISTERS, 0x0010, 1) == (0,)
+    assert master.calls == 3
+    assert metrics.snapshot()["devices"] == {1: {"timeout": 1, "crc": 1, "retries": 2}}
+    assert metrics.histograms[(1, defines.READ_HOLDING_REGISTERS, 0x0010)].count == 1
+
+
+def test_exception_responses_and_exhausted_retries_raise():
+    metrics = BusMetrics()
+    instrumented = metrics.instrument(FlakyMaster(ModbusError(2)), retries=3)
+    with pytest.raises(ModbusError):
+        instrumented.execute(1, defines.READ_HOLDING_REGISTERS, 0x0010, 1)
+    instrumented = metrics.instrument(FlakyMaster(*[ModbusInvalidResponseError("Invalid CRC in response")] * 2),
+                                      retries=1)
+    with pytest.raises(ModbusInvalidResponseError):
+        instrumented.execute(2, defines.READ_HOLDING_REGISTERS, 0x0010, 1)
+    assert metrics.snapshot()["devices"] == {1: {"exception_response": 1}, 2: {"crc": 2, "retries": 1}}
+    assert not metrics.histograms
+
+
+def test_timed_execute_latency_excludes_the_lock_wait():
+    class QueuedMaster:
+        def timed_execute(self, slave, *args, **kwargs):
+            # Queued behind another device, then 2 ms on the line
+            time.sleep(0.05)
+            return (0,), 0.002
+
+    metrics = BusMetrics()
+    InstrumentedMaster(QueuedMaster(), metrics).execute(1, defines.READ_HOLDING_REGISTERS, 0x0010, 1)
+    assert metrics.histograms[(1, defines.READ_HOLDING_REGISTERS, 0x0010)].max == 0.002
+
+
+def test_power_supply_reports_crc_errors_from_the_line(simulated):
+    metrics = BusMetrics()
+    power, device, bus = simulated(metrics=metrics, retries=2)
+    power.V(5.0)
+    bus.crc_error_rate = 1.0
+    with pytest.raises(ModbusInvalidResponseError):
+        power.V()
+    assert bus.crc_errors == 3
+    counters = metrics.snapshot()["devices"][1]
+    assert (counters["crc"], counters["retries"]) == (3, 2)
+    text = metrics.prometheus()
+    assert 'modbus_errors_total{addr="1",type="crc"} 3' in text
+    assert 'modbus_retries_total{addr="1"} 2' in text
+    assert "3 crc, 2 retries" in metrics.summary()
+
+
+def test_snapshot_and_prometheus_are_keyed_per_register(simulated):
+    metrics = BusMetrics()
+    power, device, bus = simulated(verify=PowerSupply.VERIFY_NEVER, metrics=metrics)
+    power.V(3.0)
+    power.V()
+    power.V()
+    transactions = metrics.snapshot()["transactions"]
+    read = transactions[f"1/{defines.READ_HOLDING_REGISTERS}/0x0010"]
+    assert read["count"] == 2
+    assert read["p50_ms"] <= read["max_ms"]
+    assert f"1/{defines.WRITE_SINGLE_REGISTER}/0x0030" in transactions
+    labels = f'addr="1",function="{defines.READ_HOLDING_REGISTERS}",register="0x0010"'
+    assert f'modbus_transaction_seconds_bucket{{{labels},le="+Inf"}} 2' in metrics.prometheus()
+    assert metrics.summary().startswith(f"Modbus: {bus.frames} transactions")
+
+
+def test_server_serves_prometheus_and_json():
+    metrics = BusMetrics()
+    metrics.count(1, 'timeout')
+    server = MetricsServer(metrics, port=0).start()
+    try:
+        base = f"http://127.0.0.1:{server.port}"
+        with urllib.request.urlopen(base + "/metrics") as response:
+            assert 'modbus_errors_total{addr="1",type="timeout"} 1' in response.read().decode()
+        with urllib.request.urlopen(base + "/metrics.json") as response:
+            assert json.load(response)["devices"] == {"1": {"timeout": 1}}
+    finally:
+        server.stop()
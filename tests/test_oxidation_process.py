@@ -0,0 +1,59 @@
+import pytest
+from util.simulator import SimulatedPowerSupply, SimulatedBus, LoopbackSerial
+from util.power_supply_tool import PowerSupplyTool
+from util.power_operations import create_sample_writer
+from anodic_oxidation import oxidation_process
+from anodic_oxidation.oxidation_process import tiO2_nanotubes_anodic_oxidation
+
+
+@pytest.fixture
+def tool():
+    device = SimulatedPowerSupply(slew_rate=1e6)
+    bus = SimulatedBus(device, baud_rate=None, latency=0.0)
+    return PowerSupplyTool(serial_obj=LoopbackSerial(bus), interactive=False), device
+
+
+def test_run_records_every_stage_and_switches_the_output_off(tool, tmp_path):
+    power, device = tool
+    path = tmp_path / "run.csv"
+    assert tiO2_nanotubes_anodic_oxidation(power, str(path), 1, sample_rate=20, stages=[(0.3, 1.0), (0.2, None)],
+                                           progress=False)
+    stages = [line.rsplit(",", 1)[1] for line in path.read_text().splitlines()[1:]]
+    assert set(stages) == {"1", "2"}
+    assert (tmp_path / "run_rollup.csv").exists()
+    assert device.output_on == 0
+    assert device.set_v == 0.0
+
+
+def test_failed_stage_still_switches_the_output_off(tool, tmp_path):
+    power, device = tool
+
+    def stages():
+        yield 0.1, 1.0
+        raise RuntimeError("operator abort")
+
+    assert not tiO2_nanotubes_anodic_oxidation(power, str(tmp_path / "run.csv"), 1, stages=stages(),
+                                               progress=False)
+    assert device.output_on == 0
+    assert device.set_v == 0.0
+
+
+def test_failing_writer_does_not_keep_the_output_on(tool, tmp_path, monkeypatch):
+    power, device = tool
+
+    def broken_writer(file_path, file_format=None, **kwargs):
+        writer = create_sample_writer(file_path, file_format, **kwargs)
+        close = writer.close
+
+        def fail(timeout=None):
+            close(timeout)
+            raise OSError("disk full")
+
+        writer.close = fail
+        return writer
+
+    monkeypatch.setattr(oxidation_process, "create_sample_writer", broken_writer)
+    with pytest.raises(OSError):
+        tiO2_nanotubes_anodic_oxidation(power, str(tmp_path / "run.csv"), 1, stages=[(0.1, 1.0)], progress=False)
+    assert device.output_on == 0
+    assert device.set_v == 0.0
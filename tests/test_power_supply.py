@@ -0,0 +1,114 @@
+import pytest
+import modbus_tk.defines as cst
+from modbus_tk.exceptions import ModbusInvalidResponseError
+from util.metrics import BusMetrics
+from util.power_supply_tool import PowerSupply
+
+
+def test_identity_is_parsed_from_one_block_read(simulated):
+    power, device, bus = simulated()
+    assert power.name == device.name
+    assert power.class_name == device.class_name
+    assert (power.V_dot, power.A_dot, power.W_dot) == (100, 1000, 1000)
+
+
+def test_snapshot_decodes_measurements(simulated):
+    power, device, bus = simulated(device_args={"load_ohms": 10.0})
+    power.V(5.0)
+    sample = power.snapshot()
+    assert (sample.voltage, sample.current, sample.power) == (5.0, 0.5, 2.5)
+    assert sample.protection_state is None
+    assert sample.timestamp_ns is not None
+    assert power.snapshot(protection=True).protection_state == 0
+
+
+def test_snapshot_reads_protection_state(simulated):
+    power, device, bus = simulated()
+    device.protection_state = 0x05
+    sample = power.snapshot(protection=True)
+    assert sample.protection_state == 0x05
+    assert sample.voltage == 0.0
+
+
+def test_deferred_check_rides_along_a_nearby_snapshot(simulated):
+    metrics = BusMetrics()
+    power, device, bus = simulated(PowerSupply.VERIFY_DEFERRED, metrics=metrics)
+    power.flush_verify()
+    power.operative_mode(1)
+    assert power._pending_verify == {0x0001: 1}
+
+    frames = bus.frames
+    power.snapshot(protection=True)
+    assert bus.frames == frames + 1
+    # Window widened from 0x0002 down to the mode register
+    assert (1, cst.READ_HOLDING_REGISTERS, 0x0001) in metrics.histograms
+    assert power.verify_stats()["pending"] == 0
+    assert power.verify_stats()["verified"] == 2
+
+
+def test_deferred_check_far_from_the_snapshot_stays_pending(simulated):
+    metrics = BusMetrics()
+    power, device, bus = simulated(PowerSupply.VERIFY_DEFERRED, metrics=metrics)
+    power.V(1.5)
+    power.snapshot()
+    assert set(metrics.histograms) == {(1, cst.READ_HOLDING_REGISTERS, 0x0002),
+                                       (1, cst.WRITE_SINGLE_REGISTER, 0x0030),
+                                       (1, cst.READ_HOLDING_REGISTERS, 0x0010)}
+    assert power._pending_verify == {0x0030: 150}
+    assert power.verify_stats()["verified"] == 0
+
+
+def test_flush_verify_checks_nearby_registers_in_one_read(simulated):
+    power, device, bus = simulated(PowerSupply.VERIFY_DEFERRED)
+    power.V(1.0)
+    power.V(1.5)
+    power.A(2.0)
+    # Only the latest value of each register is kept
+    assert power._pending_verify == {0x0030: 150, 0x0031: 2000}
+
+    frames = bus.frames
+    assert power.flush_verify()
+    assert bus.frames == frames + 1
+    # The initial 0 V and the 1 V write were replaced before they were checked
+    assert power.verify_stats() == {"policy": PowerSupply.VERIFY_DEFERRED, "writes": 4, "verified": 2,
+                                    "mismatches": 0, "superseded": 2, "pending": 0}
+
+
+def test_flush_verify_reports_mismatches(simulated):
+    power, device, bus = simulated(PowerSupply.VERIFY_DEFERRED)
+    power.V(1.5)
+    device.set_v = 1.0
+    assert not power.flush_verify()
+    assert power.verify_stats()["mismatches"] == 1
+
+
+def test_deferred_checks_survive_failed_reads(simulated):
+    power, device, bus = simulated(PowerSupply.VERIFY_DEFERRED)
+    power.modbus_rtu_obj.set_timeout(0.05)
+    power.operative_mode(1)
+    power.V(1.5)
+    pending = dict(power._pending_verify)
+
+    bus.timeout_rate = 1.0
+    with pytest.raises(ModbusInvalidResponseError):
+        power.snapshot(protection=True)
+    with pytest.raises(ModbusInvalidResponseError):
+        power.flush_verify()
+    assert power._pending_verify == pending
+
+    bus.timeout_rate = 0.0
+    device.set_v = 1.0
+    assert not power.flush_verify()
+    assert power.verify_stats()["mismatches"] == 1
+    assert power.verify_stats()["pending"] == 0
+
+
+def test_newer_write_during_a_check_stays_pending(simulated):
+    power, device, bus = simulated(PowerSupply.VERIFY_DEFERRED)
+    power.flush_verify()
+    power.V(1.5)
+    start, count, pending = power._verify_blocks()[0]
+    regs = power.read_block(start, count)
+    power.V(2.0)
+    assert power._check_pending(regs, start, pending)
+    assert power._pending_verify == {0x0030: 200}
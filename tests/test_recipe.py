@@ -0,0 +1,67 @@
+import json
+import pytest
+from anodic_oxidation.recipe import load_recipe, run_recipe
+
+MINIMAL = {"port": "loop://", "output": "run.csv", "stages": [{"duration": 10, "final_v": 5}, {"duration": 20}]}
+
+
+def write_recipe(tmp_path, **changes):
+    path = tmp_path / "recipe.json"
+    path.write_text(json.dumps({**MINIMAL, **changes}))
+    return str(path)
+
+
+def test_defaults_are_filled_in(tmp_path):
+    recipe = load_recipe(write_recipe(tmp_path))
+    assert recipe["stages"] == [(10, 5), (20, None)]
+    assert (recipe["baud_rate"], recipe["addr"], recipe["verify"], recipe["full_rate"]) == (9600, 1, "always", "all")
+
+
+@pytest.mark.parametrize("changes, message", [
+    ({"verify": "sometimes"}, "'verify'"),
+    ({"format": "xlsx"}, "'format'"),
+    ({"full_rate": "some"}, "'full_rate'"),
+    ({"baud_rate": 9601}, "'baud_rate'"),
+    ({"baud_rate": True}, "'baud_rate'"),
+    ({"addr": 0}, "'addr'"),
+    ({"addr": 248}, "'addr'"),
+    ({"sample_rate": 0}, "'sample_rate'"),
+    ({"sample_rate": "fast"}, "'sample_rate'"),
+    ({"retries": -1}, "'retries'"),
+    ({"port": None}, "'port'"),
+    ({"port": {"vid": 0x1A86}}, "'pid'"),
+    ({"stages": []}, "at least one stage"),
+    ({"stages": {"duration": 10}}, "must be a list"),
+    ({"stages": [10]}, "stage 1 must be an object"),
+    ({"stages": [{"duration": 10, "final_voltage": 20}]}, "stage 1 has unknown keys ['final_voltage']"),
+    ({"stages": [{"duration": 0}]}, "positive 'duration'"),
+    ({"stages": [{"duration": 10, "final_v": "20"}]}, "'final_v' must be a number"),
+    ({"stage": []}, "unknown recipe keys ['stage']"),
+])
+def test_invalid_recipes_name_the_file_and_key(tmp_path, changes, message):
+    path = write_recipe(tmp_path, **changes)
+    with pytest.raises(ValueError) as error:
+        load_recipe(path)
+    assert str(error.value).startswith(path)
+    assert message in str(error.value)
+
+
+def test_recipe_must_be_an_object(tmp_path):
+    path = tmp_path / "recipe.json"
+    path.write_text("[]")
+    with pytest.raises(ValueError):
+        load_recipe(str(path))
+
+
+def test_run_recipe_on_a_serial_url(tmp_path, monkeypatch):
+    # loop:// opens a pyserial loopback port; the Modbus traffic goes to the simulator instead
+    from util.simulator import SimulatedPowerSupply, SimulatedBus, LoopbackSerial
+    import serial
+    device = SimulatedPowerSupply(slew_rate=1e6, output_on=False)
+    monkeypatch.setattr(serial, "serial_for_url",
+                        lambda *args, **kwargs: LoopbackSerial(SimulatedBus(device, baud_rate=None, latency=0.0)))
+    recipe = load_recipe(write_recipe(tmp_path, output=str(tmp_path / "run.csv"), sample_rate=20,
+                                      stages=[{"duration": 0.2, "final_v": 1.0}]))
+    assert run_recipe(recipe)
+    assert len((tmp_path / "run.csv").read_text().splitlines()) > 1
+    assert device.output_on == 0
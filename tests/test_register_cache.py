@@ -0,0 +1,88 @@
+import pytest
+from util import register_cache
+from util.register_cache import RegisterCache
+from util.power_supply_tool import PowerSupply
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(register_cache, "time", clock)
+    return clock
+
+
+def test_policies(clock):
+    cache = RegisterCache({0x0005: RegisterCache.STATIC, 0x0030: RegisterCache.TTL,
+                           0x0031: (RegisterCache.TTL, 1.0)}, ttl=5.0)
+    cache.store(0x0005, [0x0233])
+    cache.store(0x0010, [150])
+    cache.store(0x0030, [150, 2000])
+    assert cache.lookup(0x0005) == [0x0233]
+    assert cache.lookup(0x0010) is None
+    assert cache.lookup(0x0030, 2) == [150, 2000]
+
+    clock.now += 2.0
+    assert cache.lookup(0x0030) == [150]
+    assert cache.lookup(0x0030, 2) is None
+    clock.now += 4.0
+    assert cache.lookup(0x0030) is None
+    assert cache.lookup(0x0005) == [0x0233]
+    assert cache.stats() == {"hits": 4, "misses": 2, "live": 1, "cached": 3}
+
+
+def test_invalidate(clock):
+    cache = RegisterCache({0x0030: RegisterCache.TTL, 0x0031: RegisterCache.TTL, 0x0005: RegisterCache.STATIC})
+    cache.store(0x0030, [1, 2])
+    cache.store(0x0005, [3])
+    cache.invalidate(0x0030)
+    assert cache.lookup(0x0030) is None
+    assert cache.lookup(0x0031) == [2]
+    cache.invalidate()
+    assert cache.lookup(0x0005) is None
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        RegisterCache({0x0001: "forever"})
+
+
+def test_power_supply_reads_cached_registers_without_bus_traffic(simulated):
+    power, device, bus = simulated(PowerSupply.VERIFY_NEVER)
+    power.OVP(20.0)
+    frames = bus.frames
+    assert power.OVP() == 20.0
+    assert power.OVP() == 20.0
+    assert bus.frames == frames + 1
+
+    # Measurements are always read live
+    power.V()
+    power.V()
+    assert bus.frames == frames + 3
+
+    # A write invalidates the register, so the next read goes to the device
+    power.OVP(25.0)
+    frames = bus.frames
+    assert power.OVP() == 25.0
+    assert bus.frames == frames + 1
+
+    # Changes made behind the program's back show up after refresh()
+    device.ovp = 30.0
+    assert power.OVP() == 25.0
+    power.refresh()
+    assert power.OVP() == 30.0
+
+
+def test_write_read_back_refills_the_cache(simulated):
+    power, device, bus = simulated(PowerSupply.VERIFY_ALWAYS)
+    power.OVP(20.0)
+    frames = bus.frames
+    assert power.OVP() == 20.0
+    assert bus.frames == frames
@@ -0,0 +1,91 @@
+import statistics
+import pytest
+from util.sample_stats import RunningStats, StreamAggregator, TransientDetector
+
+SECOND = 1_000_000_000
+
+
+def test_running_stats_match_the_batch_statistics():
+    values = [1.0, 4.0, 2.5, -3.0, 7.25]
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert (stats.count, stats.min, stats.max) == (5, -3.0, 7.25)
+    assert stats.mean == pytest.approx(statistics.fmean(values))
+    assert stats.std == pytest.approx(statistics.stdev(values))
+
+
+def test_charge_and_energy_are_integrated_per_stage():
+    aggregator = StreamAggregator(resolutions=(1.0,))
+    aggregator.begin_stage(1)
+    # 2 A at 5 V for 10 s, sampled every 0.5 s
+    for step in range(21):
+        aggregator.add(step * SECOND // 2, 5.0, 2.0, 10.0)
+    aggregator.begin_stage(2)
+    aggregator.add(11 * SECOND, 5.0, 2.0, 10.0)
+    aggregator.add(12 * SECOND, 5.0, 4.0, 20.0)
+
+    first, second = aggregator.stage_totals[1], aggregator.stage_totals[2]
+    assert first.samples == 21
+    assert first.charge == pytest.approx(20.0)
+    assert first.energy == pytest.approx(100.0)
+    # The gap between the stages is not integrated, the ramp within stage 2 is trapezoidal
+    assert second.charge == pytest.approx(3.0)
+    assert second.current.max == 4.0
+
+
+def test_rollup_windows_are_emitted_when_they_close():
+    emitted = []
+    aggregator = StreamAggregator(resolutions=(1.0, 5.0), on_rollup=emitted.append, start_ns=0)
+    aggregator.begin_stage(1)
+    for step in range(30):
+        aggregator.add(step * SECOND // 4, 1.0 + step, 0.5, 0.5)
+    assert [window.start for window in emitted if window.resolution == 1.0] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert all(window.samples == 4 for window in emitted if window.resolution == 1.0)
+    aggregator.flush()
+    windows = list(aggregator.rollups[5.0])
+    assert [(window.start, window.samples) for window in windows] == [(0.0, 20), (5.0, 10)]
+    assert windows[1].voltage.min == 21.0
+    assert windows[0].row()[:4] == (1, 5.0, "0.000", 20)
+
+
+def test_transient_detector_finds_a_current_spike():
+    detector = TransientDetector(threshold=4.0, min_delta=0.01, hold=0.5, warmup=10)
+    edges = []
+    for step in range(100):
+        current = 1.0 + (0.001 if step % 2 else -0.001)
+        if 40 <= step < 45:
+            current = 1.5
+        edge = detector.update(step * SECOND // 10, current)
+        if edge:
+            edges.append((step, edge))
+    assert edges == [(40, "start"), (50, "end")]
+    event = detector.events[0]
+    assert (event["start"], event["end"]) == (4 * SECOND, 5 * SECOND)
+    assert event["peak"] == 1.5
+    assert detector.count == 1
+    assert detector.active is None
+
+
+def test_detector_ignores_noise_and_learns_during_warmup():
+    detector = TransientDetector(min_delta=0.05, warmup=5)
+    # A step during warmup becomes part of the baseline
+    currents = [1.0, 1.0, 2.0, 2.0, 2.0] + [2.0 + (0.01 if step % 2 else -0.01) for step in range(200)]
+    assert all(detector.update(step * SECOND // 10, current) is None for step, current in enumerate(currents))
+    assert detector.count == 0
+
+
+def test_begin_stage_closes_windows_and_resets_the_detector():
+    detector = TransientDetector(min_delta=0.01, warmup=5)
+    aggregator = StreamAggregator(resolutions=(10.0,), detector=detector, start_ns=0)
+    aggregator.begin_stage(1)
+    for step in range(10):
+        aggregator.add(step * SECOND // 10, 1.0, 1.0, 1.0)
+    assert aggregator.add(SECOND, 1.0, 2.0, 2.0) == "start"
+    aggregator.begin_stage(2)
+    assert detector.active is None
+    assert [(window.stage, window.samples) for window in aggregator.rollups[10.0]] == [(1, 11)]
+    # The new stage learns a new baseline instead of continuing the event
+    assert all(aggregator.add((2 + step) * SECOND, 1.0, 2.0, 2.0) is None for step in range(10))
+    assert aggregator.stage_totals[2].charge == pytest.approx(18.0)
+    assert sorted(aggregator.stage_totals) == [1, 2]
@@ -0,0 +1,112 @@
+import pytest
+from util import scheduler
+from util.power_operations import AcquisitionSession
+from util.scheduler import SampleScheduler
+from util.power_supply_tool import PowerSupply
+
+MS = 1_000_000
+
+
+class FakeClock:
+    """
+    Stand-in for the time module whose sleep() only advances the clock
+    """
+
+    def __init__(self):
+        self.now = 0
+
+    def monotonic_ns(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += int(seconds * 1e9)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        SampleScheduler(0)
+
+
+def test_ticks_follow_the_deadline_grid(clock):
+    loop = SampleScheduler(10)
+    times = [loop.wait() for _ in range(4)]
+    assert times == [0, 100 * MS, 200 * MS, 300 * MS]
+    stats = loop.stats()
+    assert stats["samples"] == 4
+    assert stats["missed"] == 0
+    assert stats["jitter_max_ms"] == 0.0
+
+
+def test_overrun_skips_missed_deadlines(clock):
+    loop = SampleScheduler(10)
+    loop.wait()
+    loop.wait()
+    # The iteration after the 100 ms tick takes 350 ms: the 200 and 300 ms deadlines are lost
+    clock.now += 350 * MS
+    assert loop.wait() == 450 * MS
+    assert (loop.missed, loop.overruns) == (2, 1)
+    assert loop.wait() == 500 * MS
+    assert loop.stats()["jitter_max_ms"] == 50.0
+
+
+def test_wake_up_at_the_end_is_not_counted(clock):
+    loop = SampleScheduler(10)
+    times = []
+    while True:
+        now = loop.wait(1000 * MS)
+        if now is None:
+            break
+        times.append(now)
+    assert len(times) == 10
+    # The last wait sleeps until the end, not until the next deadline
+    assert clock.now == 1000 * MS
+    stats = loop.stats()
+    assert stats["samples"] == 10
+    assert stats["achieved_rate"] == 10.0
+    assert loop.wait(1000 * MS) is None
+    assert loop.ticks == 10
+
+
+def test_free_running_counts_every_wake_up(clock):
+    loop = SampleScheduler()
+    assert loop.wait() == 0
+    clock.now += 5 * MS
+    assert loop.wait(10 * MS) == 5 * MS
+    clock.now += 5 * MS
+    assert loop.wait(10 * MS) is None
+    assert loop.stats()["samples"] == 2
+
+
+def test_stage_samples_match_records_and_end_on_the_final_setpoint(simulated, tmp_path):
+    power, device, bus = simulated()
+    path = tmp_path / "run.csv"
+    session = AcquisitionSession(power, str(path), sample_rate=20)
+    session.run_stage(0.5, 1.0, stage=1)
+    session.close()
+
+    with open(path) as f:
+        records = len(f.readlines()) - 1
+    assert session.stage_stats[1]["samples"] == records
+    assert power.read(0x0030) == 100
+    assert device.set_v == 1.0
+
+
+def test_stage_checks_deferred_writes_periodically(simulated, tmp_path):
+    power, device, bus = simulated(PowerSupply.VERIFY_DEFERRED)
+    session = AcquisitionSession(power, str(tmp_path / "run.csv"), sample_rate=50, verify_interval=0.1)
+    checks = []
+    flush_verify = power.flush_verify
+    power.flush_verify = lambda: checks.append(power.verify_stats()["pending"]) or flush_verify()
+    session.run_stage(0.5, 1.0, stage=1)
+    session.close()
+    # About four checks during the stage, one at its end
+    assert len(checks) >= 4
+    assert power.verify_stats()["pending"] == 0
+    assert power.verify_stats()["mismatches"] == 0
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from util.setpoint_planner import SetpointSchedule
+
+
+def test_quantize_rounds_half_up_like_the_register_write():
+    assert SetpointSchedule.quantize([0.0, 0.004, 0.005, 1.234, 1.235], 100).tolist() == [0, 0, 1, 123, 124]
+
+
+def test_linear_ramp_has_one_change_point_per_code():
+    schedule = SetpointSchedule.linear(0.0, 2.0, 10.0, 100)
+    assert schedule.codes.tolist() == list(range(201)) + [200]
+    assert np.all(np.diff(schedule.times) >= 0)
+    # Code 1 takes effect once the ramp reaches 0.005 V, 0.2 V/s into the ramp
+    assert schedule.times[1] == pytest.approx(0.025)
+    assert schedule.duration == 10.0
+
+
+def test_falling_ramp_and_step_profiles():
+    falling = SetpointSchedule.linear(1.0, 0.5, 5.0, 10)
+    assert falling.codes.tolist() == [10, 9, 8, 7, 6, 5, 5]
+    step = SetpointSchedule.step([(0.0, 1.0), (2.0, 3.0)], 100)
+    assert step.codes.tolist() == [100, 300]
+    assert step.voltages().tolist() == [1.0, 3.0]
+
+
+def test_profile_times_must_be_ascending():
+    with pytest.raises(ValueError):
+        SetpointSchedule.piecewise([(1.0, 0.0), (0.0, 1.0)], 100)
+
+
+def test_planner_writes_only_register_changes():
+    planner = SetpointSchedule.linear(0.0, 2.0, 10.0, 100).planner()
+    assert planner.due(0.0) == 0.0
+    assert planner.due(0.01) is None
+    assert planner.due(5.0) == 1.0
+    assert planner.due(5.0) is None
+    assert (planner.writes, planner.skipped) == (2, 2)
+
+
+def test_planner_finish_returns_the_final_setpoint():
+    planner = SetpointSchedule.linear(0.0, 2.0, 10.0, 100).planner()
+    # The last sample of a stage falls short of the end of the ramp
+    assert planner.due(9.9) == 1.98
+    assert planner.finish() == 2.0
+    assert planner.finish() is None
+    assert planner.due(10.0) is None
+
+
+def test_planner_finish_skips_a_setpoint_already_written():
+    planner = SetpointSchedule.step([(0.0, 1.0)], 100).planner()
+    assert planner.due(0.0) == 1.0
+    assert planner.finish() is None
+    assert planner.writes == 1
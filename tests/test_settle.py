@@ -0,0 +1,78 @@
+import pytest
+from util.settle import SettleTracker
+
+SECOND = 1_000_000_000
+
+
+def test_settles_on_the_first_reading_in_band():
+    tracker = SettleTracker(5.0, error_range=0.05, start_ns=0)
+    assert not tracker.update(0.0, 0)
+    assert not tracker.update(2.5, SECOND // 2)
+    assert tracker.update(4.97, SECOND)
+    result = tracker.result
+    assert result.settled
+    assert result.settle_time == 1.0
+    assert result.reads == 3
+    assert result.final_voltage == 4.97
+    assert result.slew_rate == pytest.approx(4.97)
+
+
+def test_overshoot_is_measured_in_the_direction_of_travel():
+    rising = SettleTracker(5.0, start_ns=0)
+    for t, voltage in enumerate([0.0, 5.3, 5.02]):
+        rising.update(voltage, t * SECOND)
+    assert rising.result.overshoot == pytest.approx(0.3)
+
+    falling = SettleTracker(2.0, start_ns=0)
+    for t, voltage in enumerate([5.0, 1.8, 2.01]):
+        falling.update(voltage, t * SECOND)
+    assert falling.result.overshoot == pytest.approx(0.2)
+
+
+def test_hold_restarts_when_the_output_leaves_the_band():
+    tracker = SettleTracker(5.0, hold=0.5, start_ns=0)
+    for t, voltage in [(0.0, 0.0), (1.0, 5.0), (1.2, 5.2), (1.3, 5.01)]:
+        assert not tracker.update(voltage, int(t * SECOND))
+    assert tracker.update(4.99, int(1.8 * SECOND))
+    assert tracker.result.settle_time == pytest.approx(1.3)
+
+
+def test_timeout():
+    tracker = SettleTracker(5.0, timeout=1.0, start_ns=0)
+    assert not tracker.update(0.0, 0)
+    assert tracker.update(0.1, SECOND)
+    assert not tracker.result.settled
+    assert tracker.result.settle_time is None
+    assert tracker.update(5.0, 2 * SECOND)
+    assert tracker.result.reads == 2
+
+
+def test_next_delay_follows_the_predicted_time():
+    tracker = SettleTracker(5.0, max_interval=10.0, start_ns=0)
+    assert tracker.next_delay() == tracker.min_interval
+    tracker.update(0.0, 0)
+    tracker.update(1.0, SECOND)
+    # 3.95 V left to the band at 1 V/s, half of it
+    assert tracker.predicted_time == pytest.approx(3.95)
+    assert tracker.next_delay() == pytest.approx(1.975)
+
+
+def test_next_delay_is_capped_by_max_interval_and_timeout():
+    capped = SettleTracker(5.0, max_interval=1.0, start_ns=0)
+    capped.update(0.0, 0)
+    capped.update(1.0, SECOND)
+    assert capped.next_delay() == 1.0
+
+    near_deadline = SettleTracker(5.0, timeout=1.5, max_interval=10.0, start_ns=0)
+    near_deadline.update(0.0, 0)
+    near_deadline.update(1.0, SECOND)
+    assert near_deadline.next_delay() == pytest.approx(0.5)
+
+
+def test_next_delay_backs_off_without_progress():
+    tracker = SettleTracker(5.0, min_interval=0.01, backoff=2.0, start_ns=0)
+    tracker.update(0.0, 0)
+    tracker.update(0.0, SECOND // 10)
+    assert tracker.predicted_time is None
+    assert tracker.next_delay() == pytest.approx(0.02)
+    assert tracker.next_delay() == pytest.approx(0.04)
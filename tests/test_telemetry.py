@@ -0,0 +1,62 @@
+import time
+import threading
+from util.telemetry import TelemetryWriter, CsvSampleWriter, CSV_HEADER
+
+
+def test_close_drains_every_queued_record(tmp_path):
+    path = tmp_path / "data.csv"
+    writer = CsvSampleWriter(str(path), batch_size=7, flush_interval=60.0)
+    for number in range(100):
+        writer.write((writer.start_ns + number * 1000, 1.5, 0.25, 0.375, 0, number // 50 + 1))
+    writer.close()
+    lines = path.read_text().splitlines()
+    assert lines[0] == CSV_HEADER
+    assert len(lines) == 101
+    assert lines[1].split(",")[1:] == ["1.5", "0.25", "0.375", "1"]
+    assert lines[-1].endswith(",2")
+    assert writer.stats()["written"] == 100
+    assert writer.stats()["dropped"] == 0
+
+
+def test_checkpoint_writes_without_closing(tmp_path):
+    path = tmp_path / "data.csv"
+    writer = TelemetryWriter(str(path), header="a,b", flush_interval=60.0, checkpoint_interval=None)
+    writer.write((1, 2))
+    writer.checkpoint()
+    deadline = time.monotonic() + 2.0
+    while path.read_text() != "a,b\n1,2\n" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert path.read_text() == "a,b\n1,2\n"
+    writer.close()
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    release = threading.Event()
+
+    class SlowWriter(TelemetryWriter):
+        def encode(self, records):
+            release.wait(2.0)
+            return super().encode(records)
+
+    writer = SlowWriter(str(tmp_path / "data.csv"), max_queue=2, batch_size=1)
+    start = time.monotonic()
+    results = [writer.write((number,)) for number in range(10)]
+    assert time.monotonic() - start < 0.5
+    assert not all(results)
+    assert writer.stats()["dropped"] == results.count(False)
+    release.set()
+    writer.close()
+    assert writer.stats()["written"] + writer.stats()["dropped"] == 10
+
+
+def test_encoding_error_does_not_hang_close(tmp_path):
+    class BrokenWriter(TelemetryWriter):
+        def encode(self, records):
+            raise ValueError("cannot encode")
+
+    writer = BrokenWriter(str(tmp_path / "data.csv"))
+    writer.write((1,))
+    writer.close(timeout=2.0)
+    writer.write((2,))
+    writer.close(timeout=2.0)
+    assert writer._file.closed
@@ -4,7 +4,15 @@ Date Created: 2022/10/25 22:45
 
 """
 
-from .power_supply_tool import PowerSupplyTool
-from .power_operations import run_power_supply_operation
-
 __all__ = ['PowerSupplyTool','run_power_supply_operation']
+
+
+def __getattr__(name):
+    # Imported on first use, so light modules such as util.ports load without serial, modbus_tk and numpy
+    if name == 'PowerSupplyTool':
+        from .power_supply_tool import PowerSupplyTool
+        return PowerSupplyTool
+    if name == 'run_power_supply_operation':
+        from .power_operations import run_power_supply_operation
+        return run_power_supply_operation
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
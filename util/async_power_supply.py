@@ -0,0 +1,489 @@
+import time
+import struct
+import asyncio
+import logging
+import modbus_tk.defines as cst
+from modbus_tk.utils import calculate_crc, calculate_rtu_inter_char
+from modbus_tk.exceptions import ModbusError, ModbusInvalidResponseError
+from .power_supply_tool import PowerSupplyBase
+from .register_cache import RegisterCache
+from .settle import SettleTracker
+
+# Set up logging configuration, set log level to INFO, print errors to console
+logging.basicConfig(level=logging.INFO)
+
+
+class AsyncSerialTransport:
+    """
+    Non-blocking byte stream over a pyserial port for asyncio.
+    On POSIX the port's file descriptor is watched by the event loop; ports without a file descriptor
+    (e.g. util.simulator.LoopbackSerial) are polled through in_waiting instead.
+    """
+
+    def __init__(self, serial_obj, poll_interval: float = 0.001):
+        """
+        Initialization method
+        :param serial_obj: Open pyserial port, or an object with the same interface
+        :param poll_interval: Polling interval for ports without a file descriptor, unit: second
+        """
+        self.serial = serial_obj
+        self.poll_interval = poll_interval
+        self._buffer = bytearray()
+        self._data_event = None
+        self._loop = None
+        self._fd = None
+
+    def _attach(self):
+        # Register with the running loop on first use
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._data_event = asyncio.Event()
+        try:
+            fd = self.serial.fileno()
+            self.serial.timeout = 0
+            loop.add_reader(fd, self._on_readable)
+            self._fd = fd
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            self._fd = None
+
+    def _on_readable(self):
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except (OSError, ValueError):
+            # Port went away: stop watching, the next request fails on the port itself
+            logging.error(f"Serial port {getattr(self.serial, 'name', '')} failed", exc_info=True)
+            self.close()
+            return
+        if data:
+            self._buffer += data
+            self._data_event.set()
+
+    def close(self):
+        """
+        Stop watching the port; the port itself is left open
+        """
+        if self._fd is not None and self._loop is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    def reset_input(self):
+        """
+        Discard received bytes that were not read
+        """
+        self._buffer.clear()
+        if self._fd is None and self.serial.in_waiting:
+            self.serial.read(self.serial.in_waiting)
+
+    def write(self, data: bytes):
+        """
+        Send bytes
+        :param data: Bytes to send
+        """
+        self._attach()
+        self.serial.write(data)
+
+    async def read(self, size: int, timeout: float):
+        """
+        Read exactly size bytes
+        :param size: Number of bytes
+        :param timeout: Maximum wait, unit: second
+        :return: Bytes read, fewer than size if the timeout expired
+        """
+        self._attach()
+        deadline = time.monotonic() + timeout
+        while len(self._buffer) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if self._fd is not None:
+                self._data_event.clear()
+                try:
+                    await asyncio.wait_for(self._data_event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                waiting = self.serial.in_waiting
+                if waiting:
+                    self._buffer += self.serial.read(waiting)
+                else:
+                    await asyncio.sleep(min(self.poll_interval, remaining))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class AsyncRtuMaster:
+    """
+    Modbus RTU master for asyncio, the counterpart of modbus_tk.modbus_rtu.RtuMaster.
+    Requests from any number of devices on the same line are serialized by an asyncio lock, with the
+    3.5 character inter-frame silence kept between frames and a timeout per request.
+    """
+
+    def __init__(self, transport: AsyncSerialTransport, baud_rate: int = None, timeout: float = PowerSupplyBase.TIMEOUT):
+        """
+        Initialization method
+        :param transport: Byte stream to the RS-485 line
+        :param baud_rate: Baud rate used for inter-frame timing, defaults to the port setting
+        :param timeout: Default response timeout, unit: second
+        """
+        self.transport = transport
+        self.timeout = timeout
+        baud_rate = baud_rate or getattr(transport.serial, "baudrate", 9600)
+        self.inter_frame = 3.5 * calculate_rtu_inter_char(baud_rate)
+        self._lock = asyncio.Lock()
+        self._last_frame = 0.0
+
+    def set_timeout(self, timeout_in_sec: float):
+        self.timeout = timeout_in_sec
+
+    @staticmethod
+    def build_pdu(function_code: int, starting_address: int, quantity_of_x: int = 0, output_value=0):
+        """
+        Build a request PDU and the expected response length
+        :return: (pdu, expected response frame length)
+        """
+        if function_code == cst.READ_HOLDING_REGISTERS:
+            return struct.pack(">BHH", function_code, starting_address, quantity_of_x), 5 + 2 * quantity_of_x
+        if function_code == cst.WRITE_SINGLE_REGISTER:
+            return struct.pack(">BHH", function_code, starting_address, output_value), 8
+        if function_code == cst.WRITE_MULTIPLE_REGISTERS:
+            count = len(output_value)
+            return struct.pack(">BHHB%dH" % count, function_code, starting_address, count, 2 * count,
+                               *output_value), 8
+        raise ValueError(f"Unsupported function code: {function_code}")
+
+    async def execute(self, slave: int, function_code: int, starting_address: int, quantity_of_x: int = 0,
+                      output_value=0, timeout: float = None):
+        """
+        Execute a Modbus request, same arguments and results as RtuMaster.execute
+        :param timeout: Response timeout for this request, covering the whole response, unit: second
+        :return: Tuple of register values for reads, (address, value or count) for writes
+        """
+        return (await self.timed_execute(slave, function_code, starting_address, quantity_of_x, output_value,
+                                         timeout))[0]
+
+    async def timed_execute(self, slave: int, function_code: int, starting_address: int, quantity_of_x: int = 0,
+                            output_value=0, timeout: float = None):
+        """
+        Execute a Modbus request once the line is free
+        :return: (response as from execute(), time on the line in seconds, not counting the wait for the lock)
+        """
+        pdu, expected = self.build_pdu(function_code, starting_address, quantity_of_x, output_value)
+        request = struct.pack(">B", slave) + pdu
+        request += struct.pack(">H", calculate_crc(request))
+        timeout = self.timeout if timeout is None else timeout
+
+        async with self._lock:
+            start = time.perf_counter()
+            # Keep the inter-frame silence since the last frame on the line
+            silence = self._last_frame + self.inter_frame - time.monotonic()
+            if silence > 0:
+                await asyncio.sleep(silence)
+            self.transport.reset_input()
+            self.transport.write(request)
+            # One deadline for the whole response, the body only gets what the header left of it
+            deadline = time.monotonic() + timeout
+            try:
+                response = await self.transport.read(2, timeout)
+                if len(response) == 2:
+                    remaining = 3 if response[1] & 0x80 else expected - 2
+                    response += await self.transport.read(remaining, max(0.0, deadline - time.monotonic()))
+            finally:
+                self._last_frame = time.monotonic()
+            elapsed = time.perf_counter() - start
+
+        if len(response) < 5:
+            raise ModbusInvalidResponseError(f"Response length is invalid {len(response)}")
+        if response[0] != slave:
+            raise ModbusInvalidResponseError(
+                f"Response address {response[0]} is different from request address {slave}")
+        if struct.unpack(">H", response[-2:])[0] != calculate_crc(response[:-2]):
+            raise ModbusInvalidResponseError("Invalid CRC in response")
+        if response[1] & 0x80:
+            raise ModbusError(response[2])
+
+        if function_code == cst.READ_HOLDING_REGISTERS:
+            return struct.unpack(">%dH" % quantity_of_x, response[3:-2]), elapsed
+        return struct.unpack(">HH", response[2:6]), elapsed
+
+
+class AsyncPowerSupply(PowerSupplyBase):
+    """
+    asyncio counterpart of PowerSupply with the same methods as coroutines, so the control loop can await
+    the bus while serving other tasks. Several devices on one line share one AsyncRtuMaster.
+        create(): Connect and read identity, decimal format and protection state (use instead of __init__)
+        read() / write() / read_block() / snapshot()
+        V() / A() / W() / OVP() / OCP() / OPP() / Addr() / operative_mode() / read_protection_state()
+        set_volt() / settle() / set_target_voltage()
+    """
+
+    def __init__(self, master: AsyncRtuMaster, addr: int, verify: str = PowerSupplyBase.VERIFY_ALWAYS,
+                 verify_every: int = 10, cache: RegisterCache = None, metrics=None, retries: int = 0):
+        """
+        Constructor, does no I/O; await create() or initialize() before use
+        :param master: Asynchronous Modbus master of the line
+        :param addr: Slave Address
+        :param verify: Write verification policy: always, never, sampled or deferred
+        :param verify_every: Verify one in this many writes under the sampled policy
+        :param cache: Register cache, defaults to a cache with CACHE_POLICIES
+        :param metrics: util.metrics.BusMetrics receiving transaction latencies and error counts
+        :param retries: Number of extra attempts after a timeout, CRC error or malformed response
+        """
+        super().__init__(addr, verify, verify_every, cache, metrics)
+        self.modbus_rtu_obj = master
+        if metrics is not None or retries:
+            from .metrics import AsyncInstrumentedMaster
+            self.modbus_rtu_obj = AsyncInstrumentedMaster(master, metrics, retries)
+
+    @classmethod
+    async def create(cls, master: AsyncRtuMaster, addr: int, **kwargs):
+        """
+        Create and initialize a device
+        :param master: Asynchronous Modbus master of the line
+        :param addr: Slave Address
+        :return: AsyncPowerSupply
+        """
+        power = cls(master, addr, **kwargs)
+        await power.initialize()
+        return power
+
+    async def initialize(self):
+        """
+        Read identity, decimal point format and protection state, and zero the target voltage
+        """
+        self._parse_identity(await self.read_block(0x0002, 4))
+        await self.V(0)
+
+    async def read(self, reg_addr: int, reg_len: int = 1, timeout: float = None):
+        """
+        Read Register
+        :param reg_addr: Register Address
+        :param reg_len: Number of registers, 1~2
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: data
+        """
+        response = self.cache.lookup(reg_addr, reg_len)
+        if response is None:
+            response = await self.modbus_rtu_obj.execute(self.addr, cst.READ_HOLDING_REGISTERS, reg_addr, reg_len,
+                                                         timeout=timeout)
+            self.cache.store(reg_addr, response)
+        if reg_len == 1:
+            return response[0]
+        elif reg_len == 2:
+            return response[0] << 16 | response[1]
+
+    async def write(self, reg_addr: int, data: int, data_len: int = 1, timeout: float = None):
+        """
+        Write data and verify according to the verification policy
+        :param reg_addr: Register Address
+        :param data: Data to be written
+        :param data_len: Data length, 2 writes a 32-bit value atomically in one frame
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Write Status, None if the write was not verified now
+        """
+        if data_len == 1:
+            await self.modbus_rtu_obj.execute(self.addr, cst.WRITE_SINGLE_REGISTER, reg_addr, output_value=data,
+                                              timeout=timeout)
+        elif data_len == 2:
+            await self.modbus_rtu_obj.execute(self.addr, cst.WRITE_MULTIPLE_REGISTERS, reg_addr,
+                                              output_value=[data >> 16, data & 0xFFFF], timeout=timeout)
+
+        # Verify the write result
+        if self._written(reg_addr, data, data_len):
+            return await self.verify_write(reg_addr, data, data_len, timeout)
+        return None
+
+    async def verify_write(self, reg_addr: int, data: int, data_len: int, timeout: float = None):
+        """
+        Verify written data
+        :param reg_addr: Register Address
+        :param data: Data written
+        :param data_len: Data length
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Is the write successful?
+        """
+        self._pending_verify.pop(reg_addr, None)
+        if data_len == 2:
+            self._pending_verify.pop(reg_addr + 1, None)
+        return self._count_verify(reg_addr, await self.read(reg_addr, data_len, timeout=timeout), data)
+
+    async def flush_verify(self, timeout: float = None):
+        """
+        Check all deferred writes now, one block read per group of nearby registers
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: True if every deferred write matched
+        """
+        matched = True
+        for start, count, pending in self._verify_blocks():
+            matched &= self._check_pending(await self.read_block(start, count, timeout), start, pending)
+        return matched
+
+    async def read_block(self, start: int, count: int, timeout: float = None):
+        """
+        Read a run of consecutive registers in a single Modbus transaction
+        :param start: First register address
+        :param count: Number of registers
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Tuple of raw register values
+        """
+        response = tuple(await self.modbus_rtu_obj.execute(self.addr, cst.READ_HOLDING_REGISTERS, start, count,
+                                                           timeout=timeout))
+        self.cache.store(start, response)
+        return response
+
+    async def snapshot(self, protection: bool = False, timeout: float = None):
+        """
+        Read displayed voltage, current and power (and optionally the protection state) in one transaction
+        :param protection: Also read the protection status register 0x0002
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Sample record
+        """
+        start, end, pending = self._snapshot_window(protection)
+        start_ns = time.monotonic_ns()
+        regs = await self.read_block(start, end - start, timeout)
+        timestamp_ns = (start_ns + time.monotonic_ns()) // 2
+        return self._decode_snapshot(regs, start, protection, pending, timestamp_ns)
+
+    async def read_protection_state(self, timeout: float = None):
+        """
+        Read protection status
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Protection status register original value
+        """
+        return await self.read(0x0002, timeout=timeout)
+
+    async def V(self, V_input: float = None, timeout: float = None):
+        """
+        Read the displayed voltage or write the target voltage
+        :param V_input: Voltage value, unit: Volt
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Display voltage
+        """
+        if V_input is None:
+            return await self.read(0x0010, timeout=timeout) / self.V_dot
+        else:
+            await self.write(0x0030, int(V_input * self.V_dot + 0.5), timeout=timeout)
+
+    async def set_target_voltage(self, V_input: float, timeout: float = None):
+        """
+        Write the target voltage without waiting for the output to converge
+        :param V_input: Voltage value, unit: Volt
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        """
+        await self.V(V_input, timeout)
+
+    async def A(self, A_input: float = None, timeout: float = None):
+        """
+        Read the displayed current or write the limited current
+        :param A_input: Current value, unit: Ampere
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Display current
+        """
+        if A_input is None:
+            return await self.read(0x0011, timeout=timeout) / self.A_dot
+        else:
+            await self.write(0x0031, int(A_input * self.A_dot + 0.5), timeout=timeout)
+
+    async def W(self, timeout: float = None):
+        """
+        Read the displayed power
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Display power, unit: Watt
+        """
+        return await self.read(0x0012, 2, timeout=timeout) / self.W_dot
+
+    async def OVP(self, OVP_input: float = None, timeout: float = None):
+        """
+        Read or write overvoltage protection set value
+        :param OVP_input: Overvoltage protection value, unit: Volt
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Overvoltage protection set value
+        """
+        if OVP_input is None:
+            return await self.read(0x0020, timeout=timeout) / self.V_dot
+        else:
+            await self.write(0x0020, int(OVP_input * self.V_dot + 0.5), timeout=timeout)
+
+    async def OCP(self, OCP_input: float = None, timeout: float = None):
+        """
+        Read or write overcurrent protection set value
+        :param OCP_input: Overcurrent protection value, unit: Ampere
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Overcurrent protection set value
+        """
+        if OCP_input is None:
+            return await self.read(0x0021, timeout=timeout) / self.A_dot
+        else:
+            await self.write(0x0021, int(OCP_input * self.A_dot + 0.5), timeout=timeout)
+
+    async def OPP(self, OPP_input: float = None, timeout: float = None):
+        """
+        Read or write over power protection set value
+        :param OPP_input: Over power protection value, unit: Watt
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Over power protection set value
+        """
+        if OPP_input is None:
+            return await self.read(0x0022, 2, timeout=timeout) / self.W_dot
+        else:
+            await self.write(0x0022, int(OPP_input * self.W_dot + 0.5), 2, timeout=timeout)
+
+    async def Addr(self, addr_input: int = None, timeout: float = None):
+        """
+        Read or change slave address
+        :param addr_input: New slave address
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Current slave address
+        """
+        if addr_input is None:
+            self.addr = await self.read(0x9999, timeout=timeout)
+            return self.addr
+        else:
+            await self.write(0x9999, addr_input, timeout=timeout)
+            self.addr = addr_input
+
+    async def set_volt(self, V_input: float, error_range: float = 0.05, timeout: int = 600):
+        """
+        Set target voltage, wait for the displayed voltage to converge and measure response time;
+        other tasks keep running while it waits
+        :param V_input: Target voltage, unit: Volt
+        :param error_range: Allowable error range, unit: Volt
+        :param timeout: Timeout, unit: second
+        :return: Response time in seconds, None on timeout
+        """
+        result = await self.settle(V_input, error_range, timeout)
+        return result.settle_time if result.settled else None
+
+    async def settle(self, V_input: float, error_range: float = 0.05, timeout: float = 600, hold: float = 0.0,
+                     **tracker_args):
+        """
+        Set target voltage and wait for the displayed voltage to converge with adaptive polling
+        :param V_input: Target voltage, unit: Volt
+        :param error_range: Allowable error range, unit: Volt
+        :param timeout: Timeout, unit: second
+        :param hold: Time the voltage has to stay within the error range, unit: second
+        :param tracker_args: Further SettleTracker arguments, e.g. min_interval or max_interval
+        :return: SettleResult
+        """
+        start_ns = time.monotonic_ns()
+        await self.V(V_input)
+        tracker = SettleTracker(V_input, error_range, timeout, hold, start_ns=start_ns, **tracker_args)
+        while not tracker.update(await self.V()):
+            await asyncio.sleep(tracker.next_delay())
+        if not tracker.result.settled:
+            logging.warning(f"Voltage did not reach {V_input} V within {timeout} s")
+        return tracker.result
+
+    async def operative_mode(self, mode_input: int = None, timeout: float = None):
+        """
+        Read or write working status
+        :param mode_input: 1: Enable output; 0: Disable output
+        :param timeout: Response timeout of each request, unit: second; None for the master default
+        :return: Current working status
+        """
+        if mode_input is None:
+            return await self.read(0x0001, timeout=timeout)
+        else:
+            await self.write(0x0001, mode_input, timeout=timeout)
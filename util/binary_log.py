@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import struct
+import numpy as np
+from .telemetry import TelemetryWriter, CSV_HEADER, format_time
+
+# Fixed-width sample record
+RECORD_DTYPE = np.dtype([
+    ('t_ns', '<i8'),       # time.monotonic_ns() of the sample
+    ('voltage', '<f4'),    # V
+    ('current', '<f4'),    # A
+    ('power', '<f4'),      # W
+    ('status', '<u2'),     # Protection state bits
+    ('stage', '<u2'),      # Stage number
+])
+
+# Time index entry, written to the <file>.idx sidecar every index_interval records and at stage changes
+INDEX_DTYPE = np.dtype([
+    ('t_ns', '<i8'),
+    ('record', '<i8'),
+    ('stage', '<u4'),
+    ('reserved', '<u4'),
+])
+
+# Header: magic, version, record size, header size, wall clock ns, monotonic ns at the same instant, index interval
+HEADER_FORMAT = '<4sHHHqqI'
+HEADER_SIZE = 64
+MAGIC = b'PSTL'
+VERSION = 1
+
+
+class BinaryTelemetryWriter(TelemetryWriter):
+    """
+    Telemetry writer for sample records (monotonic ns, voltage, current, power, status, stage) in the fixed-width
+    binary format read by BinaryTelemetryReader: a HEADER_SIZE byte header followed by RECORD_DTYPE records,
+    plus a time index in the <file>.idx sidecar.
+    """
+    FILE_MODE = 'b'
+
+    def __init__(self, file_path: str, index_interval: int = 1000, **kwargs):
+        """
+        Initialization method
+        :param file_path: Local file path for storing data
+        :param index_interval: Number of records between time index entries
+        :param kwargs: Further TelemetryWriter arguments, mode must be 'w'
+        """
+        self.start_wall_ns = time.time_ns()
+        self.start_ns = time.monotonic_ns()
+        self.index_interval = index_interval
+        self._record_count = 0
+        self._last_stage = None
+        self._index_file = open(file_path + '.idx', 'wb')
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, RECORD_DTYPE.itemsize, HEADER_SIZE,
+                             self.start_wall_ns, self.start_ns, index_interval)
+        kwargs["header"] = header.ljust(HEADER_SIZE, b'\0')
+        super().__init__(file_path, **kwargs)
+
+    def encode_header(self, header: bytes):
+        return header
+
+    def encode(self, records: list):
+        """
+        Encode a batch of sample records, and append their index entries to the sidecar
+        :param records: List of sample record tuples
+        :return: Data written to the file
+        """
+        data = np.array([(t_ns, voltage, current, power, status or 0, stage)
+                         for t_ns, voltage, current, power, status, stage in records], dtype=RECORD_DTYPE)
+
+        # Index every index_interval-th record and the first record of each stage
+        numbers = np.arange(self._record_count, self._record_count + len(data))
+        stages = data['stage'].astype(np.int64)
+        previous = np.concatenate(([-1 if self._last_stage is None else self._last_stage], stages[:-1]))
+        marks = np.flatnonzero((numbers % self.index_interval == 0) | (stages != previous))
+        if len(marks):
+            index = np.zeros(len(marks), dtype=INDEX_DTYPE)
+            index['t_ns'] = data['t_ns'][marks]
+            index['record'] = numbers[marks]
+            index['stage'] = stages[marks]
+            self._index_file.write(index.tobytes())
+            self._index_file.flush()
+        self._record_count += len(data)
+        self._last_stage = int(stages[-1])
+        return data.tobytes()
+
+    def close(self, timeout: float = None):
+        """
+        Drain the queue, flush, fsync and close the data and index files
+        :param timeout: Maximum time in seconds to wait for the writer thread
+        """
+        super().close(timeout)
+        if not self._thread.is_alive() and not self._index_file.closed:
+            os.fsync(self._index_file.fileno())
+            self._index_file.close()
+
+
+class BinaryTelemetryReader:
+    """
+    Memory-mapped reader of binary telemetry files; only the pages of the requested records are loaded.
+        records: Structured NumPy memmap of all records (fields of RECORD_DTYPE)
+        time_window(): Records between two times relative to the start of the run
+        stage(): Records of one stage
+        wall_time(): Wall-clock times of records
+        to_csv(): Convert to the CSV format of the acquisition loop
+    """
+
+    def __init__(self, file_path: str):
+        """
+        Initialization method
+        :param file_path: Binary telemetry file path
+        """
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < struct.calcsize(HEADER_FORMAT):
+            raise ValueError(f"{file_path} is too short for a telemetry header.")
+        (magic, version, record_size, header_size, self.start_wall_ns, self.start_ns,
+         self.index_interval) = struct.unpack_from(HEADER_FORMAT, header)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{file_path} is not a version {VERSION} telemetry file.")
+
+        # A partial trailing record (e.g. after a crash) is ignored
+        count = (os.path.getsize(file_path) - header_size) // record_size
+        if count:
+            self.records = np.memmap(file_path, dtype=RECORD_DTYPE, mode='r', offset=header_size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+        index_path = file_path + '.idx'
+        if os.path.exists(index_path):
+            index = np.fromfile(index_path, dtype=INDEX_DTYPE)
+            self.index = index[index['record'] < count]
+        else:
+            self.index = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def _search(self, t_ns: int):
+        # First record at or after t_ns; the index narrows the range so only a few pages are touched
+        low, high = 0, len(self.records)
+        if self.index is not None and len(self.index):
+            position = np.searchsorted(self.index['t_ns'], t_ns, side='right')
+            if position > 0:
+                low = int(self.index['record'][position - 1])
+            if position < len(self.index):
+                high = int(self.index['record'][position]) + 1
+        return low + int(np.searchsorted(self.records['t_ns'][low:high], t_ns))
+
+    def time_window(self, start: float = None, end: float = None):
+        """
+        Get the records in a time window
+        :param start: Window start, seconds since the start of the run; None for the beginning
+        :param end: Window end (exclusive), seconds since the start of the run; None for the end
+        :return: Memmap slice of records
+        """
+        first = 0 if start is None else self._search(self.start_ns + int(start * 1e9))
+        last = len(self.records) if end is None else self._search(self.start_ns + int(end * 1e9))
+        return self.records[first:last]
+
+    def stage(self, stage: int):
+        """
+        Get the records of one stage
+        :param stage: Stage number
+        :return: Memmap slice of records
+        """
+        if self.index is not None:
+            starts = self.index[np.concatenate(([True], np.diff(self.index['stage'].astype(np.int64)) != 0))]
+            matches = np.flatnonzero(starts['stage'] == stage)
+            if not len(matches):
+                return self.records[0:0]
+            first = int(starts['record'][matches[0]])
+            following = matches[0] + 1
+            last = int(starts['record'][following]) if following < len(starts) else len(self.records)
+            return self.records[first:last]
+        found = np.flatnonzero(self.records['stage'] == stage)
+        return self.records[found[0]:found[-1] + 1] if len(found) else self.records[0:0]
+
+    def elapsed(self, records):
+        """
+        Get record times relative to the start of the run
+        :param records: Records
+        :return: Array of seconds
+        """
+        return (records['t_ns'] - self.start_ns) / 1e9
+
+    def wall_time(self, records):
+        """
+        Get wall-clock times of records
+        :param records: Records
+        :return: numpy datetime64[ns] array
+        """
+        return (records['t_ns'] - self.start_ns + self.start_wall_ns).astype('datetime64[ns]')
+
+    def to_csv(self, csv_path: str, chunk_size: int = 100000):
+        """
+        Convert to the CSV format of the acquisition loop, chunk by chunk
+        :param csv_path: Output CSV file path
+        :param chunk_size: Number of records converted at a time
+        """
+        with open(csv_path, 'w') as f:
+            f.write(CSV_HEADER + "\n")
+            for first in range(0, len(self.records), chunk_size):
+                chunk = np.array(self.records[first:first + chunk_size])
+                f.write("".join([
+                    f"{format_time(int(t_ns), self.start_wall_ns, self.start_ns)},{voltage:.6g},{current:.6g},"
+                    f"{power:.6g},{stage}\n"
+                    for t_ns, voltage, current, power, stage in zip(
+                        chunk['t_ns'], chunk['voltage'].tolist(), chunk['current'].tolist(),
+                        chunk['power'].tolist(), chunk['stage'].tolist())]))
+
+
+def convert_to_csv(binary_path: str, csv_path: str = None):
+    """
+    Convert a binary telemetry file to CSV
+    :param binary_path: Binary telemetry file path
+    :param csv_path: Output CSV file path, defaults to the binary path with a .csv extension
+    :return: Output CSV file path
+    """
+    if csv_path is None:
+        csv_path = os.path.splitext(binary_path)[0] + '.csv'
+    BinaryTelemetryReader(binary_path).to_csv(csv_path)
+    return csv_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python -m util.binary_log <binary file> [<csv file>]")
+        sys.exit(1)
+    print(convert_to_csv(*sys.argv[1:]))
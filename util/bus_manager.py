@@ -0,0 +1,242 @@
+import time
+import threading
+import logging
+from modbus_tk import modbus_rtu
+from .power_supply_tool import PowerSupply
+
+# Set up logging configuration, set log level to INFO, print errors to console
+logging.basicConfig(level=logging.INFO)
+
+
+class BusChannel:
+    """
+    Per-address view of a shared RtuMaster. PowerSupply uses it in place of its own RtuMaster;
+    every transaction holds the bus lock and is timed for the device statistics. The time spent queued
+    for the lock is kept apart from the transaction time, so latency metrics only see the line itself.
+    """
+
+    def __init__(self, bus: "BusManager", addr: int):
+        """
+        Initialization method
+        :param bus: Bus manager owning the serial port
+        :param addr: Slave address of the device
+        """
+        self.bus = bus
+        self.addr = addr
+        self.transactions = 0
+        self.errors = 0
+        self.bus_time = 0.0
+        self.lock_wait = 0.0
+
+    def execute(self, slave: int, *args, **kwargs):
+        return self.timed_execute(slave, *args, **kwargs)[0]
+
+    def timed_execute(self, slave: int, *args, **kwargs):
+        """
+        Execute a request once the bus is free
+        :return: (response, transaction time in seconds, not counting the wait for the bus lock)
+        """
+        queued = time.perf_counter()
+        with self.bus.lock:
+            start = time.perf_counter()
+            self.lock_wait += start - queued
+            try:
+                response = self.bus.master.execute(slave, *args, **kwargs)
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self.bus_time += elapsed
+                self.transactions += 1
+        return response, elapsed
+
+    def set_timeout(self, timeout_in_sec: float):
+        # The timeout belongs to the shared port, set on the bus manager
+        pass
+
+
+class BusDevice:
+    """
+    Handle for one power supply on a shared RS-485 line
+        power: PowerSupply talking through the shared bus
+        set_target_voltage(): Queue a setpoint, written before the next measurement on the bus
+        last_sample: Latest measurement taken by the poller
+    The poller holds the bus lock for each whole PowerSupply call, since the calls also update the register
+    cache and the deferred write checks. Direct calls on power from another thread must do the same:
+        with device.bus.lock:
+            device.power.A(1.0)
+    """
+
+    def __init__(self, bus: "BusManager", power: PowerSupply, channel: BusChannel, rate: float, priority: int,
+                 poll: bool = True):
+        self.poll = poll
+        self.bus = bus
+        self.power = power
+        self.channel = channel
+        self.addr = power.addr
+        self.period = 1.0 / rate if rate else 0.0
+        self.priority = priority
+        self.next_due = time.monotonic()
+        self.pending_setpoint = None
+        self.setpoint_lock = threading.Lock()
+        self.last_sample = None
+        self.samples = 0
+        self.missed = 0
+        self.start_time = time.monotonic()
+
+    def set_target_voltage(self, voltage: float):
+        """
+        Queue a target voltage; only the latest queued value is written
+        :param voltage: Target voltage, unit: Volt
+        """
+        with self.setpoint_lock:
+            self.pending_setpoint = voltage
+        self.bus.wake()
+
+    def stats(self):
+        """
+        Get bus statistics of this device
+        :return: Dict with samples, achieved rate, transactions, errors, bus time and time queued for the bus
+        """
+        elapsed = time.monotonic() - self.start_time
+        return {"addr": self.addr, "target_rate": 1.0 / self.period if self.period else None,
+                "samples": self.samples, "achieved_rate": self.samples / elapsed if elapsed > 0 else 0.0,
+                "missed": self.missed, "transactions": self.channel.transactions, "errors": self.channel.errors,
+                "bus_time": self.channel.bus_time, "lock_wait": self.channel.lock_wait,
+                "bus_share": self.channel.bus_time / elapsed if elapsed > 0 else 0.0}
+
+
+class BusManager:
+    """
+    Several power supplies daisy-chained on one RS-485 line, sharing one serial port and one RtuMaster.
+    Transactions are serialized with a lock; the poller writes queued setpoints first, then takes
+    measurements from the device whose sample is most overdue (ties broken by priority).
+        device(): Create the handle for a slave address
+        start() / stop(): Run the poller in a background thread
+        poll_once(): Run one scheduling step in the calling thread
+        stats(): Per-device bus statistics
+    """
+
+    def __init__(self, serial_obj, timeout: float = PowerSupply.TIMEOUT, on_sample=None):
+        """
+        Initialization method
+        :param serial_obj: Serial port class shared by all devices
+        :param timeout: Response timeout, unit: second
+        :param on_sample: Callable (addr, sample) called for every measurement taken by the poller
+        """
+        self.master = modbus_rtu.RtuMaster(serial_obj)
+        self.master.set_timeout(timeout)
+        # Reentrant: held around whole PowerSupply calls, and again by BusChannel for each transaction
+        self.lock = threading.RLock()
+        self.devices = {}
+        self.on_sample = on_sample
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def device(self, addr: int, rate: float = None, priority: int = 0, poll: bool = True, **power_args):
+        """
+        Create the handle for a device on the bus
+        :param addr: Slave address
+        :param rate: Target measurement rate of this device, unit: Hz; None to poll whenever the bus is free
+        :param priority: Higher priority devices are measured first when several are due
+        :param poll: False for a device that is only accessed directly and never measured by the poller
+        :param power_args: Further PowerSupply arguments, e.g. verify
+        :return: BusDevice
+        """
+        if addr in self.devices:
+            raise ValueError(f"Device {addr} is already on the bus.")
+        channel = BusChannel(self, addr)
+        with self.lock:
+            power = PowerSupply(None, addr, master=channel, **power_args)
+        self.devices[addr] = BusDevice(self, power, channel, rate, priority, poll)
+        return self.devices[addr]
+
+    def wake(self):
+        """
+        Interrupt the poller's wait, e.g. after a setpoint was queued
+        """
+        self._wake.set()
+
+    def poll_once(self):
+        """
+        Run one scheduling step: write every queued setpoint, then measure the most overdue device
+        :return: Time in seconds until the next device is due, 0 if a measurement was taken
+        """
+        for device in self.devices.values():
+            with device.setpoint_lock:
+                setpoint, device.pending_setpoint = device.pending_setpoint, None
+            if setpoint is not None:
+                try:
+                    with self.lock:
+                        device.power.set_target_voltage(setpoint)
+                except Exception:
+                    # Queue the setpoint again for the next step, unless a newer one arrived meanwhile
+                    with device.setpoint_lock:
+                        if device.pending_setpoint is None:
+                            device.pending_setpoint = setpoint
+                    raise
+
+        polled = [device for device in self.devices.values() if device.poll]
+        if not polled:
+            return PowerSupply.TIMEOUT
+        now = time.monotonic()
+        device = min(polled, key=lambda d: (d.next_due, -d.priority))
+        if device.next_due > now:
+            return device.next_due - now
+
+        if device.period:
+            # Deadlines advance on a fixed grid; whole periods that have passed are counted as missed
+            device.next_due += device.period
+            if device.next_due <= now:
+                skipped = int((now - device.next_due) / device.period) + 1
+                device.missed += skipped
+                device.next_due += skipped * device.period
+        else:
+            device.next_due = now
+
+        with self.lock:
+            sample = device.power.snapshot()
+        device.last_sample = sample
+        device.samples += 1
+        if self.on_sample is not None:
+            self.on_sample(device.addr, sample)
+        return 0.0
+
+    def start(self):
+        """
+        Start polling in a background thread
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="BusManager", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling and wait for the background thread
+        """
+        self._running = False
+        self.wake()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """
+        Get per-device bus statistics
+        :return: Dict of slave address -> statistics
+        """
+        return {addr: device.stats() for addr, device in self.devices.items()}
+
+    def _run(self):
+        while self._running:
+            try:
+                wait = self.poll_once()
+            except Exception:
+                logging.error("Bus poll failed", exc_info=True)
+                # Back off instead of hammering a line that is down
+                wait = PowerSupply.TIMEOUT
+            if wait > 0:
+                self._wake.wait(wait)
+                self._wake.clear()
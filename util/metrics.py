@@ -0,0 +1,422 @@
+import json
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from modbus_tk.exceptions import ModbusError, ModbusInvalidResponseError
+
+# Set up logging configuration, set log level to INFO, print errors to console
+logging.basicConfig(level=logging.INFO)
+
+# Upper bounds of the latency histogram buckets, unit: second
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+# Error types counted per device
+ERROR_TYPES = ('timeout', 'crc', 'invalid_response', 'exception_response', 'io', 'other')
+# Error types worth another attempt
+RETRYABLE = ('timeout', 'crc', 'invalid_response')
+
+
+def classify_error(error: Exception):
+    """
+    Classify a Modbus transaction failure
+    :param error: Exception raised by RtuMaster.execute or AsyncRtuMaster.execute
+    :return: One of ERROR_TYPES
+    """
+    if isinstance(error, ModbusInvalidResponseError):
+        message = str(error)
+        if "CRC" in message:
+            return 'crc'
+        # No response bytes at all within the timeout
+        if message.endswith("invalid 0"):
+            return 'timeout'
+        return 'invalid_response'
+    if isinstance(error, ModbusError):
+        return 'exception_response'
+    if isinstance(error, OSError):
+        return 'io'
+    return 'other'
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram; observe() is a bisect and two increments
+    """
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        # One count per bucket plus the overflow bucket
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        """
+        Add one latency
+        :param seconds: Latency, unit: second
+        """
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float):
+        """
+        Estimate a quantile as the upper bound of the bucket containing it
+        :param q: Quantile, 0~1
+        :return: Latency, unit: second; the observed maximum for the overflow bucket, None if empty
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class BusMetrics:
+    """
+    Instrumentation of the Modbus path, shared by all devices and loops of a program:
+        instrument(): Wrap a Modbus master so every transaction is timed and its failures counted
+        count(): Increment a per-device counter (retries, verify mismatches, errors)
+        watch_loop(): Report the rate, missed deadlines and overruns of a SampleScheduler
+        snapshot(): In-process view of all metrics
+        summary(): One log line
+        prometheus(): Prometheus text exposition format
+    Latency histograms are kept per (slave address, function code, start register).
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """
+        Initialization method
+        :param bounds: Upper bounds of the latency histogram buckets, unit: second
+        """
+        self.bounds = tuple(bounds)
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.loops = {}
+        self.start_time = time.monotonic()
+
+    def instrument(self, master, retries: int = 0):
+        """
+        Wrap a blocking Modbus master, e.g. RtuMaster or a BusChannel
+        :param master: Object with execute()
+        :param retries: Number of extra attempts after a timeout, CRC error or malformed response
+        :return: InstrumentedMaster
+        """
+        return InstrumentedMaster(master, self, retries)
+
+    def instrument_async(self, master, retries: int = 0):
+        """
+        Wrap an asynchronous Modbus master, e.g. AsyncRtuMaster
+        :param master: Object with a coroutine execute()
+        :param retries: Number of extra attempts after a timeout, CRC error or malformed response
+        :return: AsyncInstrumentedMaster
+        """
+        return AsyncInstrumentedMaster(master, self, retries)
+
+    def observe(self, addr: int, function_code: int, reg_addr: int, seconds: float):
+        """
+        Record the latency of one transaction
+        :param addr: Slave address
+        :param function_code: Modbus function code
+        :param reg_addr: Start register
+        :param seconds: Latency, unit: second
+        """
+        key = (addr, function_code, reg_addr)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram(self.bounds)
+            histogram.observe(seconds)
+
+    def count(self, addr: int, name: str, amount: int = 1):
+        """
+        Increment a per-device counter
+        :param addr: Slave address
+        :param name: Counter name, an entry of ERROR_TYPES, 'retries' or 'verify_mismatches'
+        :param amount: Increment
+        """
+        with self.lock:
+            self.counters[(addr, name)] = self.counters.get((addr, name), 0) + amount
+
+    def watch_loop(self, name: str, scheduler):
+        """
+        Report a sampling loop; its statistics are read when metrics are collected, not on the loop
+        :param name: Loop name
+        :param scheduler: util.scheduler.SampleScheduler of the loop
+        """
+        self.loops[name] = scheduler
+
+    def snapshot(self):
+        """
+        Get all metrics
+        :return: Dict with per-transaction latency statistics (ms), per-device counters and loop statistics
+        """
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = dict(self.counters)
+        transactions = {}
+        for (addr, function_code, reg_addr), histogram in sorted(histograms):
+            transactions[f"{addr}/{function_code}/0x{reg_addr:04X}"] = {
+                "count": histogram.count,
+                "mean_ms": histogram.total / histogram.count * 1e3,
+                "p50_ms": histogram.quantile(0.5) * 1e3,
+                "p95_ms": histogram.quantile(0.95) * 1e3,
+                "p99_ms": histogram.quantile(0.99) * 1e3,
+                "max_ms": histogram.max * 1e3,
+            }
+        devices = {}
+        for (addr, name), value in counters.items():
+            devices.setdefault(addr, {})[name] = value
+        return {"uptime": time.monotonic() - self.start_time, "transactions": transactions, "devices": devices,
+                "loops": {name: scheduler.stats() for name, scheduler in self.loops.items()}}
+
+    def summary(self):
+        """
+        Get a one-line summary for the log
+        :return: Summary string
+        """
+        with self.lock:
+            histograms = list(self.histograms.values())
+            counters = dict(self.counters)
+        total = LatencyHistogram(self.bounds)
+        for histogram in histograms:
+            total.counts = [a + b for a, b in zip(total.counts, histogram.counts)]
+            total.count += histogram.count
+            total.total += histogram.total
+            total.max = max(total.max, histogram.max)
+        errors = {}
+        for (addr, name), value in counters.items():
+            errors[name] = errors.get(name, 0) + value
+        text = f"Modbus: {total.count} transactions"
+        if total.count:
+            text += (f", mean {total.total / total.count * 1e3:.2f} ms, p95 {total.quantile(0.95) * 1e3:.1f} ms, "
+                     f"max {total.max * 1e3:.1f} ms")
+        text += "".join(f", {value} {name}" for name, value in sorted(errors.items()) if value)
+        for name, scheduler in self.loops.items():
+            stats = scheduler.stats()
+            text += (f"; loop {name}: {stats['achieved_rate']:.2f} Hz, {stats['missed']} missed, "
+                     f"{stats['overruns']} overruns")
+        return text
+
+    def prometheus(self):
+        """
+        Render all metrics in the Prometheus text exposition format
+        :return: Text
+        """
+        with self.lock:
+            histograms = [(key, list(h.counts), h.count, h.total) for key, h in self.histograms.items()]
+            counters = dict(self.counters)
+        lines = ["# HELP modbus_transaction_seconds Modbus transaction latency",
+                 "# TYPE modbus_transaction_seconds histogram"]
+        for (addr, function_code, reg_addr), counts, count, total in sorted(histograms):
+            labels = f'addr="{addr}",function="{function_code}",register="0x{reg_addr:04X}"'
+            cumulative = 0
+            for bound, bucket in zip(self.bounds, counts):
+                cumulative += bucket
+                lines.append(f'modbus_transaction_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'modbus_transaction_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"modbus_transaction_seconds_sum{{{labels}}} {total}")
+            lines.append(f"modbus_transaction_seconds_count{{{labels}}} {count}")
+
+        lines += ["# HELP modbus_errors_total Failed Modbus transactions by type",
+                  "# TYPE modbus_errors_total counter"]
+        for (addr, name), value in sorted(counters.items()):
+            if name in ERROR_TYPES:
+                lines.append(f'modbus_errors_total{{addr="{addr}",type="{name}"}} {value}')
+        for name, help_text in (("retries", "Repeated Modbus transactions"),
+                                ("verify_mismatches", "Write read-backs that differed from the written value")):
+            lines += [f"# HELP modbus_{name}_total {help_text}", f"# TYPE modbus_{name}_total counter"]
+            for (addr, counter), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'modbus_{name}_total{{addr="{addr}"}} {value}')
+
+        loops = {name: scheduler.stats() for name, scheduler in self.loops.items()}
+        for metric, key, help_text in (("sample_loop_rate_hz", "achieved_rate", "Achieved sampling rate"),
+                                       ("sample_loop_samples", "samples", "Samples in the current stage"),
+                                       ("sample_loop_missed", "missed", "Missed deadlines in the current stage"),
+                                       ("sample_loop_overruns", "overruns", "Overrun iterations in the current stage")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for name, stats in loops.items():
+                lines.append(f'{metric}{{loop="{name}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedMaster:
+    """
+    Modbus master wrapper timing every transaction and counting failures by type; retryable failures are
+    repeated up to retries times. Other attributes are passed through to the wrapped master.
+    A master shared behind a lock (BusChannel, AsyncRtuMaster) provides timed_execute(), returning the
+    response with its time on the line, so the wait for the lock is not counted as latency.
+    """
+
+    def __init__(self, master, metrics: BusMetrics = None, retries: int = 0):
+        """
+        Initialization method
+        :param master: Wrapped master
+        :param metrics: Metrics receiving latencies and counters, None to only retry
+        :param retries: Number of extra attempts after a timeout, CRC error or malformed response
+        """
+        self.master = master
+        self.metrics = metrics
+        self.retries = retries
+
+    def __getattr__(self, name):
+        return getattr(self.master, name)
+
+    def execute(self, slave: int, function_code: int, starting_address: int, *args, **kwargs):
+        timed_execute = getattr(self.master, 'timed_execute', None)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                if timed_execute is not None:
+                    response, seconds = timed_execute(slave, function_code, starting_address, *args, **kwargs)
+                else:
+                    response = self.master.execute(slave, function_code, starting_address, *args, **kwargs)
+                    seconds = time.perf_counter() - start
+            except Exception as e:
+                if not self._failed(slave, e, attempt):
+                    raise
+                attempt += 1
+                continue
+            if self.metrics is not None:
+                self.metrics.observe(slave, function_code, starting_address, seconds)
+            return response
+
+    def _failed(self, slave: int, error: Exception, attempt: int):
+        # Count a failure, returns whether to try again
+        error_type = classify_error(error)
+        retry = error_type in RETRYABLE and attempt < self.retries
+        if self.metrics is not None:
+            self.metrics.count(slave, error_type)
+            if retry:
+                self.metrics.count(slave, 'retries')
+        return retry
+
+
+class AsyncInstrumentedMaster(InstrumentedMaster):
+    """
+    InstrumentedMaster for an asynchronous master
+    """
+
+    async def execute(self, slave: int, function_code: int, starting_address: int, *args, **kwargs):
+        timed_execute = getattr(self.master, 'timed_execute', None)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                if timed_execute is not None:
+                    response, seconds = await timed_execute(slave, function_code, starting_address, *args,
+                                                            **kwargs)
+                else:
+                    response = await self.master.execute(slave, function_code, starting_address, *args, **kwargs)
+                    seconds = time.perf_counter() - start
+            except Exception as e:
+                if not self._failed(slave, e, attempt):
+                    raise
+                attempt += 1
+                continue
+            if self.metrics is not None:
+                self.metrics.observe(slave, function_code, starting_address, seconds)
+            return response
+
+
+class MetricsReporter:
+    """
+    Background thread logging BusMetrics.summary() periodically
+    """
+
+    def __init__(self, metrics: BusMetrics, interval: float = 60.0):
+        """
+        Initialization method
+        :param metrics: Metrics to report
+        :param interval: Time between log lines, unit: second
+        """
+        self.metrics = metrics
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="MetricsReporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the thread and log a final summary
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        logging.info(self.metrics.summary())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            logging.info(self.metrics.summary())
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint serving BusMetrics in the Prometheus text format on /metrics and the snapshot as
+    JSON on /metrics.json, from a background thread
+    """
+
+    def __init__(self, metrics: BusMetrics, port: int = 9100, host: str = "127.0.0.1"):
+        """
+        Initialization method
+        :param metrics: Metrics to serve
+        :param port: TCP port, 0 for any free port
+        :param host: Listen address, local only by default
+        """
+        self.metrics = metrics
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = server.metrics.prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(server.metrics.snapshot()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # Scrapes are not worth a log line each
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        logging.info(f"Serving metrics on http://{self.httpd.server_address[0]}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,90 @@
+import os
+import json
+import logging
+
+# Set up logging configuration, set log level to INFO, print errors to console
+logging.basicConfig(level=logging.INFO)
+
+# Device path of each USB serial adapter found before, keyed by VID:PID[:serial number]
+PORT_CACHE = os.path.join(os.path.expanduser("~"), ".power_supply_ports.json")
+
+
+def _usb_id(value):
+    # VID/PID as int, or as a hex string such as "1A86" or "0x1a86"
+    return int(value, 16) if isinstance(value, str) else value
+
+
+def port_key(vid, pid, serial_number: str = None):
+    """
+    Get the cache key of a USB serial adapter
+    :param vid: USB vendor ID
+    :param pid: USB product ID
+    :param serial_number: USB serial number, None to match any adapter of this type
+    :return: Key, format VID:PID or VID:PID:serial number
+    """
+    key = f"{_usb_id(vid):04X}:{_usb_id(pid):04X}"
+    return f"{key}:{serial_number}" if serial_number else key
+
+
+def find_port(vid=None, pid=None, serial_number: str = None, keyword: str = None):
+    """
+    Enumerate serial ports and find the first one matching all given criteria
+    :param vid: USB vendor ID
+    :param pid: USB product ID
+    :param serial_number: USB serial number
+    :param keyword: Keyword contained in the port description
+    :return: Device path, None if no port matches
+    """
+    # Enumeration is slow on some systems, only import and run it when needed
+    from serial.tools import list_ports
+    vid, pid = _usb_id(vid), _usb_id(pid)
+    for port in list_ports.comports():
+        if vid is not None and port.vid != vid:
+            continue
+        if pid is not None and port.pid != pid:
+            continue
+        if serial_number is not None and port.serial_number != serial_number:
+            continue
+        if keyword is not None and keyword.lower() not in str(port).lower():
+            continue
+        return port.device
+    return None
+
+
+def resolve_port(vid, pid, serial_number: str = None, cache_path: str = PORT_CACHE, refresh: bool = False):
+    """
+    Get the device path of a USB serial adapter, from the cache when it was found before
+    :param vid: USB vendor ID
+    :param pid: USB product ID
+    :param serial_number: USB serial number, None to match any adapter of this type
+    :param cache_path: Port cache file, None to always enumerate
+    :param refresh: Enumerate even if the adapter is cached, e.g. after the cached path failed to open
+    :return: Device path
+    """
+    key = port_key(vid, pid, serial_number)
+    cache = _load_cache(cache_path)
+    if not refresh and key in cache:
+        return cache[key]
+
+    device = find_port(vid, pid, serial_number)
+    if device is None:
+        raise ValueError(f"Can't find a serial port for USB device {key}")
+    if cache_path is not None and cache.get(key) != device:
+        cache[key] = device
+        try:
+            with open(cache_path, "w") as f:
+                json.dump(cache, f, indent=2)
+        except OSError as e:
+            logging.warning(f"Could not write the port cache {cache_path}: {e}")
+    return device
+
+
+def _load_cache(cache_path: str):
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable port cache {cache_path}: {e}")
+        return {}
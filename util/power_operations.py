@@ -1,11 +1,41 @@
+import os
 import time
-import datetime
 import logging
+from collections import deque
+from .telemetry import TelemetryWriter, CsvSampleWriter
+from .scheduler import SampleScheduler
+from .sample_stats import StreamAggregator, TransientDetector, ROLLUP_HEADER
+from .settle import SettleTracker
+from .setpoint_planner import SetpointSchedule
 
 # Set up logging configuration, set log level to INFO, print errors to console
 logging.basicConfig(level=logging.INFO)
 
-def run_power_supply_operation(set_time, final_v=None, file_path=None, power=None):
+
+def create_sample_writer(file_path, file_format=None, **kwargs):
+    """
+    Create the telemetry writer for sample records.
+
+    Args:
+        file_path (str): Local file path for storing data.
+        file_format (str, optional): 'csv' or 'binary'. If None, files ending in .bin are binary and all
+            others CSV. Defaults to None.
+        **kwargs: Further TelemetryWriter arguments.
+
+    Returns:
+        TelemetryWriter: Writer accepting (monotonic ns, voltage, current, power, status, stage) records.
+    """
+    if file_format is None:
+        file_format = 'binary' if os.path.splitext(file_path)[1].lower() == '.bin' else 'csv'
+    if file_format == 'binary':
+        from .binary_log import BinaryTelemetryWriter
+        return BinaryTelemetryWriter(file_path, **kwargs)
+    if file_format == 'csv':
+        return CsvSampleWriter(file_path, **kwargs)
+    raise ValueError(f"Unknown telemetry file format: {file_format}")
+
+
+def run_power_supply_operation(set_time, final_v=None, file_path=None, power=None, writer=None, sample_rate=None):
     """
     Run power supply operations and record data.
 
@@ -14,6 +44,10 @@ def run_power_supply_operation(set_time, final_v=None, file_path=None, power=Non
         final_v (float, optional): Final voltage value in volts. Defaults to None.
         file_path (str, optional): Local file path for storing data. Defaults to None.
         power (object, optional): Power supply object. Defaults to None.
+        writer (TelemetryWriter, optional): Shared telemetry writer. If None, a writer for file_path is
+            created and closed when the operation ends. Defaults to None.
+        sample_rate (float, optional): Target sampling rate in Hz. If None, sample as fast as the bus
+            allows. Defaults to None.
 
     Returns:
         None
@@ -21,16 +55,16 @@ def run_power_supply_operation(set_time, final_v=None, file_path=None, power=Non
     # Parameter type checks
     if not isinstance(set_time, int) or (final_v is not None and not isinstance(final_v, (int, float))):
         raise TypeError("set_time and final_v must be integers or floats.")
-    if file_path is None:
+    if file_path is None and writer is None:
         raise ValueError("File path for storing data must be provided.")
     if power is None:
         raise ValueError("Power supply object must be provided.")
 
     # Run set time and voltage operation
-    set_time_and_voltage(set_time, final_v, file_path, power)
+    set_time_and_voltage(set_time, final_v, file_path, power, writer, sample_rate)
 
 
-def set_time_and_voltage(set_time, final_v=None, file_path=None, power=None):
+def set_time_and_voltage(set_time, final_v=None, file_path=None, power=None, writer=None, sample_rate=None):
     """
     Set time and voltage, linearly increase or decrease voltage, perform electrolysis operation, and record voltage, current, and power to a local file.
 
@@ -39,6 +73,10 @@ def set_time_and_voltage(set_time, final_v=None, file_path=None, power=None):
         final_v (float, optional): Final voltage value in volts. Defaults to None.
         file_path (str, optional): Local file path for storing data. Defaults to None.
         power (object, optional): Power supply object. Defaults to None.
+        writer (TelemetryWriter, optional): Shared telemetry writer. If None, a writer for file_path is
+            created and closed when the operation ends. Defaults to None.
+        sample_rate (float, optional): Target sampling rate in Hz. If None, sample as fast as the bus
+            allows. Defaults to None.
 
     Returns:
         None
@@ -46,40 +84,252 @@ def set_time_and_voltage(set_time, final_v=None, file_path=None, power=None):
     # Parameter type checks
     if not isinstance(set_time, int) or (final_v is not None and not isinstance(final_v, (int, float))):
         raise TypeError("set_time and final_v must be integers or floats.")
-    if file_path is None:
+    if file_path is None and writer is None:
         raise ValueError("File path for storing data must be provided.")
     if power is None:
         raise ValueError("Power supply object must be provided.")
 
-    # Create file and write header
-    with open(file_path, 'w') as f:
-        f.write("Time,Voltage (V),Current (A),Power (W)\n")
+    # Run a single-stage session
+    with AcquisitionSession(power, file_path, writer, sample_rate) as session:
+        session.run_stage(set_time, final_v)
+
+
+class AcquisitionSession:
+    """
+    One continuous acquisition run. The session owns the power supply, the clock and the output stream for
+    all stages, so the data file is written once from start to end and every row carries its stage number.
+    Every sample also feeds a StreamAggregator: per-stage totals (charge, energy, voltage and current
+    statistics), rollup windows and current transient detection, without keeping the raw samples.
+        run_stage(): Ramp or hold the voltage for one stage while recording samples
+        settle(): Step to a voltage and record samples until the output has settled
+        watch_settle(): Detect settling of a setpoint change from the samples of the running loop
+        stage_totals: Per-stage SampleAggregate
+        elapsed(): Seconds since the session started
+        close(): Close the output streams the session created
+    """
+    # Full-rate recording modes
+    FULL_RATE_ALL = 'all'
+    FULL_RATE_EVENTS = 'events'
+
+    def __init__(self, power, file_path: str = None, writer: TelemetryWriter = None, sample_rate: float = None,
+                 protection: bool = False, rollup_path: str = None, resolutions=(1.0, 10.0, 60.0),
+                 full_rate: str = FULL_RATE_ALL, event_context: float = 2.0, detector: TransientDetector = None,
+                 metrics=None, verify_interval: float = 10.0):
+        """
+        Initialization method
+        :param power: Power supply object, PowerSupplyTool or PowerSupply
+        :param file_path: Local file path for storing data, used when no writer is given
+        :param writer: Shared telemetry writer, the caller is responsible for closing it
+        :param sample_rate: Target sampling rate, unit: Hz; None to sample as fast as the bus allows
+        :param protection: Record the protection state with every sample (same bus transaction)
+        :param rollup_path: CSV file path for the rollup windows, None to keep them in memory only
+        :param resolutions: Rollup window lengths, unit: second
+        :param full_rate: FULL_RATE_ALL to record every sample, FULL_RATE_EVENTS to record samples only
+            around current transients
+        :param event_context: Time recorded before and after a transient, unit: second
+        :param detector: Current transient detector, defaults to TransientDetector()
+        :param metrics: util.metrics.BusMetrics reporting the rate and overruns of the sampling loop
+        :param verify_interval: Time between checks of the deferred write verifications that did not ride along
+            with a snapshot (e.g. the target voltage), unit: second; they are also checked at the end of a stage
+        """
+        if full_rate not in (self.FULL_RATE_ALL, self.FULL_RATE_EVENTS):
+            raise ValueError(f"Unknown full-rate recording mode: {full_rate}")
+        self.power = power
+        self.own_writer = writer is None
+        self.writer = create_sample_writer(file_path) if self.own_writer else writer
+        self.rollup_writer = TelemetryWriter(rollup_path, header=ROLLUP_HEADER) if rollup_path else None
+        self.scheduler = SampleScheduler(sample_rate)
+        if metrics is not None:
+            metrics.watch_loop("acquisition", self.scheduler)
+        self.protection = protection
+        self.verify_interval_ns = int(verify_interval * 1e9)
+        self.start_ns = time.monotonic_ns()
+        self.aggregator = StreamAggregator(resolutions, on_rollup=self._on_rollup,
+                                           detector=detector or TransientDetector(), start_ns=self.start_ns)
+        self.full_rate = full_rate
+        self.event_context_ns = int(event_context * 1e9)
+        # Samples of the last event_context seconds, written if a transient starts
+        self._context = deque()
+        self._keep_until_ns = 0
+        # Settle trackers fed with the voltage of every sample
+        self._settling = []
+        self.stage = 0
+        self.last_sample = None
+        self.stage_stats = {}
+
+    @property
+    def stage_totals(self):
+        """
+        Stage number -> SampleAggregate of the stage
+        """
+        return self.aggregator.stage_totals
+
+    def elapsed(self):
+        """
+        Get time since the session started
+        :return: Elapsed time, unit: second
+        """
+        return (time.monotonic_ns() - self.start_ns) / 1e9
+
+    def watch_settle(self, target: float, error_range: float = 0.05, timeout: float = 600, hold: float = 0.0):
+        """
+        Track the convergence of the output to a setpoint on the samples the loop takes anyway, so settle
+        detection costs no extra bus reads and never blocks the loop; the caller checks tracker.done
+        :param target: Target voltage, unit: Volt
+        :param error_range: Allowable error range, unit: Volt
+        :param timeout: Maximum wait, unit: second
+        :param hold: Time the voltage has to stay within the error range, unit: second
+        :return: SettleTracker, its result is logged when done
+        """
+        tracker = SettleTracker(target, error_range, timeout, hold)
+        self._settling.append(tracker)
+        return tracker
+
+    def settle(self, voltage: float, error_range: float = 0.05, timeout: float = 600, hold: float = 0.0,
+               stage: int = None, progress=None):
+        """
+        Run a stage that writes the target voltage and records samples until the output has settled
+        :param voltage: Target voltage, unit: Volt
+        :param error_range: Allowable error range, unit: Volt
+        :param timeout: Maximum stage duration, unit: second
+        :param hold: Time the voltage has to stay within the error range, unit: second
+        :param stage: Stage number written with each sample, defaults to the previous stage plus one
+        :param progress: Callable receiving the stage elapsed time after each sample
+        :return: SettleResult
+        """
+        self.power.set_target_voltage(voltage)
+        tracker = self.watch_settle(voltage, error_range, timeout, hold)
+        self.run_stage(timeout, stage=stage, progress=progress, until=lambda: tracker.done)
+        return tracker.result
+
+    def run_stage(self, set_time: float, final_v: float = None, stage: int = None, progress=None,
+                  profile: SetpointSchedule = None, until=None):
+        """
+        Run one stage: follow the setpoint profile (by default a linear ramp from the present voltage to
+        final_v over the whole set_time, or hold the voltage if final_v is None), recording voltage, current
+        and power on every iteration. The target voltage is only written when its register value changes.
+        :param set_time: Stage duration, unit: second
+        :param final_v: Final voltage of the stage, unit: Volt
+        :param stage: Stage number written with each sample, defaults to the previous stage plus one
+        :param progress: Callable receiving the stage elapsed time after each sample
+        :param profile: Setpoint schedule relative to the stage start, overrides final_v
+        :param until: Callable checked after each sample, the stage ends early when it returns True
+        :return: Last sample of the stage
+        """
+        self.stage = self.stage + 1 if stage is None else stage
+        logging.info(f"Stage {self.stage} started at {self.elapsed():.3f} s")
+
+        # Record stage start time and initial voltage
+        stage_start_ns = time.monotonic_ns()
+        init_v = self.power.snapshot().voltage
+        self.scheduler.reset()
+        self.aggregator.begin_stage(self.stage)
+
+        # Precompute the quantized setpoint schedule
+        if profile is None and final_v is not None:
+            profile = SetpointSchedule.linear(init_v, final_v, set_time, self.power.V_dot)
+        planner = profile.planner() if profile is not None else None
+
+        # Loop to run operation at the scheduled rate
+        end_ns = stage_start_ns + int(set_time * 1e9)
+        verify_due_ns = stage_start_ns + self.verify_interval_ns
+        while True:
+            now_ns = self.scheduler.wait(end_ns)
+            if now_ns is None:
+                # The last change point falls at the very end of the stage, after the last sample
+                if planner is not None:
+                    setpoint = planner.finish()
+                    if setpoint is not None:
+                        self.power.set_target_voltage(setpoint)
+                break
+            elapsed = (now_ns - stage_start_ns) / 1e9
+
+            # Record current voltage, current, and power in one bus transaction
+            sample = self.power.snapshot(self.protection)
+            self.last_sample = sample
+
+            # Update the running aggregates, then queue data for the writer thread, formatting happens there
+            t_ns = sample.timestamp_ns or now_ns
+            edge = self.aggregator.add(t_ns, sample.voltage, sample.current, sample.power)
+            self._record((t_ns, sample.voltage, sample.current, sample.power, sample.protection_state, self.stage),
+                         edge)
+            if self._settling:
+                self._update_settling(sample.voltage, t_ns)
+            if progress is not None:
+                progress(elapsed)
+
+            # Write the setpoint only when its register value changes
+            if planner is not None:
+                setpoint = planner.due((time.monotonic_ns() - stage_start_ns) / 1e9)
+                if setpoint is not None:
+                    self.power.set_target_voltage(setpoint)
+            # Check deferred writes periodically, so a setpoint that never reached the device shows up early
+            if now_ns >= verify_due_ns:
+                self.power.flush_verify()
+                verify_due_ns = now_ns + self.verify_interval_ns
+            if until is not None and until():
+                break
 
-    # Record start time
-    start_time = time.time()
+        if progress is not None:
+            progress(set_time)
+        self.aggregator.flush()
+        self.writer.checkpoint()
+        # Deferred write checks that did not ride along with a snapshot, read in a few block reads
+        self.power.flush_verify()
 
-    # Set initial voltage
-    init_v = power.V()
+        # Report whether the stage met its sampling spec
+        stats = self.scheduler.stats()
+        self.stage_stats[self.stage] = stats
+        logging.info(f"Stage {self.stage} ended at {self.elapsed():.3f} s: {stats['samples']} samples, "
+                     f"{stats['achieved_rate']:.2f} Hz achieved, jitter p95 {stats['jitter_p95_ms']} ms, "
+                     f"{stats['missed']} missed deadlines, {planner.writes if planner else 0} setpoint writes")
+        return self.last_sample
 
-    # Calculate voltage change rate
-    if final_v is not None:
-        speed_v = (final_v - init_v) / set_time
+    def _record(self, record: tuple, edge: str):
+        # Write a sample record, or in FULL_RATE_EVENTS mode only those within event_context of a transient
+        if self.full_rate == self.FULL_RATE_ALL:
+            self.writer.write(record)
+            return
+        t_ns = record[0]
+        if edge == 'start':
+            while self._context:
+                self.writer.write(self._context.popleft())
+        if edge is not None or self.aggregator.detector.active is not None:
+            self._keep_until_ns = t_ns + self.event_context_ns
+        if t_ns <= self._keep_until_ns:
+            self.writer.write(record)
+            return
+        self._context.append(record)
+        while self._context[0][0] < t_ns - self.event_context_ns:
+            self._context.popleft()
 
-    # Loop to run operation
-    while time.time() - start_time < set_time:
-        # Record current time
-        current_time = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    def _update_settling(self, voltage: float, t_ns: int):
+        for tracker in self._settling:
+            if tracker.update(voltage, t_ns):
+                result = tracker.result
+                if result.settled:
+                    logging.info(f"Output settled at {result.target} V in {result.settle_time:.3f} s: overshoot "
+                                 f"{result.overshoot:.3f} V, {result.reads} samples")
+                else:
+                    logging.warning(f"Output did not settle at {result.target} V within {result.elapsed:.1f} s, "
+                                    f"last reading {result.final_voltage} V")
+        self._settling = [tracker for tracker in self._settling if not tracker.done]
 
-        # Record current voltage, current, and power
-        current_v = power.V()
-        current_a = power.A()
-        current_w = power.W()
+    def _on_rollup(self, window):
+        if self.rollup_writer is not None:
+            self.rollup_writer.write(window.row())
 
-        # Write data to file
-        with open(file_path, 'a') as f:
-            f.write(f"{current_time},{current_v},{current_a},{current_w}\n")
+    def close(self):
+        """
+        Close the output streams the session created
+        """
+        if self.own_writer:
+            self.writer.close()
+        if self.rollup_writer is not None:
+            self.rollup_writer.close()
 
-        # If final voltage is set, gradually adjust voltage
-        if final_v is not None:
-            power.set_volt(init_v + (time.time() - start_time) * speed_v)
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,13 +1,21 @@
+import os
 import time
+from collections import namedtuple
 import serial
-import serial.tools.list_ports
 import modbus_tk.defines as cst
 from modbus_tk import modbus_rtu
 import logging
+from .register_cache import RegisterCache
+from .settle import SettleTracker
 
 # Set up logging configuration, set log level to INFO, print errors to console
 logging.basicConfig(level=logging.INFO)
 
+# One decoded reading of the measurement registers, protection_state is None unless requested,
+# timestamp_ns is the time.monotonic_ns midpoint of the bus transaction
+Sample = namedtuple('Sample', ['voltage', 'current', 'power', 'protection_state', 'timestamp_ns'],
+                    defaults=(None, None))
+
 
 class PowerSupplyTool:
     """
@@ -20,46 +28,74 @@ class PowerSupplyTool:
         V(): Read displayed voltage or write target voltage
         A(): Read displayed current or write limited current
         W(): Read displayed power
+        snapshot(): Read displayed voltage, current and power in one transaction
         OVP(): Read or write overvoltage protection set value
         OCP(): Read or write overcurrent protection set value
         OPP(): Read or write over power protection set value
         Addr(): Read or change slave address
         set_volt(): Set target voltage, wait for conversion and measure response time
+        settle(): Set target voltage and wait for conversion with adaptive polling, returns a SettleResult
         operative_mode(): Read or write working status
     """
 
-    def __init__(self, keyword: str = "", baud_rate: int = 9600, timeout: int = 1, addr: int = 1):
+    def __init__(self, keyword: str = "", baud_rate: int = 9600, timeout: int = 1, addr: int = 1,
+                 verify: str = 'always', bus=None, metrics=None, serial_obj: serial.Serial = None,
+                 interactive: bool = True, retries: int = 0):
         """
          Initialization method
          :param keyword: Keyword for serial port name
          :param baud_rate: Baud rate
          :param timeout: Serial port timeout
          :param addr: Device slave address
+         :param verify: Write verification policy: always, never, sampled or deferred
+         :param bus: BusManager of a shared RS-485 line; if given, no serial port is opened
+         :param metrics: util.metrics.BusMetrics receiving transaction latencies and error counts
+         :param serial_obj: Serial port already opened by the caller, e.g. via util.ports.resolve_port
+         :param interactive: Prompt for a missing keyword or baud rate; if False, a missing keyword is an error
+         :param retries: Number of extra attempts after a timeout, CRC error or malformed response
          """
-        self.serial_obj = self.connect_serial(keyword, baud_rate, timeout)
-        self.power_supply = PowerSupply(self.serial_obj, addr)
+        if bus is None:
+            self.serial_obj = serial_obj or self.connect_serial(keyword, baud_rate, timeout, interactive)
+            self.power_supply = PowerSupply(self.serial_obj, addr, verify, metrics=metrics, retries=retries)
+        else:
+            self.serial_obj = None
+            self.power_supply = bus.device(addr, poll=False, verify=verify, metrics=metrics, retries=retries).power
 
-    def connect_serial(self, keyword: str = "", baud_rate: int = None, timeout: int = 1):
+    def connect_serial(self, keyword: str = "", baud_rate: int = None, timeout: int = 1, interactive: bool = True):
         """
         Connect to serial port
         :param keyword: Keyword for serial port name
         :param baud_rate: Baud rate
         :param timeout: Timeout
+        :param interactive: Prompt for a missing keyword or baud rate
         :return: Serial port class
         """
-        serial_list = list(serial.tools.list_ports.comports())
+        # An explicit port path or URL is opened directly, e.g. the pseudo-terminal of util.simulator
+        if keyword and (os.path.exists(keyword) or "://" in keyword):
+            serial_obj = serial.serial_for_url(keyword, baud_rate or 9600, timeout=timeout)
+            print(f"与 {keyword} 建立连接！")
+            return serial_obj
+
+        # Enumeration is slow on some systems, only import it when a port has to be searched
+        from serial.tools import list_ports
+        serial_list = list(list_ports.comports())
         if not serial_list:
             raise ValueError("Can't find a serial port")
 
+        if not interactive:
+            if not keyword:
+                raise ValueError("A serial keyword is required")
+            baud_rate = baud_rate or 9600
+
         if not keyword:
-            print("ҵ´ڣ")
+            print("找到如下串口：")
             for serial_port in serial_list:
                 print("\t", str(serial_port))
-            print("ҪӵĴڹؼʣ")
+            print("请输入要连接的串口关键词：")
             keyword = input()
 
         if not baud_rate:
-            print("ʹõĲʣ")
+            print("请输入使用的波特率：")
             baud_rate = input()
             try:
                 baud_rate = int(baud_rate)
@@ -70,21 +106,36 @@ class PowerSupplyTool:
             if keyword.lower() in str(serial_port).lower():
                 try:
                     serial_obj = serial.Serial(serial_port.name, baud_rate, timeout=timeout)
-                    print(f" {serial_port} ӣ")
+                    print(f"与 {serial_port} 建立连接！")
                     return serial_obj
                 except serial.SerialException as e:
-                    logging.error(f"޷ӵ {serial_port}: {e}")
+                    logging.error(f"无法连接到 {serial_port}: {e}")
                     raise
         raise ValueError("Can't find the serial port")
 
     def set_voltage(self, voltage: float, error_range: int = 0.05, timeout: int = 600):
         """
-        Set power supply output voltage
+        Set power supply output voltage and wait for the output to converge
         :param voltage: Target voltage, unit: volts
         :param error_range: Allowable error range
         :param timeout: Timeout
+        :return: SettleResult with settle time, overshoot and number of reads
         """
-        self.power_supply.set_volt(voltage, error_range, timeout)
+        return self.power_supply.settle(voltage, error_range, timeout)
+
+    def set_target_voltage(self, voltage: float):
+        """
+        Write the target voltage without waiting for the output to converge
+        :param voltage: Target voltage, unit: volts
+        """
+        self.power_supply.V(voltage)
+
+    @property
+    def V_dot(self):
+        """
+        Voltage decimal scaling of the device, the target voltage register holds voltage * V_dot
+        """
+        return self.power_supply.V_dot
 
     def get_voltage(self):
         """
@@ -114,6 +165,14 @@ class PowerSupplyTool:
         """
         return self.power_supply.W()
 
+    def snapshot(self, protection: bool = False):
+        """
+        Get voltage, current and power of the power supply from a single bus transaction
+        :param protection: Also read the protection state
+        :return: Sample record
+        """
+        return self.power_supply.snapshot(protection)
+
     def set_protection(self, ovp: float = None, ocp: float = None, opp: float = None):
         """
         Set power supply protection parameters
@@ -138,10 +197,37 @@ class PowerSupplyTool:
     def set_operative_mode(self, mode: int):
         """
         Get the current operating mode of the power supply
-        :param mode: Current operating mode1: Enable output; 0: Disable output
+        :param mode: Current operating mode，1: Enable output; 0: Disable output
         """
         self.power_supply.operative_mode(mode)
 
+    def refresh(self):
+        """
+        Drop all cached register values so the next reads go to the device
+        """
+        self.power_supply.refresh()
+
+    def get_cache_stats(self):
+        """
+        Get register cache statistics
+        :return: Dict with hit, miss and live read counts
+        """
+        return self.power_supply.cache.stats()
+
+    def flush_verify(self):
+        """
+        Check all deferred writes now
+        :return: True if every deferred write matched
+        """
+        return self.power_supply.flush_verify()
+
+    def get_verify_stats(self):
+        """
+        Get write verification statistics
+        :return: Dict with write, verify and mismatch counts
+        """
+        return self.power_supply.verify_stats()
+
     def get_operative_mode(self):
         """
         Get the current working status of the power supply
@@ -150,48 +236,222 @@ class PowerSupplyTool:
         return self.power_supply.operative_mode()
 
 
-class PowerSupply:
+class PowerSupplyBase:
     """
-    Power class, used to communicate and control power devices
+    Register map, scaling, register cache and write verification bookkeeping shared by the blocking
+    PowerSupply and util.async_power_supply.AsyncPowerSupply; contains no bus I/O
     """
     TIMEOUT = 1.0
+    # Maximum number of registers in one READ_HOLDING_REGISTERS request
+    MAX_READ_LEN = 125
+    # Registers a read may span beyond what it needs to pick up deferred write checks: 2 bytes each on the
+    # wire, against 13 bytes of request and response framing plus the device turnaround of a separate request
+    MAX_VERIFY_GAP = 6
+
+    # Write verification policies
+    VERIFY_ALWAYS = 'always'      # Read back every write immediately
+    VERIFY_NEVER = 'never'        # Do not read back
+    VERIFY_SAMPLED = 'sampled'    # Read back every verify_every-th write
+    VERIFY_DEFERRED = 'deferred'  # Check the written registers with a nearby snapshot read or flush_verify()
 
-    def __init__(self, serial_obj: serial.Serial, addr: int):
+    # Register cache policies, registers not listed are always read live
+    CACHE_POLICIES = {
+        0x0003: RegisterCache.STATIC,  # Name
+        0x0004: RegisterCache.STATIC,  # Class
+        0x0005: RegisterCache.STATIC,  # Decimal point format
+        0x9999: RegisterCache.STATIC,  # Slave address
+        0x0001: RegisterCache.TTL,     # Operating mode
+        0x0020: RegisterCache.TTL,     # OVP
+        0x0021: RegisterCache.TTL,     # OCP
+        0x0022: RegisterCache.TTL,     # OPP high word
+        0x0023: RegisterCache.TTL,     # OPP low word
+        0x0030: RegisterCache.TTL,     # Target voltage
+        0x0031: RegisterCache.TTL,     # Limited current
+    }
+
+    def __init__(self, addr: int, verify: str = VERIFY_ALWAYS, verify_every: int = 10, cache: RegisterCache = None,
+                 metrics=None):
         """
         Constructor
-        :param serial_obj: Serial port class
         :param addr: Slave Address
+        :param verify: Write verification policy: always, never, sampled or deferred
+        :param verify_every: Verify one in this many writes under the sampled policy
+        :param cache: Register cache, defaults to a cache with CACHE_POLICIES
+        :param metrics: util.metrics.BusMetrics receiving transaction latencies and error counts
         """
-        self.modbus_rtu_obj = modbus_rtu.RtuMaster(serial_obj)
-        self.modbus_rtu_obj.set_timeout(self.TIMEOUT)
         self.addr = addr
-        self.name = self.read(0x0003)
-        self.class_name = self.read(0x0004)
+        self.metrics = metrics
+        self.cache = RegisterCache(self.CACHE_POLICIES) if cache is None else cache
+        if verify not in (self.VERIFY_ALWAYS, self.VERIFY_NEVER, self.VERIFY_SAMPLED, self.VERIFY_DEFERRED):
+            raise ValueError(f"Unknown write verification policy: {verify}")
+        self.verify = verify
+        self.verify_every = verify_every
+        self.write_count = 0
+        self.verify_count = 0
+        self.verify_mismatches = 0
+        # Deferred checks dropped because a newer write to the same register replaced them
+        self.verify_superseded = 0
+        # Register address -> expected value, waiting for a deferred check
+        self._pending_verify = {}
 
-        dot_msg = self.read(0x0005)
+    def _parse_dot(self, dot_msg: int):
+        # Decimal point format register: voltage, current and power decimals in one nibble each
         self.W_dot = 10 ** (dot_msg & 0x0F)
         dot_msg >>= 4
         self.A_dot = 10 ** (dot_msg & 0x0F)
         dot_msg >>= 4
         self.V_dot = 10 ** (dot_msg & 0x0F)
 
-        protection_state_int = self.read_protection_state()
+    def _parse_protection(self, protection_state_int: int):
         self.isOVP = protection_state_int & 0x01
         self.isOCP = (protection_state_int & 0x02) >> 1
         self.isOPP = (protection_state_int & 0x04) >> 2
         self.isOTP = (protection_state_int & 0x08) >> 3
         self.isSCP = (protection_state_int & 0x10) >> 4
 
+    def _parse_identity(self, regs):
+        # Protection state, name, class and decimal point format, registers 0x0002~0x0005 read in one block
+        self._parse_protection(regs[0])
+        self.name = regs[1]
+        self.class_name = regs[2]
+        self._parse_dot(regs[3])
+
+    def _written(self, reg_addr: int, data: int, data_len: int):
+        # Bookkeeping after a write, returns whether the policy asks for an immediate read back
+        self.cache.invalidate(reg_addr, data_len)
+        self.write_count += 1
+        if self.verify == self.VERIFY_ALWAYS or (
+                self.verify == self.VERIFY_SAMPLED and self.write_count % self.verify_every == 0):
+            return True
+        if self.verify == self.VERIFY_DEFERRED:
+            if reg_addr in self._pending_verify:
+                self.verify_superseded += 1
+            if data_len == 1:
+                self._pending_verify[reg_addr] = data
+            else:
+                self._pending_verify[reg_addr] = data >> 16
+                self._pending_verify[reg_addr + 1] = data & 0xFFFF
+        return False
+
+    def _snapshot_window(self, protection: bool):
+        # Register block of a snapshot, widened to cover registers waiting for a deferred write check only if
+        # that costs less than a request of their own; the others stay pending for flush_verify().
+        # Returns (start, end, pending checks included); they stay pending until the read succeeds
+        start, end = (0x0002 if protection else 0x0010), 0x0014
+        if not self._pending_verify:
+            return start, end, {}
+        near = [reg_addr for reg_addr in self._pending_verify
+                if start - self.MAX_VERIFY_GAP <= reg_addr < end + self.MAX_VERIFY_GAP]
+        if not near:
+            return start, end, {}
+        block_start, block_end = min(start, min(near)), max(end, max(near) + 1)
+        if (block_end - block_start) - (end - start) > self.MAX_VERIFY_GAP:
+            return start, end, {}
+        return block_start, block_end, {reg_addr: self._pending_verify[reg_addr] for reg_addr in near}
+
+    def _verify_blocks(self):
+        # Group the pending deferred write checks into register blocks of one read each; they stay pending
+        # until their read succeeds. Returns [(start, count, {register address: expected value})]
+        pending = dict(self._pending_verify)
+        blocks = []
+        for reg_addr in sorted(pending):
+            if blocks and reg_addr - (blocks[-1][0] + blocks[-1][1]) <= self.MAX_VERIFY_GAP and \
+                    reg_addr - blocks[-1][0] < self.MAX_READ_LEN:
+                blocks[-1][1] = reg_addr - blocks[-1][0] + 1
+            else:
+                blocks.append([reg_addr, 1, {}])
+            blocks[-1][2][reg_addr] = pending[reg_addr]
+        return [tuple(block) for block in blocks]
+
+    def _check_pending(self, regs, start: int, pending: dict):
+        # Compare registers read from start with deferred checks, then drop those checks unless a newer write
+        # to the register was queued meanwhile; returns True if all matched
+        matched = True
+        for reg_addr, data in pending.items():
+            matched &= self._count_verify(reg_addr, regs[reg_addr - start], data)
+            if self._pending_verify.get(reg_addr) == data:
+                del self._pending_verify[reg_addr]
+        return matched
+
+    def _decode_snapshot(self, regs, start: int, protection: bool, pending: dict, timestamp_ns: int):
+        self._check_pending(regs, start, pending)
+        protection_state = regs[0x0002 - start] if protection else None
+        regs = regs[0x0010 - start:]
+        return Sample(regs[0] / self.V_dot, regs[1] / self.A_dot, (regs[2] << 16 | regs[3]) / self.W_dot,
+                      protection_state, timestamp_ns)
+
+    def refresh(self, reg_addr: int = None, reg_len: int = 1):
+        """
+        Drop cached register values so the next read goes to the device
+        :param reg_addr: First register address, None for all registers
+        :param reg_len: Number of registers
+        """
+        self.cache.invalidate(reg_addr, reg_len)
+
+    def verify_stats(self):
+        """
+        Get write verification statistics
+        :return: Dict with write, verify and mismatch counts, the number of deferred checks replaced by a newer
+            write before they were read, and the number still pending
+        """
+        return {"policy": self.verify, "writes": self.write_count, "verified": self.verify_count,
+                "mismatches": self.verify_mismatches, "superseded": self.verify_superseded,
+                "pending": len(self._pending_verify)}
+
+    def _count_verify(self, reg_addr: int, actual: int, expected: int):
+        self.verify_count += 1
+        if actual != expected:
+            self.verify_mismatches += 1
+            if self.metrics is not None:
+                self.metrics.count(self.addr, 'verify_mismatches')
+            logging.warning(f"Write verification failed at register 0x{reg_addr:04X}: wrote {expected}, read {actual}")
+            return False
+        return True
+
+
+class PowerSupply(PowerSupplyBase):
+    """
+    Power class, used to communicate and control power devices
+    """
+
+    def __init__(self, serial_obj: serial.Serial, addr: int, verify: str = PowerSupplyBase.VERIFY_ALWAYS,
+                 verify_every: int = 10, cache: RegisterCache = None, master=None, metrics=None, retries: int = 0):
+        """
+        Constructor
+        :param serial_obj: Serial port class, ignored when master is given
+        :param addr: Slave Address
+        :param verify: Write verification policy: always, never, sampled or deferred
+        :param verify_every: Verify one in this many writes under the sampled policy
+        :param cache: Register cache, defaults to a cache with CACHE_POLICIES
+        :param master: Shared Modbus master, e.g. a BusManager channel, instead of a dedicated RtuMaster
+        :param metrics: util.metrics.BusMetrics receiving transaction latencies and error counts
+        :param retries: Number of extra attempts after a timeout, CRC error or malformed response
+        """
+        super().__init__(addr, verify, verify_every, cache, metrics)
+        if master is None:
+            self.modbus_rtu_obj = modbus_rtu.RtuMaster(serial_obj)
+            self.modbus_rtu_obj.set_timeout(self.TIMEOUT)
+        else:
+            self.modbus_rtu_obj = master
+        if metrics is not None or retries:
+            from .metrics import InstrumentedMaster
+            self.modbus_rtu_obj = InstrumentedMaster(self.modbus_rtu_obj, metrics, retries)
+        # Protection state, identity and decimal point format in one transaction
+        self._parse_identity(self.read_block(0x0002, 4))
+
         self.V(0)
 
     def read(self, reg_addr: int, reg_len: int = 1):
         """
         Read Register
         :param reg_addr: Register Address
-        :param reg_len: Number of registers1~2
+        :param reg_len: Number of registers，1~2
         :return: data
         """
-        response = self.modbus_rtu_obj.execute(self.addr, cst.READ_HOLDING_REGISTERS, reg_addr, reg_len)
+        response = self.cache.lookup(reg_addr, reg_len)
+        if response is None:
+            response = self.modbus_rtu_obj.execute(self.addr, cst.READ_HOLDING_REGISTERS, reg_addr, reg_len)
+            self.cache.store(reg_addr, response)
         if reg_len == 1:
             return response[0]
         elif reg_len == 2:
@@ -199,20 +459,22 @@ class PowerSupply:
 
     def write(self, reg_addr: int, data: int, data_len: int = 1):
         """
-        Write data and verify
+        Write data and verify according to the verification policy
         :param reg_addr: Register Address
         :param data: Data to be written
-        :param data_len: Data length
-        :return: Write Status
+        :param data_len: Data length, 2 writes a 32-bit value atomically in one frame
+        :return: Write Status, None if the write was not verified now
         """
         if data_len == 1:
             self.modbus_rtu_obj.execute(self.addr, cst.WRITE_SINGLE_REGISTER, reg_addr, output_value=data)
         elif data_len == 2:
-            self.modbus_rtu_obj.execute(self.addr, cst.WRITE_SINGLE_REGISTER, reg_addr, output_value=data >> 16)
-            self.modbus_rtu_obj.execute(self.addr, cst.WRITE_SINGLE_REGISTER, reg_addr + 1, output_value=data & 0xFFFF)
+            self.modbus_rtu_obj.execute(self.addr, cst.WRITE_MULTIPLE_REGISTERS, reg_addr,
+                                        output_value=[data >> 16, data & 0xFFFF])
 
         # Verify the write result
-        return self.verify_write(reg_addr, data, data_len)
+        if self._written(reg_addr, data, data_len):
+            return self.verify_write(reg_addr, data, data_len)
+        return None
 
     def verify_write(self, reg_addr: int, data: int, data_len: int):
         """
@@ -222,10 +484,20 @@ class PowerSupply:
         :param data_len: Data length
         :return: Is the write successful?
         """
-        if data_len == 1:
-            return self.read(reg_addr) == data
-        elif data_len == 2:
-            return self.read(reg_addr) == (data >> 16) and self.read(reg_addr + 1) == (data & 0xFFFF)
+        self._pending_verify.pop(reg_addr, None)
+        if data_len == 2:
+            self._pending_verify.pop(reg_addr + 1, None)
+        return self._count_verify(reg_addr, self.read(reg_addr, data_len), data)
+
+    def flush_verify(self):
+        """
+        Check all deferred writes now, one block read per group of nearby registers
+        :return: True if every deferred write matched
+        """
+        matched = True
+        for start, count, pending in self._verify_blocks():
+            matched &= self._check_pending(self.read_block(start, count), start, pending)
+        return matched
 
     def read_protection_state(self):
         """
@@ -244,3 +516,142 @@ class PowerSupply:
             return self.read(0x0010) / self.V_dot
         else:
             self.write(0x0030, int(V_input * self.V_dot + 0.5))
+
+    def set_target_voltage(self, V_input: float):
+        """
+        Write the target voltage without waiting for the output to converge
+        :param V_input: Voltage value, unit: Volt
+        """
+        self.V(V_input)
+
+    def A(self, A_input: float = None):
+        """
+        Read the displayed current or write the limited current
+        :param A_input: Current value, unit: Ampere
+        :return: Display current or limited current
+        """
+        if A_input is None:
+            return self.read(0x0011) / self.A_dot
+        else:
+            self.write(0x0031, int(A_input * self.A_dot + 0.5))
+
+    def W(self):
+        """
+        Read the displayed power
+        :return: Display power, unit: Watt
+        """
+        return self.read(0x0012, 2) / self.W_dot
+
+    def OVP(self, OVP_input: float = None):
+        """
+        Read or write overvoltage protection set value
+        :param OVP_input: Overvoltage protection value, unit: Volt
+        :return: Overvoltage protection set value
+        """
+        if OVP_input is None:
+            return self.read(0x0020) / self.V_dot
+        else:
+            self.write(0x0020, int(OVP_input * self.V_dot + 0.5))
+
+    def OCP(self, OCP_input: float = None):
+        """
+        Read or write overcurrent protection set value
+        :param OCP_input: Overcurrent protection value, unit: Ampere
+        :return: Overcurrent protection set value
+        """
+        if OCP_input is None:
+            return self.read(0x0021) / self.A_dot
+        else:
+            self.write(0x0021, int(OCP_input * self.A_dot + 0.5))
+
+    def OPP(self, OPP_input: float = None):
+        """
+        Read or write over power protection set value
+        :param OPP_input: Over power protection value, unit: Watt
+        :return: Over power protection set value
+        """
+        if OPP_input is None:
+            return self.read(0x0022, 2) / self.W_dot
+        else:
+            self.write(0x0022, int(OPP_input * self.W_dot + 0.5), 2)
+
+    def Addr(self, addr_input: int = None):
+        """
+        Read or change slave address
+        :param addr_input: New slave address
+        :return: Current slave address
+        """
+        if addr_input is None:
+            self.addr = self.read(0x9999)
+            return self.addr
+        else:
+            self.write(0x9999, addr_input)
+            self.addr = addr_input
+
+    def set_volt(self, V_input: float, error_range: float = 0.05, timeout: int = 600):
+        """
+        Set target voltage, wait for the displayed voltage to converge and measure response time
+        :param V_input: Target voltage, unit: Volt
+        :param error_range: Allowable error range, unit: Volt
+        :param timeout: Timeout, unit: second
+        :return: Response time in seconds, None on timeout
+        """
+        result = self.settle(V_input, error_range, timeout)
+        return result.settle_time if result.settled else None
+
+    def settle(self, V_input: float, error_range: float = 0.05, timeout: float = 600, hold: float = 0.0,
+               **tracker_args):
+        """
+        Set target voltage and wait for the displayed voltage to converge, polling fast after the write and
+        less often as the predicted time to target allows (see util.settle.SettleTracker)
+        :param V_input: Target voltage, unit: Volt
+        :param error_range: Allowable error range, unit: Volt
+        :param timeout: Timeout, unit: second
+        :param hold: Time the voltage has to stay within the error range, unit: second
+        :param tracker_args: Further SettleTracker arguments, e.g. min_interval or max_interval
+        :return: SettleResult
+        """
+        start_ns = time.monotonic_ns()
+        self.V(V_input)
+        tracker = SettleTracker(V_input, error_range, timeout, hold, start_ns=start_ns, **tracker_args)
+        while not tracker.update(self.V()):
+            time.sleep(tracker.next_delay())
+        if not tracker.result.settled:
+            logging.warning(f"Voltage did not reach {V_input} V within {timeout} s")
+        return tracker.result
+
+    def operative_mode(self, mode_input: int = None):
+        """
+        Read or write working status
+        :param mode_input: 1: Enable output; 0: Disable output
+        :return: Current working status
+        """
+        if mode_input is None:
+            return self.read(0x0001)
+        else:
+            self.write(0x0001, mode_input)
+
+    def read_block(self, start: int, count: int):
+        """
+        Read a run of consecutive registers in a single Modbus transaction
+        :param start: First register address
+        :param count: Number of registers
+        :return: Tuple of raw register values
+        """
+        response = tuple(self.modbus_rtu_obj.execute(self.addr, cst.READ_HOLDING_REGISTERS, start, count))
+        self.cache.store(start, response)
+        return response
+
+    def snapshot(self, protection: bool = False):
+        """
+        Read displayed voltage, current and power (and optionally the protection state) in one transaction,
+        so all values come from the same instant
+        :param protection: Also read the protection status register 0x0002
+        :return: Sample record
+        """
+        # Deferred write checks ride along in the same block read when they are close to it
+        start, end, pending = self._snapshot_window(protection)
+        start_ns = time.monotonic_ns()
+        regs = self.read_block(start, end - start)
+        timestamp_ns = (start_ns + time.monotonic_ns()) // 2
+        return self._decode_snapshot(regs, start, protection, pending, timestamp_ns)
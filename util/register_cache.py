@@ -0,0 +1,102 @@
+import time
+
+
+class RegisterCache:
+    """
+    Shadow copy of device registers with a per-register policy:
+        STATIC: Read once, kept until invalidated (identity, decimal format)
+        TTL: Kept for a number of seconds (protection settings, operating mode, setpoints)
+        LIVE: Never cached, always read from the device (measurements, protection state)
+    Registers written by this program are invalidated, so the next read goes to the device.
+    """
+    STATIC = 'static'
+    TTL = 'ttl'
+    LIVE = 'live'
+
+    def __init__(self, policies: dict = None, default: str = LIVE, ttl: float = 5.0):
+        """
+        Initialization method
+        :param policies: Register address -> policy, or (TTL, seconds) for a register specific time to live
+        :param default: Policy of registers not listed in policies
+        :param ttl: Default time to live of TTL registers, unit: second
+        """
+        self.default = default
+        self.ttl = ttl
+        # Register address -> (value, expiry time)
+        self._values = {}
+        self._policies = {}
+        for reg_addr, policy in (policies or {}).items():
+            if isinstance(policy, tuple):
+                self.set_policy(reg_addr, *policy)
+            else:
+                self.set_policy(reg_addr, policy)
+        self.hits = 0
+        self.misses = 0
+        self.live = 0
+
+    def set_policy(self, reg_addr: int, policy: str, ttl: float = None):
+        """
+        Set the caching policy of a register
+        :param reg_addr: Register Address
+        :param policy: STATIC, TTL or LIVE
+        :param ttl: Time to live for the TTL policy, unit: second; defaults to the cache ttl
+        """
+        if policy not in (self.STATIC, self.TTL, self.LIVE):
+            raise ValueError(f"Unknown register cache policy: {policy}")
+        self._policies[reg_addr] = (policy, self.ttl if ttl is None else ttl)
+        self._values.pop(reg_addr, None)
+
+    def lookup(self, reg_addr: int, reg_len: int = 1):
+        """
+        Look up consecutive registers
+        :param reg_addr: First register address
+        :param reg_len: Number of registers
+        :return: List of values, None unless every register is cached and fresh
+        """
+        now = time.monotonic()
+        values = []
+        for reg in range(reg_addr, reg_addr + reg_len):
+            policy = self._policies.get(reg, (self.default, self.ttl))[0]
+            if policy == self.LIVE:
+                self.live += 1
+                return None
+            entry = self._values.get(reg)
+            if entry is None or entry[1] < now:
+                self.misses += 1
+                return None
+            values.append(entry[0])
+        self.hits += 1
+        return values
+
+    def store(self, reg_addr: int, values):
+        """
+        Store register values read from the device; LIVE registers are ignored
+        :param reg_addr: First register address
+        :param values: Register values
+        """
+        now = time.monotonic()
+        for reg, value in enumerate(values, reg_addr):
+            policy, ttl = self._policies.get(reg, (self.default, self.ttl))
+            if policy == self.STATIC:
+                self._values[reg] = (value, float('inf'))
+            elif policy == self.TTL:
+                self._values[reg] = (value, now + ttl)
+
+    def invalidate(self, reg_addr: int = None, reg_len: int = 1):
+        """
+        Drop cached registers
+        :param reg_addr: First register address, None to drop everything
+        :param reg_len: Number of registers
+        """
+        if reg_addr is None:
+            self._values.clear()
+        else:
+            for reg in range(reg_addr, reg_addr + reg_len):
+                self._values.pop(reg, None)
+
+    def stats(self):
+        """
+        Get cache statistics
+        :return: Dict with hit, miss and live read counts and the number of cached registers
+        """
+        return {"hits": self.hits, "misses": self.misses, "live": self.live, "cached": len(self._values)}
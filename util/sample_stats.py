@@ -0,0 +1,271 @@
+import math
+from collections import deque
+
+# Column header of the rollup CSV file
+ROLLUP_HEADER = ("Stage,Resolution (s),Start (s),Samples,Voltage min (V),Voltage mean (V),Voltage max (V),"
+                 "Current min (A),Current mean (A),Current max (A),Charge (C),Energy (J)")
+
+
+class RunningStats:
+    """
+    Running count, min, max, mean and variance of one quantity (Welford's method), O(1) memory
+    """
+    __slots__ = ("count", "mean", "min", "max", "_m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        """
+        Add one value
+        :param value: Value
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def std(self):
+        """
+        Sample standard deviation, 0 with fewer than two values
+        """
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class SampleAggregate:
+    """
+    Aggregate of the samples in one span (a rollup window or a stage): voltage and current statistics,
+    charge (integral of I dt) and energy (integral of P dt)
+    """
+    __slots__ = ("stage", "resolution", "start", "voltage", "current", "charge", "energy")
+
+    def __init__(self, stage: int = None, resolution: float = None, start: float = None):
+        """
+        Initialization method
+        :param stage: Stage number of the span
+        :param resolution: Window length, unit: second; None for a whole stage
+        :param start: Span start, seconds since the start of the run
+        """
+        self.stage = stage
+        self.resolution = resolution
+        self.start = start
+        self.voltage = RunningStats()
+        self.current = RunningStats()
+        self.charge = 0.0
+        self.energy = 0.0
+
+    @property
+    def samples(self):
+        return self.voltage.count
+
+    def add(self, voltage: float, current: float, charge: float, energy: float):
+        """
+        Add one sample
+        :param voltage: Voltage, unit: Volt
+        :param current: Current, unit: Ampere
+        :param charge: Charge since the previous sample, unit: Coulomb
+        :param energy: Energy since the previous sample, unit: Joule
+        """
+        self.voltage.add(voltage)
+        self.current.add(current)
+        self.charge += charge
+        self.energy += energy
+
+    def row(self):
+        """
+        Get the aggregate as a rollup CSV record
+        :return: Tuple in ROLLUP_HEADER column order
+        """
+        return (self.stage, self.resolution, f"{self.start:.3f}", self.samples,
+                self.voltage.min, f"{self.voltage.mean:.6g}", self.voltage.max,
+                self.current.min, f"{self.current.mean:.6g}", self.current.max,
+                f"{self.charge:.6g}", f"{self.energy:.6g}")
+
+
+class TransientDetector:
+    """
+    Current transient detection against an exponentially weighted baseline. A sample deviating from the
+    baseline by more than threshold standard deviations (and at least min_delta) starts an event; the event
+    ends once the current has stayed within bounds for hold seconds. The baseline is frozen during events,
+    so a slow recovery is not absorbed into it.
+        update(): Feed one sample, returns 'start' or 'end' on event edges
+        active: True while an event is in progress
+        events: Recent events as dicts with start, end, peak current and peak deviation
+    """
+
+    def __init__(self, threshold: float = 4.0, min_delta: float = 0.005, alpha: float = 0.05,
+                 hold: float = 1.0, warmup: int = 20, history: int = 1000):
+        """
+        Initialization method
+        :param threshold: Deviation from the baseline that starts an event, unit: standard deviations
+        :param min_delta: Minimum deviation that starts an event, unit: Ampere
+        :param alpha: Weight of a new sample in the baseline mean and variance
+        :param hold: Time within bounds that ends an event, unit: second
+        :param warmup: Number of samples used to learn the baseline before detecting
+        :param history: Number of recent events kept
+        """
+        self.threshold = threshold
+        self.min_delta = min_delta
+        self.alpha = alpha
+        self.hold_ns = int(hold * 1e9)
+        self.warmup = warmup
+        self.events = deque(maxlen=history)
+        self.count = 0
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the baseline, e.g. at a stage change; an event in progress is closed
+        """
+        self._mean = None
+        self._var = 0.0
+        self._seen = 0
+        self._quiet_since = None
+        self.active = None
+
+    def update(self, t_ns: int, current: float):
+        """
+        Feed one sample
+        :param t_ns: Sample time, time.monotonic_ns()
+        :param current: Current, unit: Ampere
+        :return: 'start' when an event starts, 'end' when it ends, otherwise None
+        """
+        if self._mean is None:
+            self._mean = current
+            self._seen = 1
+            return None
+        deviation = current - self._mean
+        outlier = (self._seen >= self.warmup
+                   and abs(deviation) > max(self.threshold * math.sqrt(self._var), self.min_delta))
+
+        if self.active is not None:
+            event = self.active
+            if abs(deviation) > abs(event["deviation"]):
+                event["peak"], event["deviation"] = current, deviation
+            if outlier:
+                self._quiet_since = None
+                return None
+            if self._quiet_since is None:
+                self._quiet_since = t_ns
+            if t_ns - self._quiet_since < self.hold_ns:
+                return None
+            event["end"] = t_ns
+            self.active = None
+            self._quiet_since = None
+            return "end"
+
+        if outlier:
+            self.active = {"start": t_ns, "end": None, "peak": current, "deviation": deviation}
+            self.events.append(self.active)
+            self.count += 1
+            return "start"
+
+        # Update the baseline with in-bounds samples only
+        self._seen += 1
+        self._mean += self.alpha * deviation
+        self._var = (1 - self.alpha) * (self._var + self.alpha * deviation * deviation)
+        return None
+
+
+class StreamAggregator:
+    """
+    Streaming aggregation of the sample stream, constant memory per resolution:
+        add(): Feed one sample; updates the stage aggregate, the rollup windows and the transient detector
+        begin_stage(): Close the current stage and its windows and start a new one
+        stage_totals: Aggregates of finished and running stages
+        rollups: Recent finished windows per resolution
+    Charge and energy are integrated with the trapezoidal rule between consecutive samples of a stage.
+    """
+
+    def __init__(self, resolutions=(1.0, 10.0, 60.0), history: int = 120, on_rollup=None,
+                 detector: TransientDetector = None, start_ns: int = None):
+        """
+        Initialization method
+        :param resolutions: Rollup window lengths, unit: second
+        :param history: Number of finished windows kept per resolution
+        :param on_rollup: Callable receiving each finished window (SampleAggregate)
+        :param detector: Transient detector fed with the current, None to disable detection
+        :param start_ns: Reference time of the run, time.monotonic_ns(); defaults to the first sample
+        """
+        self.resolutions = tuple(resolutions)
+        self.on_rollup = on_rollup
+        self.detector = detector
+        self.start_ns = start_ns
+        self.rollups = {resolution: deque(maxlen=history) for resolution in self.resolutions}
+        self.stage_totals = {}
+        self.stage = None
+        self._windows = {}
+        self._previous = None
+
+    def begin_stage(self, stage: int):
+        """
+        Close the running stage and its rollup windows, and start a new stage
+        :param stage: Stage number
+        :return: Aggregate of the new stage
+        """
+        self.flush()
+        self._previous = None
+        if self.detector is not None:
+            self.detector.reset()
+        self.stage = stage
+        self.stage_totals[stage] = SampleAggregate(stage)
+        return self.stage_totals[stage]
+
+    def add(self, t_ns: int, voltage: float, current: float, power: float):
+        """
+        Feed one sample
+        :param t_ns: Sample time, time.monotonic_ns()
+        :param voltage: Voltage, unit: Volt
+        :param current: Current, unit: Ampere
+        :param power: Power, unit: Watt
+        :return: Transient detector edge, 'start', 'end' or None
+        """
+        if self.start_ns is None:
+            self.start_ns = t_ns
+        if self.stage not in self.stage_totals:
+            self.begin_stage(self.stage)
+
+        # Trapezoidal increments since the previous sample
+        charge = energy = 0.0
+        previous = self._previous
+        if previous is not None:
+            dt = (t_ns - previous[0]) / 1e9
+            charge = (current + previous[1]) * dt / 2
+            energy = (power + previous[2]) * dt / 2
+        self._previous = (t_ns, current, power)
+
+        self.stage_totals[self.stage].add(voltage, current, charge, energy)
+        elapsed = (t_ns - self.start_ns) / 1e9
+        for resolution in self.resolutions:
+            window = self._windows.get(resolution)
+            if window is not None and elapsed >= window.start + resolution:
+                self._emit(window)
+                window = None
+            if window is None:
+                window = SampleAggregate(self.stage, resolution, elapsed - elapsed % resolution)
+                self._windows[resolution] = window
+            window.add(voltage, current, charge, energy)
+
+        return self.detector.update(t_ns, current) if self.detector is not None else None
+
+    def flush(self):
+        """
+        Emit the partial rollup windows
+        """
+        for window in self._windows.values():
+            self._emit(window)
+        self._windows.clear()
+
+    def _emit(self, window: SampleAggregate):
+        self.rollups[window.resolution].append(window)
+        if self.on_rollup is not None:
+            self.on_rollup(window)
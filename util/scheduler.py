@@ -0,0 +1,85 @@
+import time
+from collections import deque
+
+
+class SampleScheduler:
+    """
+    Fixed-rate sampling scheduler driven by time.monotonic_ns.
+    Deadlines are start + k * period, so the rate does not drift with loop overhead; a deadline that has
+    already passed by a whole period is counted as missed and skipped instead of being caught up in a burst.
+        wait(): Sleep until the next deadline and return its timestamp, or None once the loop's end is reached
+        stats(): Achieved rate, jitter percentiles and missed deadlines
+        reset(): Restart the schedule and clear statistics
+    """
+
+    def __init__(self, rate: float = None, jitter_window: int = 1000):
+        """
+        Initialization method
+        :param rate: Target sampling rate, unit: Hz; None to run as fast as the bus allows
+        :param jitter_window: Number of recent wake-ups kept for jitter percentiles
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError("Sampling rate must be positive.")
+        self.rate = rate
+        self.period_ns = int(1e9 / rate) if rate else 0
+        self._jitter = deque(maxlen=jitter_window)
+        self.reset()
+
+    def reset(self):
+        """
+        Restart the schedule from now and clear statistics
+        """
+        self.start_ns = time.monotonic_ns()
+        self.next_deadline_ns = self.start_ns
+        self.ticks = 0
+        self.missed = 0
+        self.overruns = 0
+        self._jitter.clear()
+
+    def wait(self, end_ns: int = None):
+        """
+        Sleep until the next deadline. Only wake-ups that return a timestamp count as samples.
+        :param end_ns: Monotonic time at which the loop ends, unit: nanosecond; None for no end
+        :return: Monotonic time of the wake-up, unit: nanosecond; None if it falls at or past end_ns
+        """
+        now = time.monotonic_ns()
+        if self.period_ns:
+            deadline = self.next_deadline_ns
+            if now < deadline:
+                if end_ns is not None and deadline >= end_ns:
+                    # No deadline left before the end, sleep only until the end
+                    time.sleep(max(0, end_ns - now) / 1e9)
+                    return None
+                time.sleep((deadline - now) / 1e9)
+                now = time.monotonic_ns()
+            elif now - deadline >= self.period_ns:
+                # Previous iteration overran: skip the deadlines that can no longer be met
+                skipped = (now - deadline) // self.period_ns
+                self.overruns += 1
+                self.missed += skipped
+                deadline += skipped * self.period_ns
+        if end_ns is not None and now >= end_ns:
+            return None
+        if self.period_ns:
+            self._jitter.append(now - deadline)
+            self.next_deadline_ns = deadline + self.period_ns
+        self.ticks += 1
+        return now
+
+    def stats(self):
+        """
+        Get scheduler statistics
+        :return: Dict with target and achieved rate (Hz), jitter percentiles (ms), missed deadlines and overruns
+        """
+        elapsed = (time.monotonic_ns() - self.start_ns) / 1e9
+        jitter = sorted(self._jitter)
+
+        def percentile(p):
+            if not jitter:
+                return None
+            return jitter[min(len(jitter) - 1, int(p / 100 * len(jitter)))] / 1e6
+
+        return {"target_rate": self.rate, "achieved_rate": self.ticks / elapsed if elapsed > 0 else 0.0,
+                "samples": self.ticks, "missed": self.missed, "overruns": self.overruns,
+                "jitter_p50_ms": percentile(50), "jitter_p95_ms": percentile(95), "jitter_p99_ms": percentile(99),
+                "jitter_max_ms": jitter[-1] / 1e6 if jitter else None}
@@ -0,0 +1,194 @@
+import csv
+import numpy as np
+
+
+class SetpointSchedule:
+    """
+    Precomputed, quantized setpoint schedule.
+    The target voltage register only holds integers (V * V_dot rounded half up, as in PowerSupply.V), so a
+    profile is reduced up front to the instants where the register value changes. Between those instants
+    nothing needs to be written.
+        linear(): Linear ramp between two voltages
+        piecewise(): Linear interpolation through (time, voltage) points
+        step(): Voltage held at each point until the next one
+        from_csv(): Piecewise or step profile loaded from a CSV file
+        planner(): Create a cursor that issues writes only on register changes
+    """
+
+    def __init__(self, times, codes, V_dot: int):
+        """
+        Initialization method
+        :param times: Change instants relative to the start of the profile, unit: second, ascending
+        :param codes: Register value that takes effect at each instant
+        :param V_dot: Voltage decimal scaling of the device
+        """
+        self.times = np.asarray(times, dtype=np.float64)
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.V_dot = V_dot
+        self.duration = float(self.times[-1]) if len(self.times) else 0.0
+
+    def __len__(self):
+        return len(self.codes)
+
+    def voltages(self):
+        """
+        Get the setpoint of each change instant
+        :return: Array of voltages, unit: Volt
+        """
+        return self.codes / self.V_dot
+
+    @staticmethod
+    def quantize(voltage, V_dot: int):
+        """
+        Quantize voltages the same way PowerSupply.V does
+        :param voltage: Voltage or array of voltages, unit: Volt
+        :param V_dot: Voltage decimal scaling
+        :return: Register value(s)
+        """
+        return np.floor(np.asarray(voltage, dtype=np.float64) * V_dot + 0.5).astype(np.int64)
+
+    @classmethod
+    def linear(cls, start_v: float, end_v: float, duration: float, V_dot: int):
+        """
+        Linear ramp
+        :param start_v: Start voltage, unit: Volt
+        :param end_v: End voltage, unit: Volt
+        :param duration: Ramp duration, unit: second
+        :param V_dot: Voltage decimal scaling
+        :return: SetpointSchedule
+        """
+        return cls.piecewise([(0.0, start_v), (duration, end_v)], V_dot)
+
+    @classmethod
+    def piecewise(cls, points, V_dot: int):
+        """
+        Piecewise linear profile
+        :param points: Sequence of (time, voltage), time in seconds from the start, ascending
+        :param V_dot: Voltage decimal scaling
+        :return: SetpointSchedule
+        """
+        t, v = cls._points(points)
+        times = [t[:1]]
+        codes = [cls.quantize(v[:1], V_dot)]
+        for t0, t1, v0, v1 in zip(t[:-1], t[1:], v[:-1], v[1:]):
+            c0, c1 = cls.quantize([v0, v1], V_dot)
+            if c0 == c1 or t1 <= t0:
+                if c0 != c1:
+                    times.append(np.array([t1]))
+                    codes.append(np.array([c1]))
+                continue
+            # Voltage at which each intermediate code takes effect (round half up), then invert the segment
+            if c1 > c0:
+                seg_codes = np.arange(c0 + 1, c1 + 1)
+                thresholds = (seg_codes - 0.5) / V_dot
+            else:
+                seg_codes = np.arange(c0 - 1, c1 - 1, -1)
+                thresholds = (seg_codes + 0.5) / V_dot
+            times.append(t0 + (thresholds - v0) / (v1 - v0) * (t1 - t0))
+            codes.append(seg_codes)
+        times.append(t[-1:])
+        codes.append(codes[-1][-1:])
+        return cls(np.concatenate(times), np.concatenate(codes), V_dot)
+
+    @classmethod
+    def step(cls, points, V_dot: int):
+        """
+        Step profile, each voltage is held until the next point
+        :param points: Sequence of (time, voltage), time in seconds from the start, ascending
+        :param V_dot: Voltage decimal scaling
+        :return: SetpointSchedule
+        """
+        t, v = cls._points(points)
+        return cls(t, cls.quantize(v, V_dot), V_dot)
+
+    @classmethod
+    def from_csv(cls, file_path: str, V_dot: int, interpolate: bool = True):
+        """
+        Load a profile from a CSV file with time (s) and voltage (V) in the first two columns;
+        a non-numeric first row is treated as a header
+        :param file_path: CSV file path
+        :param V_dot: Voltage decimal scaling
+        :param interpolate: True for a piecewise linear profile, False for a step profile
+        :return: SetpointSchedule
+        """
+        points = []
+        with open(file_path, newline='') as f:
+            for i, row in enumerate(csv.reader(f)):
+                try:
+                    points.append((float(row[0]), float(row[1])))
+                except (ValueError, IndexError):
+                    if i == 0:
+                        continue
+                    raise ValueError(f"Invalid profile row {i + 1} in {file_path}: {row}")
+        return cls.piecewise(points, V_dot) if interpolate else cls.step(points, V_dot)
+
+    @staticmethod
+    def _points(points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not len(points):
+            raise ValueError("Profile must contain at least one point.")
+        if np.any(np.diff(points[:, 0]) < 0):
+            raise ValueError("Profile times must be ascending.")
+        return points[:, 0], points[:, 1]
+
+    def planner(self):
+        """
+        Create a planner that walks this schedule
+        :return: SetpointPlanner
+        """
+        return SetpointPlanner(self)
+
+
+class SetpointPlanner:
+    """
+    Cursor over a SetpointSchedule, called once per sampling iteration.
+    due() returns a new setpoint only when the register value differs from the one last written;
+    finish() returns the final setpoint if it was not written yet.
+    """
+
+    def __init__(self, schedule: SetpointSchedule):
+        """
+        Initialization method
+        :param schedule: Precomputed setpoint schedule
+        """
+        self.schedule = schedule
+        self._times = schedule.times.tolist()
+        self._codes = schedule.codes.tolist()
+        self._index = 0
+        self.last_code = None
+        self.writes = 0
+        self.skipped = 0
+
+    def due(self, elapsed: float):
+        """
+        Get the setpoint to write at the given time
+        :param elapsed: Time since the start of the profile, unit: second
+        :return: Voltage to write, unit: Volt; None if the register already holds the right value
+        """
+        # Advance over every change point that has passed; intermediate values are never written
+        index = self._index
+        while index < len(self._times) and self._times[index] <= elapsed:
+            index += 1
+        self._index = index
+        if index == 0:
+            return None
+        code = self._codes[index - 1]
+        if code == self.last_code:
+            self.skipped += 1
+            return None
+        self.last_code = code
+        self.writes += 1
+        return code / self.schedule.V_dot
+
+    def finish(self):
+        """
+        Get the setpoint to write at the end of the profile. The last change point usually falls at the very
+        end, after the last sampling iteration, so due() never returns it.
+        :return: Final voltage to write, unit: Volt; None if the register already holds it
+        """
+        self._index = len(self._times)
+        if not self._codes or self._codes[-1] == self.last_code:
+            return None
+        self.last_code = self._codes[-1]
+        self.writes += 1
+        return self.last_code / self.schedule.V_dot
@@ -0,0 +1,128 @@
+import time
+from collections import namedtuple
+
+# Outcome of waiting for the output to reach a setpoint. settle_time is measured from the setpoint write to
+# the first reading of the final in-band run (None if it never settled), overshoot is the largest excursion
+# past the target in the direction of travel, unit: Volt
+SettleResult = namedtuple('SettleResult', ['target', 'settled', 'settle_time', 'overshoot', 'reads',
+                                           'final_voltage', 'elapsed', 'slew_rate'])
+
+
+class SettleTracker:
+    """
+    Non-blocking settle detection for one setpoint change. The caller owns the readings:
+        update(): Feed one voltage reading, returns True once settled or timed out
+        next_delay(): Time until the next reading is worth taking
+        predicted_time: Estimated time until the output enters the error band
+        result: SettleResult once done
+    Polling starts at min_interval right after the write. Once the slew rate towards the target is known, each
+    delay is half the predicted time to target, so reads bunch up as the output approaches the band; while no
+    progress is seen the delay backs off geometrically up to max_interval.
+    """
+
+    def __init__(self, target: float, error_range: float = 0.05, timeout: float = 600, hold: float = 0.0,
+                 min_interval: float = 0.01, max_interval: float = 1.0, backoff: float = 2.0, start_ns: int = None):
+        """
+        Initialization method
+        :param target: Target voltage, unit: Volt
+        :param error_range: Allowable error range, unit: Volt
+        :param timeout: Maximum wait, unit: second
+        :param hold: Time the output has to stay within the error band, unit: second; 0 to settle on the first
+            reading within the band
+        :param min_interval: Shortest polling interval, unit: second
+        :param max_interval: Longest polling interval, unit: second
+        :param backoff: Growth factor of the polling interval while no progress is seen
+        :param start_ns: time.monotonic_ns() of the setpoint write, defaults to now
+        """
+        self.target = target
+        self.error_range = error_range
+        self.timeout_ns = int(timeout * 1e9)
+        self.hold_ns = int(hold * 1e9)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.start_ns = time.monotonic_ns() if start_ns is None else start_ns
+        self.reads = 0
+        self.overshoot = 0.0
+        self.slew_rate = None
+        self.done = False
+        self.result = None
+        self._direction = None
+        self._last = None
+        self._band_since_ns = None
+        self._delay = None
+
+    def update(self, voltage: float, t_ns: int = None):
+        """
+        Feed one voltage reading
+        :param voltage: Displayed voltage, unit: Volt
+        :param t_ns: time.monotonic_ns() of the reading, defaults to now
+        :return: True once settled or timed out
+        """
+        if self.done:
+            return True
+        t_ns = time.monotonic_ns() if t_ns is None else t_ns
+        self.reads += 1
+        error = voltage - self.target
+        if self._direction is None:
+            # Direction of travel from the first reading after the write
+            self._direction = 1.0 if error < 0 else -1.0
+        else:
+            self.overshoot = max(self.overshoot, error * self._direction)
+            # Slew rate towards the target, smoothed over readings
+            dt = (t_ns - self._last[0]) / 1e9
+            if dt > 0:
+                rate = (voltage - self._last[1]) * self._direction / dt
+                self.slew_rate = rate if self.slew_rate is None else 0.5 * (self.slew_rate + rate)
+        self._last = (t_ns, voltage)
+
+        if abs(error) <= self.error_range:
+            if self._band_since_ns is None:
+                self._band_since_ns = t_ns
+            if t_ns - self._band_since_ns >= self.hold_ns:
+                self._finish(True, t_ns, voltage)
+        else:
+            self._band_since_ns = None
+        if not self.done and t_ns - self.start_ns >= self.timeout_ns:
+            self._finish(False, t_ns, voltage)
+        return self.done
+
+    @property
+    def predicted_time(self):
+        """
+        Estimated time until the output enters the error band, unit: second; 0 within the band, None while the
+        output shows no progress towards the target
+        """
+        if self._last is None:
+            return None
+        distance = abs(self._last[1] - self.target) - self.error_range
+        if distance <= 0:
+            return 0.0
+        if not self.slew_rate or self.slew_rate <= 0:
+            return None
+        return distance / self.slew_rate
+
+    def next_delay(self):
+        """
+        Get the time until the next reading, unit: second
+        """
+        if self._last is None or self.slew_rate is None:
+            # Poll fast right after the write until the slew rate is known
+            delay = self.min_interval
+        elif self._band_since_ns is not None:
+            delay = max(self.min_interval, self.hold_ns / 4e9)
+        else:
+            eta = self.predicted_time
+            delay = eta / 2 if eta is not None else (self._delay or self.min_interval) * self.backoff
+        delay = min(max(delay, self.min_interval), self.max_interval)
+        # Never sleep past the deadline
+        if self._last is not None:
+            delay = min(delay, max(0.0, (self.start_ns + self.timeout_ns - self._last[0]) / 1e9))
+        self._delay = delay
+        return delay
+
+    def _finish(self, settled: bool, t_ns: int, voltage: float):
+        self.done = True
+        self.result = SettleResult(
+            self.target, settled, (self._band_since_ns - self.start_ns) / 1e9 if settled else None,
+            self.overshoot, self.reads, voltage, (t_ns - self.start_ns) / 1e9, self.slew_rate)
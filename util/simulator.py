@@ -0,0 +1,452 @@
+import os
+import time
+import struct
+import random
+import logging
+import threading
+from modbus_tk.utils import calculate_crc
+
+# Set up logging configuration, set log level to INFO, print errors to console
+logging.basicConfig(level=logging.INFO)
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+
+
+def frame_time(num_bytes: int, baud_rate: int):
+    """
+    Time needed to transmit bytes on the line, 8N1 framing (10 bits per character)
+    :param num_bytes: Number of bytes
+    :param baud_rate: Baud rate
+    :return: Transmission time, unit: second
+    """
+    return num_bytes * 10 / baud_rate
+
+
+def request_length(frame: bytes):
+    """
+    Expected length of a request frame from its header
+    :param frame: Frame bytes received so far
+    :return: Total frame length, None if more bytes are needed to tell
+    """
+    if len(frame) < 2:
+        return None
+    if frame[1] in (0x03, 0x06):
+        return 8
+    if frame[1] == 0x10:
+        return 9 + frame[6] if len(frame) >= 7 else None
+    # Unsupported function: address, function and CRC
+    return 4
+
+
+class SimulatedPowerSupply:
+    """
+    Simulated Modbus RTU power supply with the register map used by PowerSupply:
+        0x0001 operating mode, 0x0002 protection state, 0x0003-0x0005 name, class and decimal point format,
+        0x0010-0x0013 displayed voltage, current and 32-bit power, 0x0020-0x0023 OVP, OCP and 32-bit OPP,
+        0x0030-0x0031 target voltage and limited current, 0x9999 slave address.
+    The output follows the target voltage with a limited slew rate into a resistive load (or a custom load
+    model) and switches to constant current at the current limit. Protection trips disable the output.
+    """
+
+    def __init__(self, addr: int = 1, name: int = 3010, class_name: int = 0x4B50, decimals: tuple = (2, 3, 3),
+                 slew_rate: float = 10.0, load_ohms: float = 10.0, load_model=None, v_max: float = 30.0,
+                 i_max: float = 10.0, noise: float = 0.0, output_on: bool = True, seed: int = None):
+        """
+        Initialization method
+        :param addr: Slave address
+        :param name: Value of the name register
+        :param class_name: Value of the class register
+        :param decimals: Decimal places of voltage, current and power
+        :param slew_rate: Maximum output voltage change rate, unit: V/s
+        :param load_ohms: Resistance of the load, unit: Ohm
+        :param load_model: Callable (voltage, elapsed seconds) -> current in Ampere, replaces the resistive load
+        :param v_max: Maximum output voltage, unit: Volt
+        :param i_max: Maximum output current, unit: Ampere
+        :param noise: Standard deviation of measurement noise, relative to the reading
+        :param output_on: Initial operating mode
+        :param seed: Random seed for noise
+        """
+        self.addr = addr
+        self.name = name
+        self.class_name = class_name
+        self.V_dot, self.A_dot, self.W_dot = (10 ** d for d in decimals)
+        self.dot_msg = decimals[0] << 8 | decimals[1] << 4 | decimals[2]
+        self.slew_rate = slew_rate
+        self.load_ohms = load_ohms
+        self.load_model = load_model
+        self.v_max = v_max
+        self.i_max = i_max
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.output_on = int(output_on)
+        self.protection_state = 0
+        self.set_v = 0.0
+        self.set_i = i_max
+        self.ovp = v_max * 1.1
+        self.ocp = i_max * 1.1
+        self.opp = v_max * i_max * 1.1
+        self.v_out = 0.0
+        self.i_out = 0.0
+        self.start_time = self.last_update = time.monotonic()
+
+    def update(self, now: float = None):
+        """
+        Advance the output model to the given time
+        :param now: time.monotonic() value, defaults to now
+        """
+        now = time.monotonic() if now is None else now
+        dt = max(0.0, now - self.last_update)
+        self.last_update = now
+
+        target = min(self.set_v, self.v_max) if self.output_on else 0.0
+        if self.load_model is None and self.load_ohms > 0:
+            # Constant current when the load would draw more than the limit
+            target = min(target, self.set_i * self.load_ohms)
+        step = self.slew_rate * dt
+        self.v_out += max(-step, min(step, target - self.v_out))
+
+        if self.load_model is not None:
+            current = self.load_model(self.v_out, now - self.start_time)
+        else:
+            current = self.v_out / self.load_ohms if self.load_ohms > 0 else self.set_i
+        self.i_out = max(0.0, min(current, self.set_i))
+
+        # Protection trips switch the output off
+        if self.output_on:
+            state = (self.v_out > self.ovp) | (self.i_out > self.ocp) << 1 | (self.v_out * self.i_out > self.opp) << 2
+            if state:
+                self.protection_state |= state
+                self.output_on = 0
+
+    def _measure(self, value: float, dot: int):
+        if self.noise:
+            value += self.random.gauss(0.0, self.noise * abs(value))
+        return max(0, int(value * dot + 0.5))
+
+    def read_register(self, reg_addr: int):
+        """
+        Read one register
+        :param reg_addr: Register Address
+        :return: Register value, None for an invalid address
+        """
+        if reg_addr == 0x9999:
+            return self.addr
+        if reg_addr > 0x00FF:
+            return None
+        power = self._measure(self.v_out * self.i_out, self.W_dot) if reg_addr in (0x0012, 0x0013) else 0
+        opp = int(self.opp * self.W_dot + 0.5)
+        return {
+            0x0001: self.output_on,
+            0x0002: self.protection_state,
+            0x0003: self.name,
+            0x0004: self.class_name,
+            0x0005: self.dot_msg,
+            0x0010: self._measure(self.v_out, self.V_dot) if reg_addr == 0x0010 else 0,
+            0x0011: self._measure(self.i_out, self.A_dot) if reg_addr == 0x0011 else 0,
+            0x0012: power >> 16 & 0xFFFF,
+            0x0013: power & 0xFFFF,
+            0x0020: int(self.ovp * self.V_dot + 0.5),
+            0x0021: int(self.ocp * self.A_dot + 0.5),
+            0x0022: opp >> 16 & 0xFFFF,
+            0x0023: opp & 0xFFFF,
+            0x0030: int(self.set_v * self.V_dot + 0.5),
+            0x0031: int(self.set_i * self.A_dot + 0.5),
+        }.get(reg_addr, 0)
+
+    def read_registers(self, reg_addr: int, count: int):
+        """
+        Read consecutive registers; a 32-bit power reading is taken once so both words match
+        :param reg_addr: First register address
+        :param count: Number of registers
+        :return: List of values, None for an invalid address
+        """
+        values = [self.read_register(reg) for reg in range(reg_addr, reg_addr + count)]
+        if reg_addr <= 0x0012 < 0x0013 < reg_addr + count:
+            power = self._measure(self.v_out * self.i_out, self.W_dot)
+            values[0x0012 - reg_addr] = power >> 16 & 0xFFFF
+            values[0x0013 - reg_addr] = power & 0xFFFF
+        return None if None in values else values
+
+    def write_registers(self, reg_addr: int, values: list):
+        """
+        Write consecutive registers
+        :param reg_addr: First register address
+        :param values: Register values
+        :return: True on success, False for a read-only or invalid address
+        """
+        registers = dict(enumerate(values, reg_addr))
+        if not set(registers) <= {0x0001, 0x0002, 0x0020, 0x0021, 0x0022, 0x0023, 0x0030, 0x0031, 0x9999}:
+            return False
+        if 0x0001 in registers:
+            self.output_on = int(bool(registers[0x0001]))
+        if 0x0002 in registers:
+            # Writing the protection register clears the latched state
+            self.protection_state = registers[0x0002]
+        if 0x0020 in registers:
+            self.ovp = registers[0x0020] / self.V_dot
+        if 0x0021 in registers:
+            self.ocp = registers[0x0021] / self.A_dot
+        if 0x0022 in registers or 0x0023 in registers:
+            opp = int(self.opp * self.W_dot + 0.5)
+            high = registers.get(0x0022, opp >> 16 & 0xFFFF)
+            low = registers.get(0x0023, opp & 0xFFFF)
+            self.opp = (high << 16 | low) / self.W_dot
+        if 0x0030 in registers:
+            self.set_v = min(registers[0x0030] / self.V_dot, self.v_max)
+        if 0x0031 in registers:
+            self.set_i = min(registers[0x0031] / self.A_dot, self.i_max)
+        if 0x9999 in registers:
+            self.addr = registers[0x9999]
+        return True
+
+    def handle_pdu(self, pdu: bytes):
+        """
+        Execute a request PDU
+        :param pdu: Function code and data
+        :return: Response PDU
+        """
+        function = pdu[0]
+        with self.lock:
+            self.update()
+            if function == 0x03 and len(pdu) == 5:
+                reg_addr, count = struct.unpack(">HH", pdu[1:5])
+                if not 1 <= count <= 125:
+                    return bytes([function | 0x80, ILLEGAL_DATA_VALUE])
+                values = self.read_registers(reg_addr, count)
+                if values is None:
+                    return bytes([function | 0x80, ILLEGAL_DATA_ADDRESS])
+                return struct.pack(">BB%dH" % count, function, 2 * count, *values)
+            if function == 0x06 and len(pdu) == 5:
+                reg_addr, value = struct.unpack(">HH", pdu[1:5])
+                if not self.write_registers(reg_addr, [value]):
+                    return bytes([function | 0x80, ILLEGAL_DATA_ADDRESS])
+                return pdu
+            if function == 0x10 and len(pdu) >= 6:
+                reg_addr, count, byte_count = struct.unpack(">HHB", pdu[1:6])
+                if byte_count != 2 * count or len(pdu) != 6 + byte_count:
+                    return bytes([function | 0x80, ILLEGAL_DATA_VALUE])
+                if not self.write_registers(reg_addr, list(struct.unpack(">%dH" % count, pdu[6:]))):
+                    return bytes([function | 0x80, ILLEGAL_DATA_ADDRESS])
+                return pdu[:5]
+        return bytes([function | 0x80, ILLEGAL_FUNCTION])
+
+
+class SimulatedBus:
+    """
+    RS-485 line with one or more simulated devices, turns request frames into response frames.
+    Models line timing at the configured baud rate, per-frame device latency, and injected faults.
+    """
+
+    def __init__(self, *devices: SimulatedPowerSupply, baud_rate: int = 9600, latency: float = 0.005,
+                 crc_error_rate: float = 0.0, timeout_rate: float = 0.0, seed: int = None):
+        """
+        Initialization method
+        :param devices: Simulated devices on the line, a single default device if none are given
+        :param baud_rate: Baud rate used for line timing, None for no line delay
+        :param latency: Device processing time per frame, unit: second
+        :param crc_error_rate: Probability of a response with a corrupted CRC
+        :param timeout_rate: Probability of a request that gets no response
+        :param seed: Random seed for fault injection
+        """
+        self.devices = list(devices) or [SimulatedPowerSupply()]
+        self.baud_rate = baud_rate
+        self.latency = latency
+        self.crc_error_rate = crc_error_rate
+        self.timeout_rate = timeout_rate
+        self.random = random.Random(seed)
+        self.frames = 0
+        self.crc_errors = 0
+        self.timeouts = 0
+
+    def process(self, request: bytes):
+        """
+        Handle one request frame
+        :param request: Request frame including address and CRC
+        :return: (response frame or None, time in seconds until the response is complete on the line)
+        """
+        self.frames += 1
+        delay = self.latency + (frame_time(len(request), self.baud_rate) if self.baud_rate else 0.0)
+        if len(request) < 4 or struct.unpack(">H", request[-2:])[0] != calculate_crc(request[:-2]):
+            # Corrupted request: devices stay silent
+            return None, delay
+        device = next((d for d in self.devices if d.addr == request[0]), None)
+        if device is None or self.random.random() < self.timeout_rate:
+            if device is not None:
+                self.timeouts += 1
+            return None, delay
+
+        data = request[:1] + device.handle_pdu(request[1:-2])
+        crc = calculate_crc(data)
+        if self.random.random() < self.crc_error_rate:
+            self.crc_errors += 1
+            crc ^= 0xFFFF
+        response = data + struct.pack(">H", crc)
+        if self.baud_rate:
+            delay += frame_time(len(response), self.baud_rate)
+        return response, delay
+
+
+class LoopbackSerial:
+    """
+    In-process stand-in for serial.Serial connected to a SimulatedBus.
+    Implements the subset of the pyserial interface used by modbus_tk.modbus_rtu.RtuMaster, so
+    PowerSupply(LoopbackSerial(bus), addr) talks to the simulator without a serial port.
+    """
+
+    def __init__(self, bus: SimulatedBus = None, timeout: float = 1.0):
+        """
+        Initialization method
+        :param bus: Simulated bus, a bus with one default device if None
+        :param timeout: Read timeout, unit: second
+        """
+        self.bus = SimulatedBus() if bus is None else bus
+        self.name = "loop://simulator"
+        self.port = self.name
+        self.baudrate = self.bus.baud_rate or 115200
+        self.timeout = timeout
+        self.inter_byte_timeout = None
+        self.is_open = True
+        self._buffer = b""
+        self._ready_at = 0.0
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def reset_input_buffer(self):
+        self._buffer = b""
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer) if time.monotonic() >= self._ready_at else 0
+
+    def write(self, data: bytes):
+        response, delay = self.bus.process(bytes(data))
+        self._ready_at = time.monotonic() + delay
+        self._buffer = response or b""
+        return len(data)
+
+    def read(self, size: int = 1):
+        if not self._buffer:
+            # Nothing will arrive: wait out the timeout like a real port
+            if self.timeout:
+                time.sleep(self.timeout)
+            return b""
+        wait = self._ready_at - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, self.timeout) if self.timeout is not None else wait)
+            if wait > (self.timeout or wait):
+                return b""
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class PtySimulator:
+    """
+    Serves a SimulatedBus on a pseudo-terminal pair (POSIX only). The slave side behaves like a serial port,
+    so PowerSupplyTool can connect to it by passing the port path as keyword.
+        start(): Open the pseudo-terminal and start serving, returns the port path
+        stop(): Stop serving and close the pseudo-terminal
+    """
+
+    def __init__(self, bus: SimulatedBus = None):
+        """
+        Initialization method
+        :param bus: Simulated bus, a bus with one default device if None
+        """
+        self.bus = SimulatedBus() if bus is None else bus
+        self.port = None
+        self._master_fd = None
+        self._slave_fd = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """
+        Open the pseudo-terminal and start serving requests in a background thread
+        :return: Path of the serial port to connect to
+        """
+        import pty
+        import tty
+        self._master_fd, self._slave_fd = pty.openpty()
+        tty.setraw(self._slave_fd)
+        self.port = os.ttyname(self._slave_fd)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="PtySimulator", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        """
+        Stop serving and close the pseudo-terminal
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        for fd in (self._master_fd, self._slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self._master_fd = self._slave_fd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        import select
+        frame = b""
+        while self._running:
+            readable, _, _ = select.select([self._master_fd], [], [], 0.1)
+            if not readable:
+                # Inter-frame silence: discard an incomplete frame
+                frame = b""
+                continue
+            frame += os.read(self._master_fd, 256)
+            length = request_length(frame)
+            while length is not None and len(frame) >= length:
+                request, frame = frame[:length], frame[length:]
+                response, delay = self.bus.process(request)
+                time.sleep(delay)
+                if response:
+                    os.write(self._master_fd, response)
+                length = request_length(frame)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulated Modbus RTU power supply on a pseudo-terminal")
+    parser.add_argument("--addr", type=int, default=1, help="slave address")
+    parser.add_argument("--baud", type=int, default=9600, help="baud rate used for line timing")
+    parser.add_argument("--latency", type=float, default=0.005, help="device latency per frame, seconds")
+    parser.add_argument("--slew-rate", type=float, default=10.0, help="output slew rate, V/s")
+    parser.add_argument("--load", type=float, default=10.0, help="load resistance, Ohm")
+    parser.add_argument("--crc-error-rate", type=float, default=0.0, help="probability of a corrupted response")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="probability of a missing response")
+    args = parser.parse_args()
+
+    device = SimulatedPowerSupply(args.addr, slew_rate=args.slew_rate, load_ohms=args.load)
+    simulator = PtySimulator(SimulatedBus(device, baud_rate=args.baud, latency=args.latency,
+                                          crc_error_rate=args.crc_error_rate, timeout_rate=args.timeout_rate))
+    print(f"Simulated power supply at {simulator.start()}, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
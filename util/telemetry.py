@@ -0,0 +1,208 @@
+import os
+import time
+import queue
+import datetime
+import threading
+import logging
+
+# Set up logging configuration, set log level to INFO, print errors to console
+logging.basicConfig(level=logging.INFO)
+
+# Column header of the CSV data file
+CSV_HEADER = "Time,Voltage (V),Current (A),Power (W),Stage"
+
+
+def format_time(monotonic_ns: int, start_wall_ns: int, start_ns: int):
+    """
+    Convert a monotonic timestamp to a wall-clock string with microsecond resolution
+    :param monotonic_ns: time.monotonic_ns() value
+    :param start_wall_ns: time.time_ns() taken together with start_ns
+    :param start_ns: time.monotonic_ns() reference
+    :return: Time string, format %Y%m%d%H%M%S.%f
+    """
+    wall = (start_wall_ns + monotonic_ns - start_ns) / 1e9
+    return datetime.datetime.fromtimestamp(wall).strftime('%Y%m%d%H%M%S.%f')
+
+
+class TelemetryWriter:
+    """
+    Buffered telemetry sink, moves file I/O off the sampling loop.
+    Records are put on a bounded queue and written by a background thread in batches:
+        write(): Queue one record, never blocks; counts a drop if the queue is full
+        checkpoint(): Ask the writer thread to flush and fsync at the next opportunity
+        close(): Drain the queue, flush, fsync and close the file
+        stats(): Queue depth, peak depth, written and dropped record counts
+    """
+    # Text mode; binary sinks override with 'b'
+    FILE_MODE = ''
+
+    def __init__(self, file_path: str, header: str = None, mode: str = 'w', max_queue: int = 10000,
+                 batch_size: int = 256, flush_interval: float = 1.0, checkpoint_interval: float = 60.0):
+        """
+        Initialization method
+        :param file_path: Local file path for storing data
+        :param header: Header line written when the file is opened, without line break
+        :param mode: File open mode, 'w' to truncate or 'a' to append
+        :param max_queue: Maximum number of queued records before samples are dropped
+        :param batch_size: Number of records that triggers a write
+        :param flush_interval: Maximum time in seconds a record waits in memory before being written
+        :param checkpoint_interval: Time in seconds between fsync checkpoints, None for close() only
+        """
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.dropped = 0
+        self.written = 0
+        self.max_depth = 0
+
+        self._queue = queue.Queue(max_queue)
+        self._checkpoint = threading.Event()
+        self._stop = object()
+        self._file = open(file_path, mode + self.FILE_MODE)
+        if header is not None:
+            self._file.write(self.encode_header(header))
+        self._thread = threading.Thread(target=self._run, name="TelemetryWriter", daemon=True)
+        self._thread.start()
+
+    def encode_header(self, header: str):
+        """
+        Encode the header line
+        :param header: Header line
+        :return: Data written to the file
+        """
+        return header + "\n"
+
+    def encode(self, records: list):
+        """
+        Encode a batch of records, one CSV line per record
+        :param records: List of record tuples
+        :return: Data written to the file
+        """
+        return "".join([",".join(map(str, record)) + "\n" for record in records])
+
+    @property
+    def queue_depth(self):
+        """
+        Number of records waiting to be written
+        """
+        return self._queue.qsize()
+
+    def write(self, record: tuple):
+        """
+        Queue a record for writing without blocking the caller
+        :param record: Record tuple
+        :return: False if the queue is full and the record was dropped
+        """
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if not self.dropped:
+                logging.warning(f"Telemetry queue for {self.file_path} is full, dropping samples")
+            self.dropped += 1
+            return False
+        return True
+
+    def checkpoint(self):
+        """
+        Request a flush and fsync of everything queued so far
+        """
+        self._checkpoint.set()
+
+    def close(self, timeout: float = None):
+        """
+        Drain the queue, flush, fsync and close the file
+        :param timeout: Maximum time in seconds to wait for the writer thread
+        """
+        if not self._thread.is_alive():
+            return
+        self._queue.put(self._stop)
+        self._thread.join(timeout)
+
+    def stats(self):
+        """
+        Get writer statistics
+        :return: Dict with queue depth, peak depth, written and dropped record counts
+        """
+        return {"queue_depth": self.queue_depth, "max_depth": self.max_depth,
+                "written": self.written, "dropped": self.dropped}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _run(self):
+        batch = []
+        stopping = False
+        last_flush = last_checkpoint = time.monotonic()
+        try:
+            while not stopping:
+                # Wait for records until the current batch is due
+                try:
+                    record = self._queue.get(timeout=max(0.0, self.flush_interval - (time.monotonic() - last_flush)))
+                    self.max_depth = max(self.max_depth, self._queue.qsize() + 1)
+                    if record is self._stop:
+                        stopping = True
+                    else:
+                        batch.append(record)
+                        # Take whatever else is already waiting without blocking
+                        while len(batch) < self.batch_size:
+                            record = self._queue.get_nowait()
+                            if record is self._stop:
+                                stopping = True
+                                break
+                            batch.append(record)
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                checkpoint_due = stopping or self._checkpoint.is_set() or (
+                        self.checkpoint_interval is not None and now - last_checkpoint >= self.checkpoint_interval)
+                if batch and (checkpoint_due or len(batch) >= self.batch_size or now - last_flush >= self.flush_interval):
+                    self._file.write(self.encode(batch))
+                    self._file.flush()
+                    self.written += len(batch)
+                    batch = []
+                    last_flush = now
+                elif not batch:
+                    last_flush = now
+
+                # Only force data to disk at checkpoints
+                if checkpoint_due:
+                    self._checkpoint.clear()
+                    os.fsync(self._file.fileno())
+                    last_checkpoint = now
+        except Exception:
+            logging.error(f"Telemetry writer for {self.file_path} failed", exc_info=True)
+        finally:
+            self._file.close()
+
+
+class CsvSampleWriter(TelemetryWriter):
+    """
+    Telemetry writer for sample records (monotonic ns, voltage, current, power, status, stage), written as
+    CSV rows with CSV_HEADER. The wall clock is read once when the writer is created and row times advance
+    with the monotonic clock, so they never jump; formatting happens on the writer thread.
+    """
+
+    def __init__(self, file_path: str, **kwargs):
+        """
+        Initialization method
+        :param file_path: Local file path for storing data
+        :param kwargs: Further TelemetryWriter arguments
+        """
+        self.start_wall_ns = time.time_ns()
+        self.start_ns = time.monotonic_ns()
+        kwargs.setdefault("header", CSV_HEADER)
+        super().__init__(file_path, **kwargs)
+
+    def encode(self, records: list):
+        """
+        Encode a batch of sample records as CSV lines
+        :param records: List of sample record tuples
+        :return: Data written to the file
+        """
+        return "".join([f"{format_time(t_ns, self.start_wall_ns, self.start_ns)},{voltage},{current},{power},{stage}\n"
+                        for t_ns, voltage, current, power, status, stage in records])